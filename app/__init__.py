@@ -1,15 +1,27 @@
 import os
+import json
 import logging
+import time
 from datetime import timedelta
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, redirect, url_for
+from flask import Flask, Response, g, request, jsonify, redirect, url_for
 from flask_jwt_extended import JWTManager, unset_jwt_cookies, verify_jwt_in_request, get_jwt_identity
 from app.chromadb_utility import ChromaDBUtility
+from app.timing import PhaseTimer
+from app.logging_config import configure_logging
+from app.metrics import REGISTRY, HTTP_REQUEST_SECONDS, Gauge
+from app.password_hasher import PasswordHasher
+from app.ledger import StockLedger
+from app.write_queue import WriteQueue, WriteBehindWorker
+from app.snapshot import SnapshotManager
+from app.hnsw import load_hnsw_config
 from app.routes import main
 from app.inventory import inventory
 from app.engineering import engineering
 from app.user import user_bp, login_manager
 
+request_logger = logging.getLogger("app.request")
+
 def create_app():
     # Load environment variables from .env file
     load_dotenv()
@@ -23,38 +35,127 @@ def create_app():
     app.config['JWT_COOKIE_CSRF_PROTECT'] = False
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=2)
     app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=7)
+    app.config["BULK_BATCH_SIZE"] = int(os.getenv("BULK_BATCH_SIZE", "256"))
+    app.config["DEDUP_THRESHOLD"] = float(os.getenv("DEDUP_THRESHOLD", "0.92"))
+    app.config["DEDUP_TOP_K"] = int(os.getenv("DEDUP_TOP_K", "5"))
+    # "session": users are loaded from the store; "jwt": taken from the verified token claims
+    app.config["AUTH_MODE"] = os.getenv("AUTH_MODE", "session").lower()
+    if app.config["AUTH_MODE"] not in ("session", "jwt"):
+        raise ValueError("AUTH_MODE must be 'session' or 'jwt'.")
 
-    # Configure logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.FileHandler("app.log"),
-            logging.StreamHandler()
-        ]
-    )
+    # Configure logging: queued, JSON lines, rotated
+    configure_logging()
     logging.info("Flask app initialized")
+    startup = PhaseTimer()
 
     # Initialize ChromaDBUtility
-    chroma_db_utility = ChromaDBUtility(persist_directory="./data")  # Relative to the project root
+    with startup.phase("chroma_client"):
+        chroma_db_utility = ChromaDBUtility(
+            persist_directory=os.getenv("CHROMA_PERSIST_DIRECTORY", "./data"),  # Relative to the project root
+            user_cache_size=int(os.getenv("USER_CACHE_SIZE", "1024")),
+            user_cache_ttl=float(os.getenv("USER_CACHE_TTL", "300")),
+            credential_cache_size=int(os.getenv("CREDENTIAL_CACHE_SIZE", "1024")),
+            credential_cache_ttl=float(os.getenv("CREDENTIAL_CACHE_TTL", "60")),
+            query_cache_size=int(os.getenv("QUERY_CACHE_SIZE", "2048")),
+            embedding_cache=os.getenv("EMBEDDING_CACHE", "true").lower() == "true",
+            embedding_cache_size=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000")),
+            chroma_host=os.getenv("CHROMA_HOST"),
+            chroma_port=int(os.getenv("CHROMA_PORT", "8000")),
+            password_hasher=PasswordHasher(
+                rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+                max_workers=int(os.getenv("BCRYPT_WORKERS", "2")),
+                max_pending=int(os.getenv("BCRYPT_MAX_PENDING", "32")),
+                queue_timeout=float(os.getenv("BCRYPT_QUEUE_TIMEOUT", "2"))
+            ),
+            shard_partes=os.getenv("SHARD_PARTES", "false").lower() == "true",
+            shard_workers=int(os.getenv("SHARD_WORKERS", "8")),
+            hnsw_config=load_hnsw_config(),
+            token_version_refresh=float(os.getenv("TOKEN_VERSION_REFRESH", "5"))
+        )
     app.chroma_db = chroma_db_utility
+    # Token versions for revoking JWTs; also keep the user cache in step across processes
+    app.token_versions = chroma_db_utility.token_versions
+
+    # Stock movement ledger, next to the Chroma data
+    with startup.phase("stock_ledger"):
+        app.stock_ledger = StockLedger(
+            os.path.join(chroma_db_utility.persist_directory, "stock_ledger.sqlite3"),
+            snapshot_interval=int(os.getenv("STOCK_SNAPSHOT_INTERVAL", "10000"))
+        )
+
+    # Optional write-behind queue for inventory and partes mutations
+    app.write_queue = None
+    if os.getenv("WRITE_BEHIND", "false").lower() == "true":
+        with startup.phase("write_queue"):
+            app.write_queue = WriteQueue(os.path.join(chroma_db_utility.persist_directory, "write_queue.sqlite3"))
+            WriteBehindWorker(
+                app.write_queue,
+                chroma_db_utility,
+                batch_size=app.config["BULK_BATCH_SIZE"],
+                interval=float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5"))
+            ).start()
 
     # Ensure `users` collection is created
-    if not initialize_users_collection(chroma_db_utility):
-        logging.error("Critical error: Could not initialize 'users' collection.")
-        exit(1)
+    with startup.phase("users_collection"):
+        if not initialize_users_collection(chroma_db_utility):
+            logging.error("Critical error: Could not initialize 'users' collection.")
+            exit(1)
 
     # Migrate existing users
-    chroma_db_utility.migrate_users()
+    with startup.phase("migrate_users"):
+        chroma_db_utility.migrate_users()
+
+    # Bring the numero_parte index in line with the collections
+    with startup.phase("part_indexes"):
+        chroma_db_utility.ensure_part_indexes()
+
+    # Fill the per-client part shards if they are on and out of date
+    if chroma_db_utility.part_shards:
+        with startup.phase("part_shards"):
+            chroma_db_utility.ensure_part_shards()
+
+    # Create the per-language search records of parts that do not have them yet
+    with startup.phase("language_records"):
+        chroma_db_utility.ensure_language_records()
+
+    # Bring the joined inventory/partes view in line with the collections
+    with startup.phase("inventory_view"):
+        chroma_db_utility.ensure_inventory_view(app.stock_ledger.on_hand_many)
 
     # Ensure default admin user exists
-    if not ensure_admin_user_exists(chroma_db_utility):
-        logging.error("Critical error: Could not ensure admin user exists.")
-        exit(1)
+    with startup.phase("admin_user"):
+        if not ensure_admin_user_exists(chroma_db_utility):
+            logging.error("Critical error: Could not ensure admin user exists.")
+            exit(1)
+
+    # Optional read-only snapshot for reporting endpoints (listings and exports)
+    app.snapshot_manager = None
+    if os.getenv("REPORTING_SNAPSHOT", "false").lower() == "true":
+        if os.getenv("CHROMA_HOST"):
+            logging.warning("REPORTING_SNAPSHOT needs the embedded Chroma store; ignored with CHROMA_HOST set.")
+        else:
+            with startup.phase("reporting_snapshot"):
+                app.snapshot_manager = SnapshotManager(
+                    chroma_db_utility,
+                    os.getenv("REPORTING_SNAPSHOT_DIRECTORY", "./snapshots"),
+                    interval=float(os.getenv("REPORTING_SNAPSHOT_INTERVAL", "300"))
+                )
+                app.snapshot_manager.start()
+
+    # Load the embedding model now instead of on the first request that needs it
+    if os.getenv("EMBEDDING_PRELOAD", "false").lower() == "true":
+        with startup.phase("embedding_model"):
+            chroma_db_utility.embedding_function.load()
 
     # Initialize Flask-JWT-Extended
     jwt = JWTManager(app)
 
+    @jwt.token_in_blocklist_loader
+    def check_token_version(jwt_header, jwt_payload):
+        """Reject tokens issued before the user's last revocation."""
+        identity = json.loads(jwt_payload["sub"]) if isinstance(jwt_payload["sub"], str) else jwt_payload["sub"]
+        return app.token_versions.is_revoked(identity["username"], jwt_payload.get("tv"))
+
     # Initialize Flask-Login
     login_manager.init_app(app)
     login_manager.login_view = "user.manage_user"
@@ -68,34 +169,97 @@ def create_app():
         return redirect(url_for("user.manage_user"))
 
     # Register blueprints
-    app.register_blueprint(main, url_prefix="/")
-    app.register_blueprint(user_bp, url_prefix="/user")
-    app.register_blueprint(engineering, url_prefix="/engineering")
-    app.register_blueprint(inventory, url_prefix="/inventory")
+    with startup.phase("blueprints"):
+        app.register_blueprint(main, url_prefix="/")
+        app.register_blueprint(user_bp, url_prefix="/user")
+        app.register_blueprint(engineering, url_prefix="/engineering")
+        app.register_blueprint(inventory, url_prefix="/inventory")
+
+    startup.log("Startup phases")
+    startup_budget_ms = float(os.getenv("STARTUP_BUDGET_MS", "0"))
+    if startup_budget_ms and startup.total() * 1000 > startup_budget_ms:
+        logging.warning("Startup took %.0fms, over the %.0fms budget.", startup.total() * 1000, startup_budget_ms)
+
+    # Request timing and /metrics; registered first so it also times the hooks below
+    register_metrics(app)
 
     @app.before_request
     def log_request_info():
-        logging.info(f"Request: {request.method} {request.url}")
+        # Lazy %-style arguments: nothing is formatted unless a handler emits the record
+        request_logger.info("Request: %s %s", request.method, request.url)
+        # Static files need no identity; in stateless mode the route decorators decode the token once
+        if request.endpoint == "static" or app.config["AUTH_MODE"] == "jwt":
+            return
         try:
             verify_jwt_in_request(optional=True)
             identity = get_jwt_identity()
             if identity:
-                logging.info(f"Authenticated JWT Identity: {identity}")
+                request_logger.debug("Authenticated JWT Identity: %s", identity)
             else:
-                logging.info("No JWT identity found. Proceeding as unauthenticated.")
+                request_logger.debug("No JWT identity found. Proceeding as unauthenticated.")
         except Exception as e:
-            logging.warning(f"JWT verification failed: {str(e)}")
+            request_logger.warning("JWT verification failed: %s", e)
 
     @app.after_request
     def add_jwt_headers(response):
         """Unset JWT cookies if the user logs out or JWT verification fails."""
         if response.status_code == 401:
-            logging.info("Clearing JWT cookies due to 401 response.")
+            request_logger.info("Clearing JWT cookies due to 401 response.")
             unset_jwt_cookies(response)
         return response
 
     return app
 
+def register_metrics(app):
+    """Time every request per endpoint and expose all metrics at /metrics in Prometheus text format."""
+    chroma_db = app.chroma_db
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        start = g.pop("request_start", None)
+        if start is not None:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+                method=request.method,
+                status=response.status_code
+            )
+        return response
+
+    def cache_counters(cache):
+        stats = cache.stats()
+        return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+    REGISTRY.register(Gauge(
+        "invectory_user_cache_lookups", "User cache lookups by result.",
+        lambda: cache_counters(chroma_db.user_cache), ("result",)
+    ))
+    REGISTRY.register(Gauge(
+        "invectory_query_embedding_cache_lookups", "Query embedding cache lookups by result.",
+        lambda: cache_counters(chroma_db.query_embedding_cache), ("result",)
+    ))
+    if chroma_db.embedding_cache:
+        REGISTRY.register(Gauge(
+            "invectory_embedding_cache_lookups", "Persistent embedding cache lookups by result.",
+            lambda: cache_counters(chroma_db.embedding_cache), ("result",)
+        ))
+    if app.write_queue:
+        REGISTRY.register(Gauge(
+            "invectory_write_queue_depth", "Queued writes not yet applied.", app.write_queue.depth
+        ))
+
+    metrics_token = os.getenv("METRICS_TOKEN")
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        if metrics_token and request.headers.get("Authorization") != f"Bearer {metrics_token}":
+            return jsonify({"error": "Unauthorized"}), 401
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 def initialize_users_collection(chroma_db_utility):
     """Ensure the `users` collection exists."""
     try:
@@ -103,7 +267,7 @@ def initialize_users_collection(chroma_db_utility):
         logging.info("'users' collection initialized successfully.")
         return True
     except Exception as e:
-        logging.error(f"Error ensuring 'users' collection exists: {str(e)}")
+        logging.error("Error ensuring 'users' collection exists: %s", e)
         return False
 
 def ensure_admin_user_exists(chroma_db_utility):
@@ -117,5 +281,5 @@ def ensure_admin_user_exists(chroma_db_utility):
             logging.info("Default admin user already exists.")
         return True
     except Exception as e:
-        logging.error(f"Error checking/creating default admin user: {str(e)}")
+        logging.error("Error checking/creating default admin user: %s", e)
         return False
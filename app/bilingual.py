@@ -0,0 +1,92 @@
+import logging
+from itertools import islice
+
+# Per-language embedding records for `partes` live in their own collection,
+# one record per (part, language), linked back to the part by `part_id`.
+TRANSLATIONS_COLLECTION = "partes_lang"
+DESCRIPTION_FIELDS = {"en": "descripcion_ingles", "es": "descripcion_espanol"}
+LINKED_FIELDS = ("numero_parte", "cliente", "unidad_medida", "unidad_peso")
+
+def language_record_ids(part_id):
+    """Return the ids of every language record of a part."""
+    return [f"{part_id}:{lang}" for lang in DESCRIPTION_FIELDS]
+
+def language_records(ids, metadatas):
+    """Build (ids, documents, metadatas) of the per-language records for a batch of parts."""
+    record_ids, documents, record_metadatas = [], [], []
+    for part_id, metadata in zip(ids, metadatas):
+        for lang, field in DESCRIPTION_FIELDS.items():
+            text = (metadata or {}).get(field)
+            if not text:
+                continue
+            record_ids.append(f"{part_id}:{lang}")
+            documents.append(f"{metadata.get('numero_parte')}: {text}")
+            record_metadata = {"part_id": part_id, "lang": lang}
+            record_metadata.update({key: metadata[key] for key in LINKED_FIELDS if metadata.get(key) is not None})
+            record_metadatas.append(record_metadata)
+    return record_ids, documents, record_metadatas
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked id lists into one list of (id, score), best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda entry: entry[1], reverse=True)
+
+def backfill_language_records(chroma_db, batch_size=256, missing_only=True):
+    """Create the per-language records of the parts stored in `partes`.
+
+    With `missing_only`, records that already exist are neither re-embedded
+    nor rewritten. Run it while holding the `partes` maintenance lease so
+    no part changes under it (see `ensure_language_records`).
+    """
+    translations = chroma_db.get_or_create_collection(TRANSLATIONS_COLLECTION)
+    records = chroma_db.iter_records("partes", page_size=batch_size)
+    written = parts = 0
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        parts += len(batch)
+        record_ids, documents, record_metadatas = language_records(
+            [part_id for part_id, _ in batch], [metadata for _, metadata in batch]
+        )
+        if missing_only and record_ids:
+            existing = set(translations.get(ids=record_ids, include=[])["ids"])
+            missing = [index for index, record_id in enumerate(record_ids) if record_id not in existing]
+            record_ids = [record_ids[index] for index in missing]
+            documents = [documents[index] for index in missing]
+            record_metadatas = [record_metadatas[index] for index in missing]
+        if not record_ids:
+            continue
+        translations.upsert(
+            ids=record_ids,
+            documents=documents,
+            metadatas=record_metadatas,
+            embeddings=chroma_db.embedding_function(documents)
+        )
+        written += len(record_ids)
+    logging.info("Backfilled %s language records for %s parts.", written, parts)
+    return written
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from app.chromadb_utility import ChromaDBUtility
+    from app.maintenance import require_server_or_offline
+    parser = argparse.ArgumentParser(description="Create the per-language records of the stored parts.")
+    parser.add_argument("--all", action="store_true", help="Re-embed every record, not only the missing ones")
+    parser.add_argument("--persist-directory", default=os.getenv("CHROMA_PERSIST_DIRECTORY", "./data"))
+    parser.add_argument("--offline", action="store_true", help="The app is stopped; open the persist directory directly")
+    args = parser.parse_args()
+    require_server_or_offline(args.offline)
+
+    logging.basicConfig(level=logging.INFO)
+    chroma_db = ChromaDBUtility(
+        persist_directory=args.persist_directory,
+        chroma_host=os.getenv("CHROMA_HOST"),
+        chroma_port=int(os.getenv("CHROMA_PORT", "8000"))
+    )
+    with chroma_db.maintenance.hold("partes", "language backfill"):
+        backfill_language_records(chroma_db, missing_only=not args.all)
@@ -0,0 +1,115 @@
+import io
+import json
+import logging
+import time
+import pandas as pd
+from pydantic import ValidationError
+from app.models import InventoryItem, ParteItem
+
+SUPPORTED_FORMATS = ("csv", "xlsx", "jsonl")
+
+# Collection name -> (row model, function building the embedding document)
+IMPORT_SCHEMAS = {
+    "inventory": (InventoryItem, lambda item: item.descripcion or item.numero_parte),
+    "partes": (ParteItem, lambda item: item.document()),
+}
+
+def detect_format(filename, explicit_format=None):
+    """Pick the file format from an explicit value or the file extension."""
+    file_format = (explicit_format or filename.rsplit(".", 1)[-1]).lower()
+    if file_format == "xls":
+        file_format = "xlsx"
+    if file_format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported format '{file_format}'. Use one of: {', '.join(SUPPORTED_FORMATS)}.")
+    return file_format
+
+def read_rows(stream, file_format):
+    """Parse an uploaded CSV, XLSX or JSONL file into a list of row dicts."""
+    if file_format == "jsonl":
+        rows = []
+        for line_number, line in enumerate(io.TextIOWrapper(stream, encoding="utf-8"), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON on line {line_number}: {str(e)}")
+        return rows
+
+    if file_format == "csv":
+        df = pd.read_csv(stream, dtype=str, keep_default_na=False, na_values=[""])
+    else:
+        df = pd.read_excel(stream, dtype=str, engine="openpyxl")
+    df = df.astype(object).where(pd.notna(df), None)
+    return df.to_dict(orient="records")
+
+def import_rows(chroma_db, collection_name, rows, batch_size=256, upsert=False):
+    """Validate rows, then embed and write the valid ones in batches.
+
+    Rows are numbered from 1, excluding any header. Existing part numbers are
+    rejected unless `upsert` is set, in which case their records are replaced.
+    """
+    model, build_document = IMPORT_SCHEMAS[collection_name]
+    start = time.perf_counter()
+
+    ids, documents, metadatas, errors = [], [], [], []
+    seen = set()
+    inserted = updated = 0
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            item = model(**{key: value for key, value in row.items() if value is not None})
+        except ValidationError as e:
+            errors.append({"row": row_number, "error": e.errors()})
+            continue
+        except TypeError:
+            errors.append({"row": row_number, "error": "Row must be an object."})
+            continue
+
+        if item.numero_parte in seen:
+            errors.append({"row": row_number, "error": f"Duplicate numero_parte '{item.numero_parte}' in file."})
+            continue
+        seen.add(item.numero_parte)
+
+        item_id = chroma_db.find_item_id(collection_name, item.numero_parte)
+        if item_id and not upsert:
+            errors.append({"row": row_number, "error": f"Numero Parte '{item.numero_parte}' already exists."})
+            continue
+        if item_id:
+            updated += 1
+        else:
+            item_id = chroma_db.new_item_id(collection_name, item.numero_parte)
+            inserted += 1
+
+        ids.append(item_id)
+        documents.append(build_document(item))
+        metadatas.append({key: value for key, value in item.dict().items() if value is not None})
+    validate_seconds = time.perf_counter() - start
+
+    embed_seconds = chroma_db.add_items(collection_name, ids, documents, metadatas, batch_size=batch_size) if ids else 0.0
+    elapsed = time.perf_counter() - start
+
+    logging.info(
+        "Bulk import into '%s': %s written, %s rejected in %.2fs.", collection_name, len(ids), len(errors), elapsed
+    )
+    return {
+        "rows": len(rows),
+        "inserted": inserted,
+        "updated": updated,
+        "errors": errors,
+        "batch_size": batch_size,
+        "validate_seconds": round(validate_seconds, 3),
+        "embed_seconds": round(embed_seconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(len(ids) / elapsed, 1) if elapsed > 0 else None
+    }
+
+def parse_import_args(args, default_batch_size):
+    """Read `format`, `batch_size` and `upsert` from request args."""
+    try:
+        batch_size = int(args.get("batch_size", default_batch_size))
+    except (TypeError, ValueError):
+        raise ValueError("Batch size must be an integer.")
+    if batch_size < 1:
+        raise ValueError("Batch size must be positive.")
+    return args.get("format"), batch_size, args.get("upsert", "false").lower() == "true"
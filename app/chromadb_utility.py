@@ -1,33 +1,193 @@
 import chromadb
 import os
+import hashlib
+import hmac
 import logging
-import bcrypt
 import uuid
 import json
-from chromadb.errors import InvalidCollectionException
-from chromadb.utils import embedding_functions
+import time
+import threading
+from app.models import ParteItem
+from app.embeddings import create_embedding_function
+from app.embedding_cache import EmbeddingCache
+from app.pagination import decode_cursor, encode_cursor
+from app.part_index import PartIndex, INDEXED_COLLECTIONS
+from app.cache import LRUCache
+from app.metrics import InstrumentedCollection, instrument_methods
+from app.password_hasher import PasswordHasher
+from app.collection_versions import CollectionVersions
+from app.maintenance import MaintenanceLeases, CollectionBusy
+from app.token_versions import TokenVersions
+from app.dedup import collection_space, similarity
+from app.sharding import PartShards, shard_name
+from app.hnsw import HNSW_DEFAULTS, collection_metadata
+from app.inventory_view import InventoryView, VIEW_COLLECTIONS
+from app.bilingual import (
+    TRANSLATIONS_COLLECTION,
+    DESCRIPTION_FIELDS,
+    backfill_language_records,
+    language_records,
+    language_record_ids,
+    reciprocal_rank_fusion
+)
 
+@instrument_methods
 class ChromaDBUtility:
-    def __init__(self, persist_directory="./data"):
-        """Initialize ChromaDB persistent client."""
+    def __init__(
+        self,
+        persist_directory="./data",
+        user_cache_size=1024,
+        user_cache_ttl=300,
+        credential_cache_size=1024,
+        credential_cache_ttl=60,
+        query_cache_size=2048,
+        embedding_provider=None,
+        embedding_options=None,
+        embedding_cache=True,
+        embedding_cache_size=100000,
+        chroma_host=None,
+        chroma_port=8000,
+        password_hasher=None,
+        shard_partes=False,
+        shard_workers=8,
+        hnsw_config=None,
+        token_version_refresh=5.0,
+        generation_refresh=1.0
+    ):
+        """Initialize the ChromaDB client.
+
+        With `chroma_host` set, collections are served by a Chroma server that
+        owns the data, so several worker processes can write safely. The local
+        SQLite side stores (indexes, caches, ledger) stay in `persist_directory`.
+        With `shard_partes`, parts are also kept in one collection per client.
+        `hnsw_config` maps collection names to the index parameters they are created with;
+        cached handles are reopened when another process replaces a collection
+        (checked every `generation_refresh` seconds).
+        Per-user token versions, bumped on password and role changes, are shared
+        by every process and also invalidate `user_cache` entries.
+        A successful login is remembered for `credential_cache_ttl` seconds, so
+        a repeated login with the same password and stored hash skips bcrypt.
+        """
         # Resolve the path relative to the current file's directory
         self.persist_directory = os.path.abspath(persist_directory)
-        self.client = chromadb.PersistentClient(path=self.persist_directory)
-        self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        os.makedirs(self.persist_directory, exist_ok=True)
+        if chroma_host:
+            self.client = chromadb.HttpClient(host=chroma_host, port=chroma_port)
+        else:
+            self.client = chromadb.PersistentClient(path=self.persist_directory)
+        # Vectors already computed for a text are reused from disk, least recently used dropped past the bound
+        self.embedding_cache = (
+            EmbeddingCache(os.path.join(self.persist_directory, "embedding_cache.sqlite3"), max_entries=embedding_cache_size)
+            if embedding_cache else None
+        )
+        # The model is loaded on first use, not here
+        self.embedding_function = create_embedding_function(
+            embedding_provider, cache=self.embedding_cache, **(embedding_options or {})
+        )
+        self.part_index = PartIndex(os.path.join(self.persist_directory, "part_index.sqlite3"))
+        self.inventory_view = InventoryView(os.path.join(self.persist_directory, "inventory_view.sqlite3"))
+        self.password_hasher = password_hasher or PasswordHasher()
+        self.hnsw_config = hnsw_config or {}
+        # Collection handles, bound to the embedding function once, with the generation they were opened at
+        self._collections = {}
+        self._collections_lock = threading.Lock()
+        self.generation_refresh = generation_refresh
+        self._generations = {}
+        self._generations_loaded_at = None
+        self.user_cache = LRUCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+        # username -> (stored hash, keyed SHA-256 of the password) of the last successful verification
+        self.credential_cache = LRUCache(maxsize=credential_cache_size, ttl=credential_cache_ttl)
+        self._credential_key = os.urandom(32)
+        self.token_versions = TokenVersions(
+            os.path.join(self.persist_directory, "token_versions.sqlite3"), refresh_interval=token_version_refresh
+        )
+        self.query_embedding_cache = LRUCache(maxsize=query_cache_size)
+        self.collection_versions = CollectionVersions(os.path.join(self.persist_directory, "collection_versions.sqlite3"))
+        # Writes are refused with CollectionBusy while a maintenance job rewrites their collection
+        self.maintenance = MaintenanceLeases(os.path.join(self.persist_directory, "maintenance.sqlite3"))
+        self.part_shards = PartShards(self, max_workers=shard_workers) if shard_partes else None
 
         # Log the directory being used
-        logging.info(f"ChromaDB initialized with persist_directory: {self.persist_directory}")
+        if chroma_host:
+            logging.info(
+                "ChromaDB initialized with persist_directory: %s, server: %s:%s",
+                self.persist_directory, chroma_host, chroma_port
+            )
+        else:
+            logging.info("ChromaDB initialized with persist_directory: %s", self.persist_directory)
 
     def get_or_create_collection(self, collection_name):
-        """Get an existing collection or create a new one."""
+        """Get an existing collection or create a new one, reusing the handle until the collection is replaced."""
+        generation = self._generation(collection_name)
+        entry = self._collections.get(collection_name)
+        if entry is not None and entry[1] == generation:
+            return entry[0]
+        with self._collections_lock:
+            entry = self._collections.get(collection_name)
+            if entry is None or entry[1] != generation:
+                collection = InstrumentedCollection(
+                    self._open_collection(collection_name),
+                    reopen=lambda: self._reopen_collection(collection_name)
+                )
+                entry = self._collections[collection_name] = (collection, generation)
+                logging.info("Opened collection: %s", collection_name)
+        return entry[0]
+
+    def _generation(self, collection_name):
+        """Return how often a collection was replaced, re-read at most every `generation_refresh` seconds."""
+        now = time.monotonic()
+        if self._generations_loaded_at is None or now - self._generations_loaded_at >= self.generation_refresh:
+            self._generations = self.collection_versions.generations()
+            self._generations_loaded_at = now
+        return self._generations.get(collection_name, 0)
+
+    def _reopen_collection(self, collection_name):
+        """Open the collection now stored under a name after the previous one was dropped; never creates it."""
+        self._generations_loaded_at = None
+        logging.info("Reopening replaced collection: %s", collection_name)
+        return self.client.get_collection(name=collection_name, embedding_function=self.embedding_function)
+
+    def _open_collection(self, collection_name):
+        """Open a collection, creating it with its configured HNSW parameters if it does not exist.
+
+        Index parameters are fixed at creation; an existing collection whose
+        parameters differ from the config is left alone (see `python -m app.hnsw`).
+        A collection missing while a maintenance job holds it is being swapped
+        for its rebuilt copy, so it is not created empty (CollectionBusy instead).
+        """
+        metadata = collection_metadata(self.hnsw_config, collection_name)
         try:
-            return self.client.get_collection(name=collection_name)
-        except InvalidCollectionException:
-            logging.info(f"Creating new collection: {collection_name}")
-            return self.client.create_collection(
+            collection = self.client.get_collection(name=collection_name, embedding_function=self.embedding_function)
+        except Exception:
+            self.maintenance.check_writable(collection_name)
+            return self.client.get_or_create_collection(
                 name=collection_name,
+                metadata=metadata,
                 embedding_function=self.embedding_function
             )
+        stored = collection.metadata or {}
+        if metadata and any(stored.get(key, HNSW_DEFAULTS.get(key)) != value for key, value in metadata.items()):
+            logging.warning(
+                "Collection '%s' was built with different HNSW parameters than configured; "
+                "rebuild it with `python -m app.hnsw %s` to apply them.",
+                collection_name, collection_name
+            )
+        return collection
+
+    def invalidate_collection(self, collection_name=None):
+        """Forget a cached collection handle, or all of them."""
+        with self._collections_lock:
+            if collection_name is None:
+                self._collections.clear()
+            else:
+                self._collections.pop(collection_name, None)
+
+    def delete_collection(self, collection_name):
+        """Delete a collection and drop its cached handle."""
+        try:
+            self.client.delete_collection(name=collection_name)
+        finally:
+            self.invalidate_collection(collection_name)
 
     @staticmethod
     def flatten_nested_list(nested_list):
@@ -38,20 +198,14 @@ class ChromaDBUtility:
         
     def add_user(self, username, password, role="user"):
         """Add a new user to the 'users' collection."""
+        self._check_writable("users")
         users_collection = self.get_or_create_collection("users")
-        hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-
-        # Check for duplicate username
-        results = users_collection.query(
-            where={"username": username},  # Query metadata for the username
-            n_results=1,
-            include=["documents"]
-        )
-        documents = self.flatten_nested_list(results.get("documents", []))
-
-        if any(doc == username for doc in documents):
+        # Check for duplicate username before paying for the hash
+        if self.get_user(username):
             raise ValueError(f"Username '{username}' already exists.")
 
+        hashed_password = self.password_hasher.hash(password)
+
         # Prepare metadata
         metadata = {
             "id": username,  # Use the username as the ID
@@ -67,33 +221,37 @@ class ChromaDBUtility:
                 documents=[username],  # Store username in documents for direct querying
                 metadatas=[metadata]
             )
-            logging.info(f"User '{username}' added successfully with ID: {username}.")
+            logging.info("User '%s' added successfully with ID: %s.", username, username)
         except Exception as e:
-            logging.error(f"Failed to add user '{username}': {str(e)}")
+            logging.error("Failed to add user '%s': %s", username, e)
             raise
+        finally:
+            self.user_cache.invalidate(username)
 
     def get_user(self, username):
-        """Retrieve user metadata by username."""
+        """Retrieve user metadata by username with an exact key lookup."""
         users_collection = self.get_or_create_collection("users")
         try:
-            # Query using `query_texts` to locate the user by username
-            results = users_collection.query(
-                query_texts=[username],
-                n_results=1,
-                include=["metadatas", "documents"]
-            )
+            # Users are stored under their username as ID
+            results = users_collection.get(ids=[username], include=["metadatas"])
+            metadatas = results.get("metadatas") or []
 
-            # Extract metadata
-            metadatas = self.flatten_nested_list(results.get("metadatas", []))
+            # Users created before that convention are found by exact metadata match
             if not metadatas:
-                logging.warning(f"No user found with username '{username}'.")
+                results = users_collection.get(
+                    where={"username": username},
+                    limit=1,
+                    include=["metadatas"]
+                )
+                metadatas = results.get("metadatas") or []
+
+            if not metadatas:
+                logging.warning("No user found with username '%s'.", username)
                 return None
 
-            user_metadata = metadatas[0]
-            logging.info(f"Query results for username '{username}': {user_metadata}")
-            return user_metadata
+            return metadatas[0]
         except Exception as e:
-            logging.error(f"Failed to retrieve user '{username}': {str(e)}")
+            logging.error("Failed to retrieve user '%s': %s", username, e)
             raise
 
     def get_user_by_id(self, user_id):
@@ -107,14 +265,12 @@ class ChromaDBUtility:
             )
             metadatas = self.flatten_nested_list(results.get("metadatas", []))
             if not metadatas:
-                logging.warning(f"No user found with ID '{user_id}'.")
+                logging.warning("No user found with ID '%s'.", user_id)
                 return None
 
-            user_metadata = metadatas[0]
-            logging.info(f"Query results for user_id '{user_id}': {user_metadata}")
-            return user_metadata
+            return metadatas[0]
         except Exception as e:
-            logging.error(f"Failed to retrieve user by ID '{user_id}': {str(e)}")
+            logging.error("Failed to retrieve user by ID '%s': %s", user_id, e)
             raise
 
     def authenticate_user(self, username, password):
@@ -131,9 +287,13 @@ class ChromaDBUtility:
             if "id" not in user_metadata:
                 raise KeyError("Missing 'id' in user metadata.")
 
-            # Validate the password
-            if not bcrypt.checkpw(password.encode("utf-8"), user_metadata["password"].encode("utf-8")):
-                raise ValueError("Invalid username or password.")
+            # Validate the password; a recent successful check of the same password and hash is reused
+            digest = hmac.new(self._credential_key, password.encode("utf-8"), hashlib.sha256).hexdigest()
+            verified = self.credential_cache.get(user_metadata["username"])
+            if verified is None or verified[0] != user_metadata["password"] or not hmac.compare_digest(verified[1], digest):
+                if not self.password_hasher.verify(password, user_metadata["password"]):
+                    raise ValueError("Invalid username or password.")
+                self.credential_cache.set(user_metadata["username"], (user_metadata["password"], digest))
 
             # Return user data
             return {
@@ -142,88 +302,552 @@ class ChromaDBUtility:
                 "role": user_metadata["role"]
             }
         except Exception as e:
-            logging.error(f"Error authenticating user '{username}': {str(e)}")
+            logging.error("Error authenticating user '%s': %s", username, e)
             raise e
 
     def hash_password(self, password):
         """Hash a plain-text password."""
-        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+        return self.password_hasher.hash(password).encode("utf-8")
 
     def reset_password(self, username, new_password):
         """Reset a user's password."""
+        self._check_writable("users")
         users_collection = self.get_or_create_collection("users")
-        hashed_password = bcrypt.hashpw(new_password.encode("utf-8"), bcrypt.gensalt())
+        hashed_password = self.password_hasher.hash(new_password)
 
         try:
-            # Generate embedding for the username document
-            document = f"User: {username}"
-            embedding = self.embedding_function([document])[0]  # Generate embedding for query
-
-            # Query using metadata and embeddings
-            results = users_collection.query(
-                where={"username": username},  # Filter by username
-                query_embeddings=[embedding],  # Use embedding for similarity
-                n_results=1,
-                include=["metadatas", "documents"]
-            )
-
-            metadatas = self.flatten_nested_list(results.get("metadatas", []))
-            if not metadatas:
+            user_metadata = self.get_user(username)
+            if not user_metadata:
                 raise ValueError("Username not found")
 
-            user_id = metadatas[0]["id"]
+            user_id = user_metadata["id"]
 
             # Update the user's password
             users_collection.update(
                 ids=[user_id],
-                metadatas=[{"password": hashed_password.decode("utf-8")}]
+                metadatas=[{"password": hashed_password}]
             )
-            logging.info(f"Password reset successfully for user '{username}'.")
+            self.user_cache.invalidate(user_id)
+            self.credential_cache.invalidate(user_metadata["username"])
+            # Other processes drop their cached copy once they see the new version
+            self.token_versions.bump(user_metadata["username"])
+            logging.info("Password reset successfully for user '%s'.", username)
+        except Exception as e:
+            logging.error("Failed to reset password for user '%s': %s", username, e)
+            raise e
+
+    def update_user_role(self, username, role):
+        """Change a user's role."""
+        self._check_writable("users")
+        users_collection = self.get_or_create_collection("users")
+        try:
+            user_metadata = self.get_user(username)
+            if not user_metadata:
+                raise ValueError("Username not found")
+
+            user_id = user_metadata["id"]
+            users_collection.update(ids=[user_id], metadatas=[{"role": role}])
+            self.user_cache.invalidate(user_id)
+            self.credential_cache.invalidate(user_metadata["username"])
+            self.token_versions.bump(user_metadata["username"])
+            logging.info("Role of user '%s' changed to '%s'.", username, role)
         except Exception as e:
-            logging.error(f"Failed to reset password for user '{username}': {str(e)}")
+            logging.error("Failed to change role for user '%s': %s", username, e)
             raise e
 
-    def add_item(self, collection_name, item_id=None, descripcion="", metadata=None):
-        """Add an item to a ChromaDB collection."""
+    def item_documents(self, collection_name, descripcion, metadata):
+        """Return the documents embedded for one item: `descripcion` followed by its per-language records."""
+        _, lang_documents, _ = self._language_records(
+            collection_name, [self.new_item_id(collection_name, metadata.get("numero_parte"))], [metadata]
+        )
+        return [descripcion] + lang_documents
+
+    def add_item(self, collection_name, item_id=None, descripcion="", metadata=None, embeddings=None):
+        """Add an item to a ChromaDB collection, reusing `embeddings` of its `item_documents` if already computed."""
+        self._check_writable(collection_name)
         collection = self.get_or_create_collection(collection_name)
-        item_id = item_id or str(uuid.uuid4())
-        embedding = self.embedding_function([descripcion])[0]
+        item_id = item_id or self.new_item_id(collection_name, (metadata or {}).get("numero_parte"))
+        lang_ids, lang_documents, lang_metadatas = self._language_records(collection_name, [item_id], [metadata or {}])
+
+        # One inference call covers the item and its per-language records
+        if embeddings is None:
+            embeddings = self.embedding_function([descripcion] + lang_documents)
 
         try:
             collection.add(
                 ids=[item_id],
                 documents=[descripcion],
                 metadatas=[metadata or {}],
-                embeddings=[embedding]
+                embeddings=[embeddings[0]]
             )
-            logging.info(f"Item added successfully: ID={item_id}, Description='{descripcion}'")
+            if lang_ids:
+                self.get_or_create_collection(TRANSLATIONS_COLLECTION).upsert(
+                    ids=lang_ids,
+                    documents=lang_documents,
+                    metadatas=lang_metadatas,
+                    embeddings=embeddings[1:]
+                )
+            if self._sharded(collection_name):
+                self.part_shards.write([item_id], [descripcion], [metadata or {}], [embeddings[0]])
+            logging.info("Item added successfully: ID=%s, Description='%s'", item_id, descripcion)
         except Exception as e:
-            logging.error(f"Failed to add item to collection '{collection_name}': {str(e)}")
+            logging.error("Failed to add item to collection '%s': %s", collection_name, e)
             raise
+        self._index_item(collection_name, item_id, metadata)
+        self.inventory_view.put_many(collection_name, [(item_id, metadata)])
+        self.collection_versions.bump(collection_name)
+        return item_id
 
-    def get_all_items(self, collection_name):
-        """Retrieve all items from a ChromaDB collection."""
+    def new_item_id(self, collection_name, numero_parte=None):
+        """Return the record id for an item: `item_<numero_parte>`, or a random id for items without one.
+
+        Records stored under other ids are moved by `python -m app.reindex`.
+        """
+        if numero_parte:
+            return f"item_{numero_parte}"
+        return str(uuid.uuid4())
+
+    def add_items(self, collection_name, ids, documents, metadatas, batch_size=256):
+        """Embed and upsert items in batches. Returns the seconds spent on embedding."""
         collection = self.get_or_create_collection(collection_name)
-        try:
+        embed_seconds = 0.0
+        for start in range(0, len(ids), batch_size):
+            batch_ids = ids[start:start + batch_size]
+            batch_documents = documents[start:start + batch_size]
+            batch_metadatas = metadatas[start:start + batch_size]
+            self._check_writable(collection_name)
+            lang_ids, lang_documents, lang_metadatas = self._language_records(collection_name, batch_ids, batch_metadatas)
+
+            embed_start = time.perf_counter()
+            embeddings = self.embedding_function(batch_documents + lang_documents)
+            embed_seconds += time.perf_counter() - embed_start
+            previous_clientes = self._previous_clientes(collection_name, batch_ids)
+
+            try:
+                collection.upsert(
+                    ids=batch_ids,
+                    documents=batch_documents,
+                    metadatas=batch_metadatas,
+                    embeddings=embeddings[:len(batch_ids)]
+                )
+                if lang_ids:
+                    self.get_or_create_collection(TRANSLATIONS_COLLECTION).upsert(
+                        ids=lang_ids,
+                        documents=lang_documents,
+                        metadatas=lang_metadatas,
+                        embeddings=embeddings[len(batch_ids):]
+                    )
+                if self._sharded(collection_name):
+                    self.part_shards.write(batch_ids, batch_documents, batch_metadatas, embeddings[:len(batch_ids)])
+                    for item_id, metadata in zip(batch_ids, batch_metadatas):
+                        if previous_clientes.get(item_id) not in (None, metadata.get("cliente")):
+                            self.part_shards.delete(item_id, previous_clientes[item_id])
+            except Exception as e:
+                logging.error("Failed to write batch to collection '%s': %s", collection_name, e)
+                raise
+            if collection_name in INDEXED_COLLECTIONS:
+                self.part_index.put_many(
+                    collection_name,
+                    [(metadata["numero_parte"], item_id) for item_id, metadata in zip(batch_ids, batch_metadatas)]
+                )
+            self.inventory_view.put_many(collection_name, list(zip(batch_ids, batch_metadatas)))
+        self.collection_versions.bump(collection_name)
+        logging.info("Wrote %s items to collection '%s' in batches of %s.", len(ids), collection_name, batch_size)
+        return embed_seconds
+
+    def embed_query(self, query_text):
+        """Embed a search query, reusing cached embeddings for repeated queries."""
+        embedding = self.query_embedding_cache.get(query_text)
+        if embedding is None:
+            embedding = self.embedding_function([query_text])[0]
+            self.query_embedding_cache.set(query_text, embedding)
+            return embedding, False
+        return embedding, True
+
+    @staticmethod
+    def build_where(filters):
+        """Build a Chroma metadata filter from a dict of exact-match values (lists match any of their values)."""
+        conditions = [
+            {key: {"$in": value} if len(value) > 1 else value[0]} if isinstance(value, list) else {key: value}
+            for key, value in filters.items() if value not in (None, "", [])
+        ]
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def search(self, collection_name, query_text, n_results=10, filters=None):
+        """Run a top-k similarity search and time the embedding and ANN phases separately.
+
+        Searches of `partes` filtered by client go to the client shards when sharding is on.
+        """
+        collection = self.get_or_create_collection(collection_name)
+        filters = dict(filters or {})
+        clientes = filters.pop("cliente", None) if self._sharded(collection_name) else None
+
+        embed_start = time.perf_counter()
+        embedding, cached = self.embed_query(query_text)
+        ann_start = time.perf_counter()
+        if clientes:
+            ids, distances, metadatas = self.part_shards.query(
+                embedding,
+                clientes if isinstance(clientes, list) else [clientes],
+                n_results=n_results,
+                where=self.build_where(filters)
+            )
+        else:
             results = collection.query(
-                query_texts=[""],
-                n_results=100,
+                query_embeddings=[embedding],
+                n_results=n_results,
+                where=self.build_where(filters),
+                include=["metadatas", "distances"]
+            )
+            ids, distances, metadatas = results["ids"][0], results["distances"][0], results["metadatas"][0]
+        ann_end = time.perf_counter()
+
+        matches = [
+            {"id": item_id, "distance": distance, "metadata": metadata}
+            for item_id, distance, metadata in zip(ids, distances, metadatas)
+        ]
+        timing = {
+            "embed_ms": round((ann_start - embed_start) * 1000, 3),
+            "ann_ms": round((ann_end - ann_start) * 1000, 3),
+            "total_ms": round((ann_end - embed_start) * 1000, 3),
+            "embedding_cached": cached
+        }
+        return matches, timing
+
+    def search_bilingual(self, query_text, n_results=10, filters=None, rrf_k=60):
+        """Search the English and Spanish records of `partes` and fuse them with reciprocal-rank fusion."""
+        translations = self.get_or_create_collection(TRANSLATIONS_COLLECTION)
+
+        embed_start = time.perf_counter()
+        embedding, cached = self.embed_query(query_text)
+        ann_start = time.perf_counter()
+        rankings = []
+        for lang in ("en", "es"):
+            results = translations.query(
+                query_embeddings=[embedding],
+                n_results=n_results,
+                where=self.build_where({**(filters or {}), "lang": lang}),
                 include=["metadatas"]
             )
-            return self.flatten_nested_list(results.get("metadatas", []))
+            rankings.append([metadata["part_id"] for metadata in results["metadatas"][0]])
+        fused = reciprocal_rank_fusion(rankings, k=rrf_k)[:n_results]
+
+        parts = self.get_or_create_collection("partes").get(
+            ids=[part_id for part_id, _ in fused],
+            include=["metadatas"]
+        )
+        metadata_by_id = dict(zip(parts["ids"], parts["metadatas"]))
+        ann_end = time.perf_counter()
+
+        matches = [
+            {"id": part_id, "score": round(score, 6), "metadata": metadata_by_id[part_id]}
+            for part_id, score in fused
+            if part_id in metadata_by_id
+        ]
+        timing = {
+            "embed_ms": round((ann_start - embed_start) * 1000, 3),
+            "ann_ms": round((ann_end - ann_start) * 1000, 3),
+            "total_ms": round((ann_end - embed_start) * 1000, 3),
+            "embedding_cached": cached
+        }
+        return matches, timing
+
+    def find_near_duplicates(self, collection_name, embedding, threshold=0.92, n_results=5):
+        """Return the stored items whose similarity to `embedding` is at least `threshold`, best first."""
+        collection = self.get_or_create_collection(collection_name)
+        if collection.count() == 0:
+            return []
+        results = collection.query(
+            query_embeddings=[embedding],
+            n_results=n_results,
+            include=["metadatas", "distances"]
+        )
+        space = collection_space(collection)
+        candidates = [
+            {"id": item_id, "score": round(similarity(distance, space), 6), "metadata": metadata}
+            for item_id, distance, metadata in zip(
+                results["ids"][0], results["distances"][0], results["metadatas"][0]
+            )
+        ]
+        return [candidate for candidate in candidates if candidate["score"] >= threshold]
+
+    def get_items_page(self, collection_name, limit=100, cursor=None, include=None, where=None):
+        """Retrieve one page of items with `collection.get`, returning (metadatas, next_cursor)."""
+        collection = self.get_or_create_collection(collection_name)
+        offset = decode_cursor(cursor)
+        results = collection.get(
+            limit=limit,
+            offset=offset,
+            where=where,
+            include=include or ["metadatas"]
+        )
+        metadatas = results.get("metadatas") or []
+        next_cursor = encode_cursor(offset + len(metadatas)) if len(metadatas) == limit else None
+        return metadatas, next_cursor
+
+    def get_client_parts_page(self, cliente, limit=100, cursor=None):
+        """Retrieve one page of a client's parts, from its shard when sharding is on."""
+        if not self.part_shards:
+            return self.get_items_page("partes", limit=limit, cursor=cursor, where={"cliente": cliente})
+        if not self.part_shards.exists(shard_name(cliente)):
+            return [], None
+        return self.get_items_page(shard_name(cliente), limit=limit, cursor=cursor)
+
+    def iter_records(self, collection_name, page_size=500):
+        """Stream (item_id, metadata) of every item of a collection page by page without running a vector query."""
+        collection = self.get_or_create_collection(collection_name)
+        offset = 0
+        while True:
+            results = collection.get(limit=page_size, offset=offset, include=["metadatas"])
+            ids = results.get("ids") or []
+            yield from zip(ids, results.get("metadatas") or [])
+            if len(ids) < page_size:
+                break
+            offset += page_size
+
+    def iter_items(self, collection_name, page_size=500):
+        """Stream the metadata of every item of a collection page by page without running a vector query."""
+        for _, metadata in self.iter_records(collection_name, page_size=page_size):
+            yield metadata
+
+    def get_all_items(self, collection_name):
+        """Retrieve all items from a ChromaDB collection."""
+        try:
+            return list(self.iter_items(collection_name))
         except Exception as e:
-            logging.error(f"Failed to retrieve items from collection '{collection_name}': {str(e)}")
+            logging.error("Failed to retrieve items from collection '%s': %s", collection_name, e)
             return []
-            
+
     def update_item(self, collection_name, item_id, metadata):
-        """Update an item's metadata in a ChromaDB collection."""
+        """Update an item's metadata in a ChromaDB collection.
+
+        For `partes`, a changed description also rewrites the item's document and
+        vector, embedded in the same call as its per-language records.
+        """
+        self._check_writable(collection_name)
         collection = self.get_or_create_collection(collection_name)
+        previous_clientes = self._previous_clientes(collection_name, [item_id])
+        update = {"ids": [item_id], "metadatas": [metadata]}
+        lang_records, lang_embeddings = None, None
+        if collection_name == "partes":
+            stored = collection.get(ids=[item_id], include=["metadatas"])["metadatas"]
+            stored = (stored[0] if stored else None) or {}
+            # Chroma merges the new keys into the stored metadata
+            merged = {**stored, **metadata}
+            lang_records = language_records([item_id], [merged])
+            documents = list(lang_records[1])
+            fields = ("numero_parte", *DESCRIPTION_FIELDS.values())
+            if any(merged.get(field) != stored.get(field) for field in fields):
+                document = ParteItem(**{key: value for key, value in merged.items() if value is not None}).document()
+                documents.insert(0, document)
+                update["documents"] = [document]
+            embeddings = self.embedding_function(documents) if documents else []
+            if "documents" in update:
+                update["embeddings"] = [embeddings[0]]
+                embeddings = embeddings[1:]
+            lang_embeddings = embeddings
         try:
-            collection.update(ids=[item_id], metadatas=[metadata])
-            logging.info(f"Item updated successfully: ID={item_id}")
+            collection.update(**update)
+            logging.info("Item updated successfully: ID=%s", item_id)
         except Exception as e:
-            logging.error(f"Failed to update item in collection '{collection_name}': {str(e)}")
-            
+            logging.error("Failed to update item in collection '%s': %s", collection_name, e)
+            raise
+        if collection_name in INDEXED_COLLECTIONS:
+            self.part_index.remove_item_id(collection_name, item_id)
+        self._index_item(collection_name, item_id, metadata)
+        self.inventory_view.put_many(collection_name, [(item_id, metadata)])
+        if lang_records is not None:
+            self._replace_language_records(item_id, lang_records, lang_embeddings)
+        if self._sharded(collection_name):
+            self.part_shards.copy_from_partes([item_id], previous_clientes)
+        self.collection_versions.bump(collection_name)
+
+    def delete_item(self, collection_name, item_id):
+        """Delete an item from a ChromaDB collection."""
+        self._check_writable(collection_name)
+        collection = self.get_or_create_collection(collection_name)
+        previous_clientes = self._previous_clientes(collection_name, [item_id])
+        try:
+            collection.delete(ids=[item_id])
+            logging.info("Item deleted successfully: ID=%s", item_id)
+        except Exception as e:
+            logging.error("Failed to delete item from collection '%s': %s", collection_name, e)
+            raise
+        if collection_name in INDEXED_COLLECTIONS:
+            self.part_index.remove_item_id(collection_name, item_id)
+        self.inventory_view.remove_item_id(collection_name, item_id)
+        if collection_name == "partes":
+            self.get_or_create_collection(TRANSLATIONS_COLLECTION).delete(ids=language_record_ids(item_id))
+        if self._sharded(collection_name):
+            self.part_shards.delete(item_id, previous_clientes.get(item_id))
+        self.collection_versions.bump(collection_name)
+
+    def find_item_id(self, collection_name, numero_parte):
+        """Return the record id stored for a `numero_parte` with one keyed lookup."""
+        return self.part_index.lookup(collection_name, numero_parte)
+
+    def get_item_by_numero_parte(self, collection_name, numero_parte):
+        """Retrieve an item's metadata by `numero_parte`, or None if it does not exist."""
+        item_id = self.find_item_id(collection_name, numero_parte)
+        if item_id is None:
+            return None
+        collection = self.get_or_create_collection(collection_name)
+        results = collection.get(ids=[item_id], include=["metadatas"])
+        metadatas = results.get("metadatas") or []
+        return metadatas[0] if metadatas else None
+
+    def delete_by_numero_parte(self, collection_name, numero_parte):
+        """Delete every record stored for a `numero_parte`, legacy duplicates included. Returns False if none was found."""
+        item_id = self.find_item_id(collection_name, numero_parte)
+        if item_id is not None:
+            self.delete_item(collection_name, item_id)
+        # Records written under other ids before the reindex would otherwise be indexed again
+        duplicates = self.get_or_create_collection(collection_name).get(
+            where={"numero_parte": numero_parte}, include=[]
+        )["ids"]
+        for duplicate_id in duplicates:
+            self.delete_item(collection_name, duplicate_id)
+        return item_id is not None or bool(duplicates)
+
+    def _check_writable(self, collection_name):
+        """Raise CollectionBusy if a maintenance job holds the collection or the records written with it."""
+        if collection_name == "partes":
+            self.maintenance.check_writable(collection_name, TRANSLATIONS_COLLECTION)
+        else:
+            self.maintenance.check_writable(collection_name)
+
+    def _sharded(self, collection_name):
+        return collection_name == "partes" and self.part_shards is not None
+
+    def _previous_clientes(self, collection_name, item_ids):
+        """Return {item_id: cliente} as stored before a write, when client shards must follow it."""
+        if not self._sharded(collection_name):
+            return {}
+        results = self.get_or_create_collection(collection_name).get(ids=item_ids, include=["metadatas"])
+        return {item_id: (metadata or {}).get("cliente") for item_id, metadata in zip(results["ids"], results["metadatas"])}
+
+    def _index_item(self, collection_name, item_id, metadata):
+        """Record an item's `numero_parte` in the exact-match index."""
+        if collection_name in INDEXED_COLLECTIONS and metadata and metadata.get("numero_parte"):
+            self.part_index.put(collection_name, metadata["numero_parte"], item_id)
+
+    @staticmethod
+    def _language_records(collection_name, ids, metadatas):
+        """Return the per-language records to write alongside `partes` items."""
+        if collection_name != "partes":
+            return [], [], []
+        return language_records(ids, metadatas)
+
+    def _replace_language_records(self, item_id, records, embeddings):
+        """Replace the per-language records of a part with already embedded (ids, documents, metadatas)."""
+        translations = self.get_or_create_collection(TRANSLATIONS_COLLECTION)
+        translations.delete(ids=language_record_ids(item_id))
+        lang_ids, lang_documents, lang_metadatas = records
+        if lang_ids:
+            translations.upsert(
+                ids=lang_ids,
+                documents=lang_documents,
+                metadatas=lang_metadatas,
+                embeddings=embeddings
+            )
+
+    def rebuild_part_index(self, collection_name, page_size=500):
+        """Rebuild the `numero_parte` index of a collection from its stored metadata."""
+        records = list(self.iter_records(collection_name, page_size=page_size))
+        self.part_index.rebuild(
+            collection_name,
+            [(metadata["numero_parte"], item_id) for item_id, metadata in records if metadata and metadata.get("numero_parte")],
+            source_count=len(records)
+        )
+
+    def ensure_part_indexes(self):
+        """Rebuild the `numero_parte` index of any collection whose size no longer matches it.
+
+        Records that had no entry of their own at the last rebuild (duplicates,
+        no part number) are accounted for, so a clean index is not rebuilt on every start.
+        """
+        for collection_name in INDEXED_COLLECTIONS:
+            expected = self.get_or_create_collection(collection_name).count() - self.part_index.unindexed(collection_name)
+            if expected != self.part_index.count(collection_name):
+                self.rebuild_part_index(collection_name)
+
+    def ensure_part_shards(self):
+        """Rebuild the client shards if they no longer hold every part that has a client.
+
+        The rebuild holds the `partes` maintenance lease, so only one process
+        runs it; the others skip it and see the shards once they exist.
+        """
+        if not self.part_shards or self.part_shards.count() == self.part_shards.expected_count():
+            return
+        try:
+            with self.maintenance.hold("partes", "shard rebuild"):
+                self.part_shards.rebuild()
+        except CollectionBusy as e:
+            logging.info("Skipping client shard rebuild: %s", e)
+
+    def count_where(self, collection_name, where, page_size=5000):
+        """Count the records of a collection matching a metadata filter, fetching ids only."""
+        collection = self.get_or_create_collection(collection_name)
+        total = offset = 0
+        while True:
+            ids = collection.get(where=where, limit=page_size, offset=offset, include=[])["ids"]
+            total += len(ids)
+            if len(ids) < page_size:
+                return total
+            offset += page_size
+
+    def ensure_language_records(self):
+        """Backfill the per-language records of `partes` if some are missing (e.g. parts stored before they existed).
+
+        A part has one record per non-empty description, so the expected count
+        comes from two id-only queries. The backfill holds the `partes`
+        maintenance lease; a process that cannot get it leaves it to the holder.
+        """
+        expected = sum(self.count_where("partes", {field: {"$ne": ""}}) for field in DESCRIPTION_FIELDS.values())
+        if self.get_or_create_collection(TRANSLATIONS_COLLECTION).count() >= expected:
+            return
+        try:
+            with self.maintenance.hold("partes", "language backfill"):
+                backfill_language_records(self)
+        except CollectionBusy as e:
+            logging.info("Skipping language record backfill: %s", e)
+
+    def apply_stock_quantities(self, quantities):
+        """Push on-hand quantities from the stock ledger into the inventory view."""
+        self.inventory_view.set_quantities(quantities)
+        self.collection_versions.bump("inventory")
+
+    def rebuild_inventory_view(self, quantities_fn=None):
+        """Rebuild the joined inventory view from both collections.
+
+        `quantities_fn` maps a list of part numbers to their current on-hand
+        quantities (e.g. `StockLedger.on_hand_many`) when those override the
+        stored ones. Quantities applied earlier are kept either way.
+        """
+        entries = {collection_name: list(self.iter_records(collection_name)) for collection_name in VIEW_COLLECTIONS}
+        quantities = None
+        if quantities_fn:
+            quantities = quantities_fn([
+                metadata["numero_parte"] for _, metadata in entries["inventory"] if metadata and metadata.get("numero_parte")
+            ])
+        self.inventory_view.rebuild(entries["inventory"], entries["partes"], quantities)
+
+    def ensure_inventory_view(self, quantities_fn=None):
+        """Rebuild the joined inventory view if it no longer matches the collection sizes, net of unmirrored records.
+
+        Otherwise only its ledger quantities are refreshed through `quantities_fn`.
+        """
+        for collection_name in VIEW_COLLECTIONS:
+            expected = self.get_or_create_collection(collection_name).count() - self.inventory_view.unmirrored(collection_name)
+            if expected != self.inventory_view.count(collection_name):
+                self.rebuild_inventory_view(quantities_fn)
+                return
+        if quantities_fn:
+            self.inventory_view.set_quantities(quantities_fn(self.inventory_view.numeros_parte()))
+
+
     def migrate_users(self):
         """Ensure all users have an 'id' field in their metadata."""
         users_collection = self.get_or_create_collection("users")
@@ -247,6 +871,6 @@ class ChromaDBUtility:
                         metadatas=[metadata],  # Update metadata
                         documents=[metadata["username"]]  # Ensure the document is preserved
                     )
-                    logging.info(f"Updated user '{metadata['username']}' with ID: {metadata['id']}")
+                    logging.info("Updated user '%s' with ID: %s", metadata['username'], metadata['id'])
         except Exception as e:
-            logging.error(f"Failed to migrate users: {str(e)}")
+            logging.error("Failed to migrate users: %s", e)
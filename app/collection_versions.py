@@ -0,0 +1,62 @@
+import threading
+from app.sqlite_utils import connect
+
+class CollectionVersions:
+    """Per-collection write counters shared by every process using the same persist directory.
+
+    Generations count something else: how often a collection was replaced by
+    a new one under the same name (an HNSW rebuild). Processes compare them
+    to re-resolve cached collection handles.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = connect(db_path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS collection_versions (
+                collection TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS collection_generations (
+                collection TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL
+            );
+            """
+        )
+
+    def bump(self, collection_name):
+        """Record that a collection changed."""
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO collection_versions (collection, version) VALUES (?, 1)
+                ON CONFLICT(collection) DO UPDATE SET version = version + 1
+                """,
+                (collection_name,)
+            )
+
+    def get(self, collection_name):
+        """Return the current version of a collection (0 if it never changed)."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (collection_name,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self, collection_name):
+        """Record that a collection was replaced, so every process reopens it."""
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO collection_generations (collection, generation) VALUES (?, 1)
+                ON CONFLICT(collection) DO UPDATE SET generation = generation + 1
+                """,
+                (collection_name,)
+            )
+
+    def generations(self):
+        """Return {collection: generation} for every collection that was ever replaced."""
+        with self.lock:
+            return dict(self.conn.execute("SELECT collection, generation FROM collection_generations").fetchall())
@@ -0,0 +1,130 @@
+import argparse
+import json
+import logging
+import sys
+import time
+
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_TOP_K = 5
+
+def collection_space(collection):
+    """Return the distance function a collection was created with."""
+    return (collection.metadata or {}).get("hnsw:space", "l2")
+
+def similarity(distance, space="l2"):
+    """Turn a Chroma distance into cosine similarity, assuming normalized embeddings."""
+    if space == "l2":
+        # Chroma reports squared euclidean distance: |a - b|^2 = 2 - 2 cos(a, b)
+        return 1.0 - distance / 2.0
+    # cosine and ip distances are both 1 - a.b
+    return 1.0 - distance
+
+class _DisjointSet:
+    """Union-find over record ids."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        root = self.parent.setdefault(item, item)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        self.parent[self.find(a)] = self.find(b)
+
+def cluster_duplicates(chroma_db, collection_name="partes", threshold=DEFAULT_THRESHOLD, top_k=10, batch_size=256, block_by=None):
+    """Group a collection into near-duplicate clusters.
+
+    Every record queries the collection's HNSW index for its `top_k` nearest
+    neighbours with its stored embedding, so the cost grows with n * log n
+    instead of n^2. With `block_by` (e.g. "cliente") neighbours are only
+    searched among records sharing that metadata value. Pairs at or above
+    `threshold` are joined transitively; groups are returned largest first.
+    """
+    collection = chroma_db.get_or_create_collection(collection_name)
+    space = collection_space(collection)
+    clusters = _DisjointSet()
+    metadata_by_id = {}
+    best_score = {}
+    start = time.perf_counter()
+
+    offset = 0
+    while True:
+        page = collection.get(limit=batch_size, offset=offset, include=["embeddings", "metadatas"])
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        metadata_by_id.update(zip(ids, page["metadatas"]))
+
+        blocks = {}
+        for item_id, embedding, metadata in zip(ids, page["embeddings"], page["metadatas"]):
+            block = (metadata or {}).get(block_by) if block_by else None
+            blocks.setdefault(block, []).append((item_id, embedding))
+
+        for block, members in blocks.items():
+            results = collection.query(
+                query_embeddings=[embedding for _, embedding in members],
+                n_results=top_k + 1,
+                where={block_by: block} if block is not None else None,
+                include=["distances"]
+            )
+            for (item_id, _), neighbour_ids, distances in zip(members, results["ids"], results["distances"]):
+                for neighbour_id, distance in zip(neighbour_ids, distances):
+                    score = similarity(distance, space)
+                    if neighbour_id == item_id or score < threshold:
+                        continue
+                    clusters.union(item_id, neighbour_id)
+                    for member in (item_id, neighbour_id):
+                        best_score[member] = max(best_score.get(member, 0.0), score)
+
+        offset += len(ids)
+        logging.info("Dedup scanned %s records of '%s' (%.0f/s).", offset, collection_name, offset / (time.perf_counter() - start))
+        if len(ids) < batch_size:
+            break
+
+    groups = {}
+    for item_id in best_score:
+        groups.setdefault(clusters.find(item_id), []).append(item_id)
+    result = [
+        [
+            {"id": item_id, "score": round(best_score[item_id], 6), "metadata": metadata_by_id.get(item_id)}
+            for item_id in sorted(members, key=lambda member: -best_score[member])
+        ]
+        for members in groups.values()
+    ]
+    result.sort(key=len, reverse=True)
+    logging.info(
+        "Found %s duplicate groups in %s records of '%s' in %.1fs.",
+        len(result), offset, collection_name, time.perf_counter() - start
+    )
+    return result
+
+if __name__ == "__main__":
+    from app.chromadb_utility import ChromaDBUtility
+    parser = argparse.ArgumentParser(description="Cluster a collection into near-duplicate groups.")
+    parser.add_argument("--collection", default="partes")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--block-by", help="Only compare records sharing this metadata field, e.g. cliente")
+    parser.add_argument("--output", help="JSON lines file, one group per line (default: stdout)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    groups = cluster_duplicates(
+        ChromaDBUtility(embedding_provider="none"),
+        args.collection,
+        threshold=args.threshold,
+        top_k=args.top_k,
+        batch_size=args.batch_size,
+        block_by=args.block_by
+    )
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    for group in groups:
+        output.write(json.dumps(group, ensure_ascii=False) + "\n")
+    if args.output:
+        output.close()
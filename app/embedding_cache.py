@@ -0,0 +1,148 @@
+import hashlib
+import threading
+import time
+import numpy as np
+from app.sqlite_utils import connect
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_CHUNK = 500
+# Hits refresh last_used at most this often, so repeated lookups stay read-only
+TOUCH_INTERVAL = 60.0
+# Inserts between two size checks; a prune trims the cache to PRUNE_TARGET of max_entries
+PRUNE_EVERY = 1000
+PRUNE_TARGET = 0.9
+
+def text_hash(text):
+    """SHA-256 of a document, used as its cache key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """On-disk float32 embedding cache keyed by (model id, SHA-256 of text), bounded by least recent use."""
+
+    def __init__(self, db_path, max_entries=100000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = connect(db_path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model_id TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (model_id, text_hash)
+            ) WITHOUT ROWID
+            """
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(embedding_cache)")}
+        if "last_used" not in columns:
+            self.conn.execute("ALTER TABLE embedding_cache ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embedding_cache_last_used ON embedding_cache (last_used)")
+        self.hits = 0
+        self.misses = 0
+        self.inference_seconds = 0.0
+        self.inferred_texts = 0
+        self.pruned = 0
+        self._inserted_since_prune = 0
+        with self.lock:
+            self._prune()
+
+    def get_many(self, model_id, hashes):
+        """Return {text_hash: vector} for the hashes that are cached, refreshing their last use."""
+        found = {}
+        now = time.time()
+        with self.lock:
+            for start in range(0, len(hashes), LOOKUP_CHUNK):
+                chunk = hashes[start:start + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector, last_used FROM embedding_cache WHERE model_id = ? AND text_hash IN ({placeholders})",
+                    [model_id, *chunk]
+                ).fetchall()
+                stale = []
+                for key, vector, last_used in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+                    if now - last_used > TOUCH_INTERVAL:
+                        stale.append(key)
+                if stale:
+                    self.conn.execute(
+                        f"UPDATE embedding_cache SET last_used = ? WHERE model_id = ? AND text_hash IN ({','.join('?' * len(stale))})",
+                        [now, model_id, *stale]
+                    )
+        return found
+
+    def put_many(self, model_id, entries):
+        """Store (text_hash, vector) pairs, pruning the least recently used entries once the cache is over its bound."""
+        now = time.time()
+        rows = [(model_id, key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in entries]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (model_id, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._inserted_since_prune += len(rows)
+            if self._inserted_since_prune >= PRUNE_EVERY:
+                self._prune()
+
+    def _prune(self):
+        """Delete the least recently used entries down to PRUNE_TARGET of max_entries; caller holds the lock."""
+        self._inserted_since_prune = 0
+        if not self.max_entries:
+            return
+        count = self.conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * PRUNE_TARGET)
+        self.conn.execute(
+            """
+            DELETE FROM embedding_cache WHERE (model_id, text_hash) IN (
+                SELECT model_id, text_hash FROM embedding_cache ORDER BY last_used LIMIT ?
+            )
+            """,
+            (excess,)
+        )
+        self.pruned += excess
+
+    def embed(self, model_id, texts, embed_fn):
+        """Embed texts, running `embed_fn` only on the distinct texts that are not cached."""
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.get_many(model_id, list(set(hashes)))
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        with self.lock:
+            self.hits += len(hashes) - sum(1 for key in hashes if key in missing)
+            self.misses += len(missing)
+
+        if missing:
+            start = time.perf_counter()
+            computed = embed_fn(list(missing.values()))
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.inference_seconds += elapsed
+                self.inferred_texts += len(missing)
+            entries = list(zip(missing.keys(), computed))
+            self.put_many(model_id, entries)
+            vectors.update((key, np.asarray(vector, dtype=np.float32)) for key, vector in entries)
+
+        return [vectors[key] for key in hashes]
+
+    def stats(self):
+        """Return hit rate and the inference time the cache saved, estimated from the average cost per text."""
+        with self.lock:
+            hits, misses = self.hits, self.misses
+            inference_seconds, inferred_texts, pruned = self.inference_seconds, self.inferred_texts, self.pruned
+        lookups = hits + misses
+        seconds_per_text = inference_seconds / inferred_texts if inferred_texts else 0.0
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "inference_seconds": round(inference_seconds, 3),
+            "saved_seconds_estimate": round(hits * seconds_per_text, 3),
+            "max_entries": self.max_entries,
+            "pruned": pruned
+        }
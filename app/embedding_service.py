@@ -0,0 +1,82 @@
+"""Shared embedding model service for multi-worker deployments.
+
+Loads the embedding model once and serves it over HTTP so that every web
+worker can use `EMBEDDING_PROVIDER=remote` instead of loading its own copy.
+
+Usage: python -m app.embedding_service [--host 127.0.0.1] [--port 8100]
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.embedding_cache import EmbeddingCache
+from app.embeddings import create_embedding_function
+
+class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+    """POST /embed {"texts": [...]} -> {"embeddings": [[...], ...]}; GET /health."""
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404)
+            return
+        embedding_function = self.server.embedding_function
+        self._send_json(200, {"status": "ok", "loaded": embedding_function.loaded, "model_id": embedding_function.model_id})
+
+    def do_POST(self):
+        if self.path != "/embed":
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            texts = json.loads(self.rfile.read(length))["texts"]
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError("'texts' must be a list of strings.")
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        # Bounded concurrency: excess requests wait here instead of oversubscribing the CPU
+        with self.server.slots:
+            embeddings = self.server.embedding_function(texts)
+        self._send_json(200, {"embeddings": [[float(value) for value in vector] for vector in embeddings]})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("Embedding service: " + format, *args)
+
+def create_server(host, port, concurrency=2, cache_path=None, cache_size=100000):
+    """Build the HTTP server with one shared, eagerly loaded embedding function."""
+    cache = EmbeddingCache(cache_path, max_entries=cache_size) if cache_path else None
+    # This process is the model owner, so it must never forward to itself
+    provider = os.getenv("EMBEDDING_SERVICE_PROVIDER", "default")
+    server = ThreadingHTTPServer((host, port), EmbeddingRequestHandler)
+    server.embedding_function = create_embedding_function(provider, cache=cache)
+    server.slots = threading.BoundedSemaphore(concurrency)
+    server.embedding_function.load()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the embedding model to web workers.")
+    parser.add_argument("--host", default=os.getenv("EMBEDDING_SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("EMBEDDING_SERVICE_PORT", "8100")))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("EMBEDDING_SERVICE_CONCURRENCY", "2")))
+    parser.add_argument("--cache", default=os.getenv("EMBEDDING_SERVICE_CACHE"), help="Path of an on-disk embedding cache")
+    parser.add_argument("--cache-max-entries", type=int, default=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    server = create_server(args.host, args.port, args.concurrency, args.cache, args.cache_max_entries)
+    logging.info("Embedding service listening on %s:%s", args.host, args.port)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import logging
+import os
+import threading
+import time
+from chromadb.api.types import Documents, EmbeddingFunction
+from app.metrics import EMBEDDING_INFERENCE_SECONDS, EMBEDDING_TEXTS
+
+def _default_provider(**options):
+    """Chroma's bundled all-MiniLM-L6-v2 ONNX model."""
+    from chromadb.utils import embedding_functions
+    return embedding_functions.DefaultEmbeddingFunction()
+
+def _onnx_provider(threads=None, **options):
+    """The bundled ONNX model with a fixed intra-op thread count."""
+    from functools import cached_property
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+    class ThreadedONNXMiniLM(ONNXMiniLM_L6_V2):
+        @cached_property
+        def model(self):
+            if not self._preferred_providers:
+                self._preferred_providers = self.ort.get_available_providers()
+            so = self.ort.SessionOptions()
+            so.log_severity_level = 3
+            so.graph_optimization_level = self.ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if threads:
+                so.intra_op_num_threads = threads
+                so.inter_op_num_threads = 1
+            return self.ort.InferenceSession(
+                os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME, "model.onnx"),
+                providers=self._preferred_providers,
+                sess_options=so
+            )
+
+    return ThreadedONNXMiniLM()
+
+def _sentence_transformers_provider(model_dir=None, device="cpu", **options):
+    """A sentence-transformers model loaded from a local directory."""
+    if not model_dir:
+        raise ValueError("The sentence_transformers provider needs EMBEDDING_MODEL_DIR.")
+    from chromadb.utils import embedding_functions
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_dir, device=device)
+
+def _remote_provider(url=None, timeout=30, **options):
+    """The shared model served by `app.embedding_service`, so workers do not each load a copy."""
+    import json
+    import urllib.request
+    import numpy as np
+
+    if not url:
+        raise ValueError("The remote provider needs EMBEDDING_SERVICE_URL.")
+
+    def embed(input):
+        request = urllib.request.Request(
+            f"{url.rstrip('/')}/embed",
+            data=json.dumps({"texts": list(input)}).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return [np.asarray(vector, dtype=np.float32) for vector in json.load(response)["embeddings"]]
+    return embed
+
+def _remote_model_id(url, timeout=30):
+    """Ask the embedding service which model it serves, from its /health response."""
+    import json
+    import urllib.request
+
+    with urllib.request.urlopen(f"{url.rstrip('/')}/health", timeout=timeout) as response:
+        return json.load(response)["model_id"]
+
+def _no_embedding_provider(**options):
+    """Refuse to embed, for processes that only do key lookups."""
+    def refuse(input):
+        raise RuntimeError("Embedding is disabled in this process (EMBEDDING_PROVIDER=none).")
+    return refuse
+
+EMBEDDING_PROVIDERS = {
+    "default": _default_provider,
+    "onnx": _onnx_provider,
+    "sentence_transformers": _sentence_transformers_provider,
+    "remote": _remote_provider,
+    "none": _no_embedding_provider,
+}
+
+def register_embedding_provider(name, factory):
+    """Make an embedding backend available by name. `factory(**options)` returns a Chroma embedding function."""
+    EMBEDDING_PROVIDERS[name] = factory
+
+class LazyEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Chroma embedding function that builds its backend on first use."""
+
+    def __init__(self, provider="default", cache=None, **options):
+        if provider not in EMBEDDING_PROVIDERS:
+            raise ValueError(f"Unknown embedding provider '{provider}'. Use one of: {', '.join(EMBEDDING_PROVIDERS)}.")
+        self.provider = provider
+        self.options = options
+        self.cache = cache
+        self.load_seconds = None
+        self._backend = None
+        self._remote_model_id = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        """Whether the backend has been built."""
+        return self._backend is not None
+
+    @property
+    def model_id(self):
+        """Identify the model whose vectors this function produces, for cache keys."""
+        if self.options.get("model_id"):
+            return self.options["model_id"]
+        if self.provider in ("default", "onnx"):
+            return "onnx:all-MiniLM-L6-v2"
+        if self.provider == "remote":
+            return self._remote_model()
+        return f"{self.provider}:{self.options.get('model_dir', '')}"
+
+    def _remote_model(self):
+        """The model reported by the embedding service, falling back to its URL while it cannot be reached."""
+        if self._remote_model_id is None:
+            url = self.options.get("url") or ""
+            try:
+                self._remote_model_id = _remote_model_id(url, self.options.get("timeout", 30))
+            except Exception as e:
+                logging.warning("Could not read the model of the embedding service at %s: %s", url, e)
+                return f"remote:{url}"
+        return self._remote_model_id
+
+    @property
+    def enabled(self):
+        """Whether this function can embed at all."""
+        return self.provider != "none"
+
+    def load(self):
+        """Build the backend now, warming up the model with one inference."""
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    start = time.perf_counter()
+                    backend = EMBEDDING_PROVIDERS[self.provider](**self.options)
+                    if self.enabled:
+                        backend(["warmup"])
+                    self.load_seconds = time.perf_counter() - start
+                    self._backend = backend
+                    logging.info("Loaded embedding provider '%s' in %.0f ms", self.provider, self.load_seconds * 1000)
+        return self._backend
+
+    def _infer(self, texts):
+        """Run the backend on texts, recording inference time."""
+        backend = self.load()
+        with EMBEDDING_INFERENCE_SECONDS.time(provider=self.provider):
+            embeddings = backend(texts)
+        EMBEDDING_TEXTS.inc(len(texts), provider=self.provider)
+        return embeddings
+
+    def __call__(self, input):
+        if self.cache is not None:
+            return self.cache.embed(self.model_id, input, self._infer)
+        return self._infer(input)
+
+def create_embedding_function(provider=None, cache=None, **options):
+    """Build the lazy embedding function configured by arguments or EMBEDDING_* environment variables."""
+    provider = provider or os.getenv("EMBEDDING_PROVIDER", "default")
+    if "threads" not in options and os.getenv("EMBEDDING_THREADS"):
+        options["threads"] = int(os.getenv("EMBEDDING_THREADS"))
+    if "model_dir" not in options and os.getenv("EMBEDDING_MODEL_DIR"):
+        options["model_dir"] = os.getenv("EMBEDDING_MODEL_DIR")
+    if "device" not in options and os.getenv("EMBEDDING_DEVICE"):
+        options["device"] = os.getenv("EMBEDDING_DEVICE")
+    if "url" not in options and os.getenv("EMBEDDING_SERVICE_URL"):
+        options["url"] = os.getenv("EMBEDDING_SERVICE_URL")
+    if "model_id" not in options and os.getenv("EMBEDDING_MODEL_ID"):
+        options["model_id"] = os.getenv("EMBEDDING_MODEL_ID")
+    return LazyEmbeddingFunction(provider, cache=cache, **options)
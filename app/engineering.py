@@ -1,5 +1,4 @@
 import logging
-import uuid
 from flask_login import login_required, current_user
 from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token, create_refresh_token, get_jwt
 from flask import (
@@ -12,7 +11,14 @@ from flask import (
     jsonify,
     current_app
 )
+from app.models import ParteItem
 from app.decorators import role_required
+from app.write_queue import part_exists
+from app.maintenance import CollectionBusy
+from app.pagination import parse_page_args
+from app.snapshot import reporting_source
+from app.search import parse_search_args
+from app.bulk_import import detect_format, read_rows, import_rows, parse_import_args
 
 engineering = Blueprint("engineering", __name__, template_folder="templates/engineering")
 
@@ -22,7 +28,7 @@ engineering = Blueprint("engineering", __name__, template_folder="templates/engi
 @role_required(["admin", "engineer"])
 def engineering_home():
     """Render the Engineering Home Page."""
-    logging.info(f"User {current_user.username} accessed Engineering Home.")
+    logging.info("User %s accessed Engineering Home.", current_user.username)
     return render_template("engineering.html")
 
 @engineering.route("/tasks", methods=["POST"])
@@ -39,7 +45,7 @@ def add_task():
         logging.warning("Task creation failed: Task ID or description missing.")
         return jsonify({"error": "Task ID and Description are required"}), 400
 
-    logging.info(f"User {current_user.username} added task: {task_id}, {description}")
+    logging.info("User %s added task: %s, %s", current_user.username, task_id, description)
     return jsonify({"message": "Task added successfully"}), 201
 
 @engineering.route("/numero_parte/nuevo", methods=["GET", "POST"])
@@ -48,7 +54,7 @@ def add_task():
 @role_required(["admin", "engineer"])
 def nuevo_numero_parte():
     """Handle adding a new 'Numero de Parte'."""
-    logging.info(f"User {current_user.username} accessed nuevo_numero_parte.")
+    logging.info("User %s accessed nuevo_numero_parte.", current_user.username)
     if request.method == "GET":
         csrf_token = get_jwt()["csrf"]  # Extract the CSRF token from the JWT
         return render_template("nuevo_numero_parte.html", csrf_token=csrf_token)
@@ -64,7 +70,6 @@ def nuevo_numero_parte():
         if not cliente or not numero_parte:
             raise ValueError("Cliente and Numero de Parte are required fields.")
 
-        document = f"{numero_parte}: {descripcion_ingles} / {descripcion_espanol}"
         metadata = {
             "cliente": cliente,
             "numero_parte": numero_parte,
@@ -74,44 +79,147 @@ def nuevo_numero_parte():
             "peso": float(peso),
             "unidad_peso": unidad_peso,
         }
+        document = ParteItem(**{key: value for key, value in metadata.items() if value is not None}).document()
 
         chroma_db = get_chroma_db()
+        write_queue = current_app.write_queue
+        if part_exists(chroma_db, write_queue, "partes", numero_parte):
+            raise ValueError(f"Numero de Parte '{numero_parte}' ya existe.")
+
+        # Near-duplicate check on the part's own vector; one inference call also covers
+        # the per-language records and all the embeddings are reused for the insert
+        embeddings = None
+        if chroma_db.embedding_function.enabled:
+            embeddings = chroma_db.embedding_function(chroma_db.item_documents("partes", document, metadata))
+        if embeddings is not None and request.form.get("forzar", "false").lower() != "true":
+            candidates = chroma_db.find_near_duplicates(
+                "partes",
+                embeddings[0],
+                threshold=current_app.config["DEDUP_THRESHOLD"],
+                n_results=current_app.config["DEDUP_TOP_K"]
+            )
+            if candidates:
+                logging.info("Possible duplicates of %s: %s", numero_parte, [c['metadata'].get('numero_parte') for c in candidates])
+                if request.accept_mimetypes.best == "application/json":
+                    return jsonify({"error": "Possible duplicates found.", "candidates": candidates}), 409
+                return render_template(
+                    "nuevo_numero_parte.html",
+                    csrf_token=get_jwt()["csrf"],
+                    candidates=candidates,
+                    submitted=request.form
+                ), 409
+
+        if write_queue:
+            op_id = write_queue.enqueue("partes", "add", numero_parte, {
+                "descripcion": document,
+                "metadata": {key: value for key, value in metadata.items() if value is not None},
+                "new": chroma_db.find_item_id("partes", numero_parte) is None
+            })
+            flash(f"Numero de Parte en cola (operación {op_id}).", "info")
+            return redirect(url_for("engineering.nuevo_numero_parte"))
+
         chroma_db.add_item(
             collection_name="partes",
-            item_id=str(uuid.uuid4()),
             descripcion=document,
-            metadata=metadata
+            metadata=metadata,
+            embeddings=embeddings
         )
 
-        logging.info(f"User {current_user.username} added Numero de Parte {numero_parte}.")
+        logging.info("User %s added Numero de Parte %s.", current_user.username, numero_parte)
         flash("Numero de Parte agregado exitosamente.", "success")
         return redirect(url_for("engineering.nuevo_numero_parte"))
 
     except ValueError as ve:
-        logging.warning(f"Validation error: {str(ve)}")
+        logging.warning("Validation error: %s", ve)
         flash(str(ve), "warning")
         return redirect(url_for("engineering.nuevo_numero_parte"))
 
+    except CollectionBusy as e:
+        flash(str(e), "warning")
+        return redirect(url_for("engineering.nuevo_numero_parte"))
+
     except Exception as e:
-        logging.error(f"Error adding Numero de Parte by {current_user.username}: {str(e)}")
+        logging.error("Error adding Numero de Parte by %s: %s", current_user.username, e)
         flash("Hubo un error al agregar el Numero de Parte.", "danger")
         return redirect(url_for("engineering.nuevo_numero_parte"))
 
+@engineering.route("/numero_parte/bulk_import", methods=["POST"])
+@jwt_required()  # Check JWT
+@login_required
+@role_required(["admin", "engineer"])
+def bulk_import_partes():
+    """Import 'Numero de Parte' records from an uploaded CSV, XLSX or JSONL file."""
+    upload = request.files.get("file")
+    if not upload:
+        return jsonify({"error": "A file upload named 'file' is required"}), 400
+
+    try:
+        explicit_format, batch_size, upsert = parse_import_args(request.args, current_app.config["BULK_BATCH_SIZE"])
+        rows = read_rows(upload.stream, detect_format(upload.filename, explicit_format))
+    except ValueError as e:
+        logging.warning("Bulk import rejected for %s: %s", current_user.username, e)
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        report = import_rows(get_chroma_db(), "partes", rows, batch_size=batch_size, upsert=upsert)
+        logging.info("User %s bulk imported %s Numero de Parte.", current_user.username, report['inserted'])
+        return jsonify(report), 200
+    except CollectionBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        logging.error("Error importing Numero de Parte by %s: %s", current_user.username, e)
+        return jsonify({"error": "Failed to import items"}), 500
+
 @engineering.route("/numero_parte/list", methods=["GET"])
 @jwt_required()  # Check JWT
 @login_required
 @role_required(["admin", "engineer"])
 def list_partes():
-    """List all 'Numero de Parte' from ChromaDB."""
+    """List 'Numero de Parte' from ChromaDB one page at a time."""
     try:
-        chroma_db = get_chroma_db()
-        items = chroma_db.get_all_items("partes")
-        logging.info(f"User {current_user.username} retrieved Numero de Parte list.")
-        return jsonify(items), 200
+        limit, cursor = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        chroma_db, snapshot = reporting_source(current_app, request.args)
+        cliente = request.args.get("cliente")
+        if cliente:
+            items, next_cursor = chroma_db.get_client_parts_page(cliente, limit=limit, cursor=cursor)
+        else:
+            items, next_cursor = chroma_db.get_items_page("partes", limit=limit, cursor=cursor)
+        logging.info("User %s retrieved Numero de Parte list.", current_user.username)
+        response = {"items": items, "next_cursor": next_cursor}
+        if snapshot:
+            response["snapshot"] = snapshot
+        return jsonify(response), 200
     except Exception as e:
-        logging.error(f"Error retrieving Numero de Parte list by {current_user.username}: {str(e)}")
+        logging.error("Error retrieving Numero de Parte list by %s: %s", current_user.username, e)
         return jsonify({"error": "Failed to retrieve items"}), 500
 
+@engineering.route("/numero_parte/search", methods=["GET"])
+@jwt_required()  # Check JWT
+@login_required
+@role_required(["admin", "engineer"])
+def search_partes():
+    """Top-k similarity search over 'Numero de Parte', fusing English and Spanish matches by default."""
+    try:
+        query, k, filters = parse_search_args(request.args, "partes")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        chroma_db = get_chroma_db()
+        if request.args.get("mode", "bilingual") == "combined":
+            results, timing = chroma_db.search("partes", query, n_results=k, filters=filters)
+        else:
+            results, timing = chroma_db.search_bilingual(query, n_results=k, filters=filters)
+        logging.info("User %s searched Numero de Parte: '%s' (%s ms).", current_user.username, query, timing['total_ms'])
+        return jsonify({"results": results, "timing": timing}), 200
+    except Exception as e:
+        logging.error("Error searching Numero de Parte by %s: %s", current_user.username, e)
+        return jsonify({"error": "Failed to search items"}), 500
+
 @engineering.route("/numero_parte/modificar", methods=["GET", "POST"])
 @jwt_required()  # Check JWT
 @login_required
@@ -124,19 +232,17 @@ def modificar_numero_parte():
         query = request.args.get("numero_parte_query")
         if query:
             try:
-                collection = chroma_db.get_or_create_collection("partes")
-                results = collection.get(include=["metadatas"], where={"numero_parte": query})
+                part = chroma_db.get_item_by_numero_parte("partes", query)
 
-                if results["metadatas"]:
-                    part = results["metadatas"][0]
-                    logging.info(f"User {current_user.username} queried Numero de Parte {query}.")
+                if part:
+                    logging.info("User %s queried Numero de Parte %s.", current_user.username, query)
                     return render_template("modificar_numero_parte.html", part=part, query=query)
                 else:
                     flash("Número de Parte no encontrado.", "warning")
                     return redirect(url_for("engineering.engineering_home"))
 
             except Exception as e:
-                logging.error(f"Error querying Numero de Parte by {current_user.username}: {str(e)}")
+                logging.error("Error querying Numero de Parte by %s: %s", current_user.username, e)
                 flash("Hubo un error al buscar el número de parte.", "danger")
                 return redirect(url_for("engineering.engineering_home"))
 
@@ -162,15 +268,30 @@ def modificar_numero_parte():
                 "unidad_peso": unidad_peso,
             }
 
-            collection = chroma_db.get_or_create_collection("partes")
-            collection.upsert(ids=[f"item_{numero_parte}"], metadatas=[updated_metadata])
+            write_queue = current_app.write_queue
+            if not part_exists(chroma_db, write_queue, "partes", numero_parte):
+                flash("Número de Parte no encontrado.", "warning")
+                return redirect(url_for("engineering.modificar_numero_parte"))
 
-            logging.info(f"User {current_user.username} updated Numero de Parte {numero_parte}.")
+            if write_queue:
+                op_id = write_queue.enqueue("partes", "update", numero_parte, {
+                    "metadata": {key: value for key, value in updated_metadata.items() if value is not None}
+                })
+                flash(f"Actualización en cola (operación {op_id}).", "info")
+                return redirect(url_for("engineering.modificar_numero_parte"))
+
+            chroma_db.update_item("partes", chroma_db.find_item_id("partes", numero_parte), updated_metadata)
+
+            logging.info("User %s updated Numero de Parte %s.", current_user.username, numero_parte)
             flash("Número de Parte actualizado exitosamente.", "success")
             return redirect(url_for("engineering.modificar_numero_parte"))
 
+        except CollectionBusy as e:
+            flash(str(e), "warning")
+            return redirect(url_for("engineering.modificar_numero_parte"))
+
         except Exception as e:
-            logging.error(f"Error updating Numero de Parte by {current_user.username}: {str(e)}")
+            logging.error("Error updating Numero de Parte by %s: %s", current_user.username, e)
             flash("Hubo un error al actualizar el número de parte.", "danger")
             return redirect(url_for("engineering.modificar_numero_parte"))
 
@@ -184,20 +305,34 @@ def eliminar_numero_parte():
         numero_parte = request.form.get("numero_parte")
 
         if not numero_parte:
-            logging.warning(f"User {current_user.username} attempted to delete without providing Numero de Parte.")
+            logging.warning("User %s attempted to delete without providing Numero de Parte.", current_user.username)
             flash("Debe proporcionar un número de parte para eliminar.", "danger")
             return redirect(url_for("engineering.modificar_numero_parte"))
 
         chroma_db = get_chroma_db()
-        collection = chroma_db.get_or_create_collection("partes")
-        collection.delete(where={"numero_parte": numero_parte})
+        write_queue = current_app.write_queue
+        if write_queue:
+            if not part_exists(chroma_db, write_queue, "partes", numero_parte):
+                flash("Número de Parte no encontrado.", "warning")
+                return redirect(url_for("engineering.modificar_numero_parte"))
+            op_id = write_queue.enqueue("partes", "delete", numero_parte, {})
+            flash(f"Eliminación en cola (operación {op_id}).", "info")
+            return redirect(url_for("engineering.engineering_home"))
 
-        logging.info(f"User {current_user.username} deleted Numero de Parte {numero_parte}.")
+        if not chroma_db.delete_by_numero_parte("partes", numero_parte):
+            flash("Número de Parte no encontrado.", "warning")
+            return redirect(url_for("engineering.modificar_numero_parte"))
+
+        logging.info("User %s deleted Numero de Parte %s.", current_user.username, numero_parte)
         flash(f"Número de Parte '{numero_parte}' eliminado exitosamente.", "success")
         return redirect(url_for("engineering.engineering_home"))
 
+    except CollectionBusy as e:
+        flash(str(e), "warning")
+        return redirect(url_for("engineering.modificar_numero_parte"))
+
     except Exception as e:
-        logging.error(f"Error deleting Numero de Parte by {current_user.username}: {str(e)}")
+        logging.error("Error deleting Numero de Parte by %s: %s", current_user.username, e)
         flash("Hubo un error al eliminar el número de parte.", "danger")
         return redirect(url_for("engineering.modificar_numero_parte"))
 
@@ -0,0 +1,105 @@
+import csv
+import glob
+import io
+import json
+import logging
+import os
+import tempfile
+from openpyxl import Workbook
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+def iter_csv(items, columns):
+    """Yield CSV text one row at a time, starting with the header."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for item in items:
+        writer.writerow(item)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def iter_jsonl(items, columns):
+    """Yield one JSON object per line."""
+    for item in items:
+        yield json.dumps({column: item.get(column) for column in columns}, ensure_ascii=False) + "\n"
+
+def iter_json_page(rows, chunk_size=1000, **fields):
+    """Yield `{"items": [...], **fields}` from rows that are already JSON strings, a chunk at a time."""
+    yield '{"items":['
+    chunk, separator = [], ""
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield separator + ",".join(chunk)
+            chunk, separator = [], ","
+    if chunk:
+        yield separator + ",".join(chunk)
+    yield "]"
+    for key, value in fields.items():
+        yield f",{json.dumps(key)}:{json.dumps(value, ensure_ascii=False)}"
+    yield "}"
+
+def write_xlsx(items, columns, file_path):
+    """Write rows with openpyxl's write-only mode so memory stays flat."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(columns)
+    for item in items:
+        sheet.append([item.get(column) for column in columns])
+    workbook.save(file_path)
+
+def write_export(items, columns, file_format, file_path):
+    """Write an export file in the given format."""
+    if file_format == "xlsx":
+        write_xlsx(items, columns, file_path)
+        return
+    chunks = iter_csv(items, columns) if file_format == "csv" else iter_jsonl(items, columns)
+    with open(file_path, "w", encoding="utf-8", newline="") as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+def temporary_export_path(output_folder, file_format):
+    """Reserve a per-request file for an export."""
+    os.makedirs(output_folder, exist_ok=True)
+    fd, file_path = tempfile.mkstemp(suffix=f".{file_format}", dir=output_folder)
+    os.close(fd)
+    return file_path
+
+def cached_export(chroma_db, collection_name, columns, file_format, output_folder, items_fn=None):
+    """Return the path of an export of the current collection version, building it only if needed.
+
+    `items_fn` returns the rows to write; by default the collection's stored items.
+    """
+    cache_folder = os.path.join(output_folder, "cache")
+    version = chroma_db.collection_versions.get(collection_name)
+    file_path = os.path.join(cache_folder, f"{collection_name}-v{version}.{file_format}")
+    if os.path.exists(file_path):
+        logging.info("Serving cached export %s", file_path)
+        return file_path
+
+    temp_path = temporary_export_path(cache_folder, file_format)
+    try:
+        items = items_fn() if items_fn else chroma_db.iter_items(collection_name)
+        write_export(items, columns, file_format, temp_path)
+        os.replace(temp_path, file_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+    # Older versions are stale now
+    for stale_path in glob.glob(os.path.join(cache_folder, f"{collection_name}-v*.{file_format}")):
+        if stale_path != file_path:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+    logging.info("Rebuilt cached export %s", file_path)
+    return file_path
@@ -0,0 +1,198 @@
+import argparse
+import json
+import logging
+import os
+import time
+from contextlib import ExitStack
+from app.sharding import SHARD_PREFIX
+
+# Config keys and the collection metadata Chroma reads them from
+HNSW_PARAMETERS = {
+    "space": "hnsw:space",
+    "M": "hnsw:M",
+    "construction_ef": "hnsw:construction_ef",
+    "search_ef": "hnsw:search_ef",
+}
+# What Chroma uses for parameters missing from a collection's metadata
+HNSW_DEFAULTS = {"hnsw:space": "l2", "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 10}
+SPACES = ("l2", "cosine", "ip")
+DEFAULT_KEY = "*"
+
+def validate_hnsw_params(params):
+    """Check one collection's HNSW parameters, returning them unchanged."""
+    unknown = set(params) - set(HNSW_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown HNSW parameters: {', '.join(sorted(unknown))}")
+    if "space" in params and params["space"] not in SPACES:
+        raise ValueError(f"HNSW space must be one of: {', '.join(SPACES)}")
+    for key in ("M", "construction_ef", "search_ef"):
+        if key in params and (not isinstance(params[key], int) or params[key] < 1):
+            raise ValueError(f"HNSW {key} must be a positive integer.")
+    return params
+
+def load_hnsw_config(path=None):
+    """Load {collection: {space, M, construction_ef, search_ef}} from a JSON file (`HNSW_CONFIG`).
+
+    The "*" entry applies to collections without their own; client shards use the `partes` entry.
+    """
+    path = path or os.getenv("HNSW_CONFIG")
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as config_file:
+        config = json.load(config_file)
+    return {name: validate_hnsw_params(params) for name, params in config.items()}
+
+def collection_metadata(config, collection_name):
+    """Return the `hnsw:*` metadata to create a collection with, or None for Chroma's defaults."""
+    key = "partes" if collection_name.startswith(SHARD_PREFIX) else collection_name
+    params = {**config.get(DEFAULT_KEY, {}), **config.get(key, {})}
+    if not params:
+        return None
+    return {HNSW_PARAMETERS[name]: value for name, value in params.items()}
+
+def rebuild_collection(chroma_db, collection_name, params, batch_size=500):
+    """Apply new HNSW parameters to a collection, keeping ids, documents, metadata and embeddings.
+
+    The collection's maintenance lease is held throughout (for a client shard
+    also the `partes` one, whose writes reach the shards), so writes wait and
+    none is lost. When only `search_ef` changes, the collection metadata is
+    modified in place. Otherwise records are copied into a staging collection
+    created with the new parameters, which then takes over the name; the
+    collection's generation is bumped so every process reopens its handle.
+    """
+    with ExitStack() as stack:
+        for lease_name in [collection_name] + (["partes"] if collection_name.startswith(SHARD_PREFIX) else []):
+            stack.enter_context(chroma_db.maintenance.hold(lease_name, "hnsw rebuild"))
+        return _rebuild_collection(chroma_db, collection_name, params, batch_size)
+
+def _existing_collection(chroma_db, name):
+    """Return a collection straight from the client, or None if it does not exist."""
+    try:
+        return chroma_db.client.get_collection(name=name)
+    except Exception:
+        return None
+
+def _recover_swap(chroma_db, collection_name):
+    """Finish what an interrupted rebuild left behind, before anything is deleted.
+
+    A `-retired` collection is the old copy of the records. It goes back under
+    its name when that name is missing or empty (the run stopped between the
+    two renames); it is dropped only when the swap completed, i.e. the name
+    holds records and no staging collection is left.
+    """
+    retired_name = f"{collection_name}-retired"
+    retired = _existing_collection(chroma_db, retired_name)
+    if retired is None:
+        return
+    current = _existing_collection(chroma_db, collection_name)
+    if current is None or not current.count():
+        if current is not None:
+            chroma_db.client.delete_collection(name=collection_name)
+        retired.modify(name=collection_name)
+        chroma_db.collection_versions.bump_generation(collection_name)
+        chroma_db.invalidate_collection(collection_name)
+        logging.warning("Restored '%s' from '%s' left by an interrupted rebuild.", collection_name, retired_name)
+        return
+    if _existing_collection(chroma_db, f"{collection_name}-rebuild") is not None:
+        raise RuntimeError(
+            f"'{collection_name}' was recreated and written to after a rebuild stopped mid-swap; "
+            f"merge '{retired_name}' into it by hand before rebuilding."
+        )
+    chroma_db.delete_collection(retired_name)
+
+def _rebuild_collection(chroma_db, collection_name, params, batch_size):
+    _recover_swap(chroma_db, collection_name)
+    source = chroma_db.get_or_create_collection(collection_name)
+    stored = source.metadata or {}
+    metadata = {
+        **{key: value for key, value in stored.items() if not key.startswith("hnsw:")},
+        **{HNSW_PARAMETERS[name]: value for name, value in validate_hnsw_params(params).items()}
+    }
+    changed = {
+        key for key in HNSW_DEFAULTS
+        if stored.get(key, HNSW_DEFAULTS[key]) != metadata.get(key, HNSW_DEFAULTS[key])
+    }
+    if not changed:
+        logging.info("'%s' already uses %s; nothing to rebuild.", collection_name, metadata)
+        return 0
+    # search_ef is read at query time, so the index can stay. Chroma rejects `hnsw:space` in modify()
+    # and replaces the whole metadata, so this only works where leaving it out keeps the space.
+    if changed == {"hnsw:search_ef"} and metadata.get("hnsw:space", HNSW_DEFAULTS["hnsw:space"]) == HNSW_DEFAULTS["hnsw:space"]:
+        source.modify(metadata={key: value for key, value in metadata.items() if key != "hnsw:space"})
+        chroma_db.collection_versions.bump_generation(collection_name)
+        logging.info("Set search_ef of '%s' to %s in place.", collection_name, metadata['hnsw:search_ef'])
+        return 0
+
+    staging_name = f"{collection_name}-rebuild"
+    retired_name = f"{collection_name}-retired"
+    # A staging collection is always partial; `-retired` was handled by _recover_swap
+    try:
+        chroma_db.client.delete_collection(name=staging_name)
+    except Exception:
+        pass
+    staging = chroma_db.client.create_collection(
+        name=staging_name, metadata=metadata, embedding_function=chroma_db.embedding_function
+    )
+
+    total = source.count()
+    start = time.perf_counter()
+    copied = 0
+    while True:
+        results = source.get(limit=batch_size, offset=copied, include=["embeddings", "documents", "metadatas"])
+        ids = results.get("ids") or []
+        if ids:
+            staging.add(
+                ids=ids,
+                documents=results["documents"],
+                metadatas=results["metadatas"],
+                embeddings=results["embeddings"]
+            )
+        copied += len(ids)
+        logging.info("Rebuilding '%s': %s/%s (%.0f records/s)", collection_name, copied, total, copied / (time.perf_counter() - start))
+        if len(ids) < batch_size:
+            break
+
+    # Other processes keep reading the old collection until they see the new generation
+    source.modify(name=retired_name)
+    staging.modify(name=collection_name)
+    chroma_db.collection_versions.bump_generation(collection_name)
+    chroma_db.invalidate_collection(collection_name)
+    chroma_db.delete_collection(retired_name)
+    logging.info("Rebuilt '%s' with %s in %.1fs.", collection_name, metadata, time.perf_counter() - start)
+    return copied
+
+if __name__ == "__main__":
+    from app.chromadb_utility import ChromaDBUtility
+    from app.maintenance import require_server_or_offline
+    parser = argparse.ArgumentParser(description="Rebuild a collection's HNSW index with new parameters.")
+    parser.add_argument("collection")
+    parser.add_argument("--space", choices=SPACES)
+    parser.add_argument("--M", type=int)
+    parser.add_argument("--construction-ef", type=int)
+    parser.add_argument("--search-ef", type=int)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--persist-directory", default=os.getenv("CHROMA_PERSIST_DIRECTORY", "./data"))
+    parser.add_argument("--offline", action="store_true", help="The app is stopped; open the persist directory directly")
+    args = parser.parse_args()
+    require_server_or_offline(args.offline)
+
+    logging.basicConfig(level=logging.INFO)
+    # Parameters from HNSW_CONFIG, overridden by the ones given here
+    config = load_hnsw_config()
+    params = {
+        **config.get(DEFAULT_KEY, {}),
+        **config.get(args.collection, {}),
+        **{
+            name: value for name, value in (
+                ("space", args.space), ("M", args.M),
+                ("construction_ef", args.construction_ef), ("search_ef", args.search_ef)
+            ) if value is not None
+        }
+    }
+    chroma_db = ChromaDBUtility(
+        persist_directory=args.persist_directory,
+        embedding_provider="none",
+        chroma_host=os.getenv("CHROMA_HOST"),
+        chroma_port=int(os.getenv("CHROMA_PORT", "8000"))
+    )
+    rebuild_collection(chroma_db, args.collection, params, batch_size=args.batch_size)
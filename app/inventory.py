@@ -1,11 +1,19 @@
 import logging
 import os
-import pandas as pd
-from flask_login import login_required
-from flask import Blueprint, jsonify, request, current_app, send_file, render_template
+from datetime import datetime
+from flask_login import login_required, current_user
+from flask import Blueprint, Response, jsonify, request, current_app, send_file, render_template
 from pydantic import ValidationError
-from app.models import InventoryItem, InventoryResponse
+from app.models import InventoryItem, StockMovement
+from app.ledger import DEFAULT_LOCATION, AmbiguousLocation
+from app.maintenance import CollectionBusy
+from app.write_queue import part_exists
 from app.decorators import role_required
+from app.pagination import parse_page_args
+from app.bulk_import import detect_format, read_rows, import_rows, parse_import_args
+from app.search import parse_search_args
+from app.snapshot import reporting_source
+from app.export import EXPORT_FORMATS, iter_csv, iter_jsonl, iter_json_page, write_export, temporary_export_path, cached_export
 
 inventory = Blueprint("inventory", __name__)
 
@@ -26,18 +34,26 @@ def add_item():
     try:
         data = request.json
         item = InventoryItem(**data)
-        logging.info(f"Adding item: {item.dict()}")
+        logging.info("Adding item: %s", item.dict())
     except ValidationError as e:
-        logging.error(f"Failed to validate item data: {e.errors()}")
+        logging.error("Failed to validate item data: %s", e.errors())
         return jsonify({"error": e.errors()}), 400
 
     try:
         # Check for duplicates
-        existing_items = chroma_db.get_all_items("inventory")
-        for existing_item in existing_items:
-            if existing_item.get("numero_parte") == item.numero_parte:
-                logging.warning(f"Duplicate numero_parte detected: {item.numero_parte}")
-                return jsonify({"error": "Numero Parte must be unique!"}), 400
+        write_queue = current_app.write_queue
+        if part_exists(chroma_db, write_queue, "inventory", item.numero_parte):
+            logging.warning("Duplicate numero_parte detected: %s", item.numero_parte)
+            return jsonify({"error": "Numero Parte must be unique!"}), 400
+
+        # Write-behind: embed and commit later in a batch
+        if write_queue:
+            op_id = write_queue.enqueue("inventory", "add", item.numero_parte, {
+                "descripcion": item.descripcion or item.numero_parte,
+                "metadata": {key: value for key, value in item.dict().items() if value is not None},
+                "new": chroma_db.find_item_id("inventory", item.numero_parte) is None
+            })
+            return jsonify({"message": "Item queued.", "operation_id": op_id}), 202
 
         # Add to ChromaDB
         chroma_db.add_item(
@@ -45,28 +61,119 @@ def add_item():
             descripcion=item.descripcion,
             metadata=item.dict()
         )
-        logging.info(f"Item added successfully: {item.dict()}")
+        logging.info("Item added successfully: %s", item.dict())
         return jsonify({"message": "Item added successfully!"}), 201
+    except CollectionBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
-        logging.error(f"Error adding item to ChromaDB: {str(e)}")
+        logging.error("Error adding item to ChromaDB: %s", e)
         return jsonify({"error": "Failed to add item to database"}), 500
 
+# Bulk Import Route
+@inventory.route("/bulk_import", methods=["POST"])
+@login_required
+@role_required(["admin", "engineer"])
+def bulk_import():
+    """Import inventory items from an uploaded CSV, XLSX or JSONL file."""
+    chroma_db = current_app.chroma_db
+    upload = request.files.get("file")
+    if not upload:
+        return jsonify({"error": "A file upload named 'file' is required"}), 400
+
+    try:
+        explicit_format, batch_size, upsert = parse_import_args(request.args, current_app.config["BULK_BATCH_SIZE"])
+        rows = read_rows(upload.stream, detect_format(upload.filename, explicit_format))
+    except ValueError as e:
+        logging.warning("Bulk import rejected: %s", e)
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        report = import_rows(chroma_db, "inventory", rows, batch_size=batch_size, upsert=upsert)
+        return jsonify(report), 200
+    except CollectionBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        logging.error("Error importing inventory: %s", e)
+        return jsonify({"error": "Failed to import inventory"}), 500
+
 # Get Inventory Route
 @inventory.route("/get_inventory", methods=["GET"])
 @login_required
 @role_required(["admin", "engineer", "inventory"])
 def get_inventory():
-    chroma_db = current_app.chroma_db
+    """List the inventory in natural part-number order, encoded straight from the inventory view.
+
+    Rows are validated when written and stored ready to serialize, so a page
+    is one indexed scan with no per-row models. `?all=true` streams the whole
+    inventory in keyed batches instead of one page.
+    """
+    chroma_db, snapshot = reporting_source(current_app, request.args)
+    stream_all = request.args.get("all", "false").lower() == "true"
     try:
-        raw_items = chroma_db.get_all_items("inventory")
-        items = [InventoryItem(**item) for item in raw_items if isinstance(item, dict)]
-        items = sorted(items, key=lambda x: int(x.numero_parte))
-        response = InventoryResponse(items=items)
-        return jsonify(response.dict())
+        limit, cursor = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    fields = {"snapshot": snapshot} if snapshot else {}
+    try:
+        view = chroma_db.inventory_view
+        if stream_all:
+            return Response(iter_json_page(view.iter_inventory_json(), next_cursor=None, **fields), mimetype="application/json")
+        rows, next_cursor = view.inventory_page_json(limit=limit, cursor=cursor)
+        return Response("".join(iter_json_page(rows, next_cursor=next_cursor, **fields)), mimetype="application/json")
     except Exception as e:
-        logging.error(f"Error retrieving inventory: {str(e)}")
+        logging.error("Error retrieving inventory: %s", e)
         return jsonify({"error": "Failed to retrieve inventory"}), 500
 
+@inventory.route("/lines", methods=["GET"])
+@login_required
+@role_required(["admin", "engineer", "inventory"])
+def list_lines():
+    """List inventory lines joined with their client, weight and units, one page at a time."""
+    try:
+        limit, cursor = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        lines, next_cursor = current_app.chroma_db.inventory_view.page(
+            limit=limit, cursor=cursor, cliente=request.args.get("cliente")
+        )
+        return jsonify({"items": lines, "next_cursor": next_cursor}), 200
+    except Exception as e:
+        logging.error("Error retrieving inventory lines: %s", e)
+        return jsonify({"error": "Failed to retrieve inventory lines"}), 500
+
+@inventory.route("/lines/totals", methods=["GET"])
+@login_required
+@role_required(["admin", "engineer", "inventory"])
+def client_totals():
+    """Return line count, quantity and total weight per client and weight unit."""
+    try:
+        return jsonify({"totals": current_app.chroma_db.inventory_view.client_totals(request.args.get("cliente"))}), 200
+    except Exception as e:
+        logging.error("Error retrieving client totals: %s", e)
+        return jsonify({"error": "Failed to retrieve client totals"}), 500
+
+# Search Route
+@inventory.route("/search", methods=["GET"])
+@login_required
+@role_required(["admin", "engineer", "inventory"])
+def search():
+    """Top-k similarity search over inventory descriptions."""
+    chroma_db = current_app.chroma_db
+    try:
+        query, k, filters = parse_search_args(request.args, "inventory")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        results, timing = chroma_db.search("inventory", query, n_results=k, filters=filters)
+        return jsonify({"results": results, "timing": timing}), 200
+    except Exception as e:
+        logging.error("Error searching inventory: %s", e)
+        return jsonify({"error": "Failed to search inventory"}), 500
+
 # Update Item Route
 @inventory.route("/update_item", methods=["PUT"])
 @login_required
@@ -78,25 +185,150 @@ def update_item():
         data = request.json
         updated_item = InventoryItem(**data)
     except ValidationError as e:
-        logging.error(f"Update validation failed: {e.errors()}")
+        logging.error("Update validation failed: %s", e.errors())
         return jsonify({"error": e.errors()}), 400
 
     try:
-        items = chroma_db.get_all_items("inventory")
-        for item in items:
-            if item.get("numero_parte") == updated_item.numero_parte:
-                chroma_db.get_or_create_collection("inventory").update(
-                    ids=[f"item_{updated_item.numero_parte}"],
-                    metadatas=[updated_item.dict()]
-                )
-                logging.info(f"Item updated successfully: {updated_item.dict()}")
-                return jsonify({"message": "Item updated successfully!"}), 200
+        write_queue = current_app.write_queue
+        if not part_exists(chroma_db, write_queue, "inventory", updated_item.numero_parte):
+            logging.warning("Item not found for update: %s", updated_item.numero_parte)
+            return jsonify({"error": "Item not found"}), 404
+
+        # Record a quantity change as an adjustment once the part is tracked by the ledger;
+        # the balance is read and adjusted in one ledger transaction
+        ledger = current_app.stock_ledger
+        on_hand = ledger.set_on_hand(
+            updated_item.numero_parte, updated_item.cantidad,
+            usuario=current_user.username, referencia="update_item"
+        )
+        if on_hand is not None:
+            chroma_db.apply_stock_quantities(ledger.on_hand_many([updated_item.numero_parte]))
+
+        if write_queue:
+            op_id = write_queue.enqueue("inventory", "update", updated_item.numero_parte, {
+                "metadata": {key: value for key, value in updated_item.dict().items() if value is not None}
+            })
+            return jsonify({"message": "Update queued.", "operation_id": op_id}), 202
+
+        item_id = chroma_db.find_item_id("inventory", updated_item.numero_parte)
+        chroma_db.update_item("inventory", item_id, updated_item.dict())
+        logging.info("Item updated successfully: %s", updated_item.dict())
+        return jsonify({"message": "Item updated successfully!"}), 200
+    except AmbiguousLocation as e:
+        # Which location the difference belongs to is ambiguous
+        return jsonify({"error": str(e), "locations": e.locations}), 409
+    except ValueError as e:
+        logging.warning("Stock adjustment rejected: %s", e)
+        return jsonify({"error": str(e)}), 409
+    except CollectionBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
-        logging.error(f"Error updating item: {str(e)}")
+        logging.error("Error updating item: %s", e)
         return jsonify({"error": "Failed to update item"}), 500
 
-    logging.warning(f"Item not found for update: {updated_item.numero_parte}")
-    return jsonify({"error": "Item not found"}), 404
+# Stock Movement Routes
+def opening_balances(chroma_db, ledger, numeros_parte):
+    """Stored quantities of the parts the ledger has not seen yet, to carry over as opening balances."""
+    quantities = {}
+    for numero_parte in numeros_parte:
+        if ledger.on_hand(numero_parte) is not None:
+            continue
+        item = chroma_db.get_item_by_numero_parte("inventory", numero_parte)
+        if item and item.get("cantidad"):
+            quantities[numero_parte] = int(item["cantidad"])
+    return quantities
+
+@inventory.route("/movements", methods=["POST"])
+@login_required
+@role_required(["admin", "engineer", "inventory"])
+def post_movements():
+    """Post one movement, or a batch under "movements", atomically."""
+    chroma_db = current_app.chroma_db
+    ledger = current_app.stock_ledger
+    data = request.json or {}
+
+    try:
+        movements = [StockMovement(**movement) for movement in data.get("movements", [data])]
+    except (ValidationError, TypeError) as e:
+        errors = e.errors() if isinstance(e, ValidationError) else str(e)
+        logging.error("Failed to validate movements: %s", errors)
+        return jsonify({"error": errors}), 400
+
+    numeros_parte = list(dict.fromkeys(movement.numero_parte for movement in movements))
+    missing = [
+        numero_parte for numero_parte in numeros_parte
+        if not part_exists(chroma_db, current_app.write_queue, "inventory", numero_parte)
+    ]
+    if missing:
+        return jsonify({"error": f"Unknown Numero Parte: {', '.join(missing)}"}), 404
+
+    try:
+        balances = ledger.post(
+            [movement.dict() for movement in movements],
+            usuario=current_user.username,
+            opening_balances=opening_balances(chroma_db, ledger, numeros_parte)
+        )
+        chroma_db.apply_stock_quantities(ledger.on_hand_many(numeros_parte))
+        return jsonify({"message": f"{len(movements)} movements posted.", "balances": balances}), 201
+    except ValueError as e:
+        logging.warning("Movements rejected: %s", e)
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        logging.error("Error posting movements: %s", e)
+        return jsonify({"error": "Failed to post movements"}), 500
+
+@inventory.route("/movements", methods=["GET"])
+@login_required
+@role_required(["admin", "engineer", "inventory"])
+def list_movements():
+    """Return the most recent movements of a part."""
+    numero_parte = request.args.get("numero_parte")
+    if not numero_parte:
+        return jsonify({"error": "Numero Parte is required"}), 400
+    try:
+        limit = min(int(request.args.get("limit", 100)), 1000)
+    except ValueError:
+        return jsonify({"error": "Limit must be an integer."}), 400
+    return jsonify({"numero_parte": numero_parte, "movements": current_app.stock_ledger.history(numero_parte, limit)}), 200
+
+@inventory.route("/stock", methods=["GET"])
+@login_required
+@role_required(["admin", "engineer", "inventory"])
+def get_stock():
+    """Return the on-hand quantity of a part, now or as of `?at=<ISO timestamp>`."""
+    ledger = current_app.stock_ledger
+    numero_parte = request.args.get("numero_parte")
+    ubicacion = request.args.get("ubicacion")
+    at = request.args.get("at")
+    if not numero_parte:
+        return jsonify({"error": "Numero Parte is required"}), 400
+
+    if at:
+        try:
+            timestamp = datetime.fromisoformat(at).timestamp()
+        except ValueError:
+            return jsonify({"error": "'at' must be an ISO 8601 timestamp."}), 400
+        on_hand = ledger.balance_at(numero_parte, timestamp, ubicacion)
+    else:
+        on_hand = ledger.on_hand(numero_parte, ubicacion)
+        if on_hand is None:
+            item = current_app.chroma_db.get_item_by_numero_parte("inventory", numero_parte)
+            if item is None:
+                return jsonify({"error": "Item not found"}), 404
+            on_hand = item.get("cantidad", 0) if not ubicacion or ubicacion == DEFAULT_LOCATION else 0
+    return jsonify({"numero_parte": numero_parte, "ubicacion": ubicacion, "at": at, "on_hand": on_hand}), 200
+
+@inventory.route("/stock/snapshot", methods=["POST"])
+@login_required
+@role_required(["admin"])
+def snapshot_stock():
+    """Snapshot current balances to speed up point-in-time queries."""
+    try:
+        current_app.stock_ledger.take_snapshot()
+        return jsonify({"message": "Snapshot taken."}), 201
+    except Exception as e:
+        logging.error("Error taking stock snapshot: %s", e)
+        return jsonify({"error": "Failed to take snapshot"}), 500
 
 # Delete Item Route
 @inventory.route("/delete_item", methods=["DELETE"])
@@ -111,29 +343,93 @@ def delete_item():
         return jsonify({"error": "Numero Parte is required"}), 400
 
     try:
-        chroma_db.get_or_create_collection("inventory").delete(ids=[f"item_{numero_parte}"])
-        logging.info(f"Item with numero_parte '{numero_parte}' deleted successfully")
+        write_queue = current_app.write_queue
+        if write_queue:
+            if not part_exists(chroma_db, write_queue, "inventory", numero_parte):
+                return jsonify({"error": "Item not found"}), 404
+            op_id = write_queue.enqueue("inventory", "delete", numero_parte, {})
+            return jsonify({"message": "Delete queued.", "operation_id": op_id}), 202
+
+        if not chroma_db.delete_by_numero_parte("inventory", numero_parte):
+            logging.warning("Item not found for delete: %s", numero_parte)
+            return jsonify({"error": "Item not found"}), 404
+        logging.info("Item with numero_parte '%s' deleted successfully", numero_parte)
         return jsonify({"message": "Item deleted successfully!"}), 200
+    except CollectionBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
-        logging.error(f"Error deleting item: {str(e)}")
+        logging.error("Error deleting item: %s", e)
         return jsonify({"error": "Failed to delete item"}), 500
 
+# Write-behind Operation Routes
+@inventory.route("/operations/<op_id>", methods=["GET"])
+@login_required
+@role_required(["admin", "engineer", "inventory"])
+def operation_status(op_id):
+    """Return the state of a queued write."""
+    write_queue = current_app.write_queue
+    status = write_queue.status(op_id) if write_queue else None
+    if status is None:
+        return jsonify({"error": "Operation not found"}), 404
+    return jsonify(status), 200
+
+@inventory.route("/operations", methods=["GET"])
+@login_required
+@role_required(["admin", "engineer", "inventory"])
+def operations_depth():
+    """Return how many queued writes have not been applied yet."""
+    write_queue = current_app.write_queue
+    return jsonify({"enabled": write_queue is not None, "depth": write_queue.depth() if write_queue else 0}), 200
+
 # Export Inventory
 @inventory.route("/export_inventory", methods=["GET"])
 @login_required
 @role_required(["admin", "engineer", "inventory"])
 def export_inventory():
-    chroma_db = current_app.chroma_db
+    """Export the inventory as XLSX, CSV or JSONL without holding it all in memory.
+
+    Rows come from the inventory view, so quantities are the stock ledger's
+    balances wherever it tracks the part.
+    """
+    chroma_db, snapshot = reporting_source(current_app, request.args)
+    snapshot_headers = {"X-Snapshot-Taken-At": snapshot["taken_at"]} if snapshot else {}
     output_folder = os.path.abspath("./exports")
-    os.makedirs(output_folder, exist_ok=True)
-    file_path = os.path.join(output_folder, "inventory.xlsx")
+    file_format = request.args.get("format", "xlsx").lower()
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    download_name = f"inventory.{file_format}"
+    columns = list(InventoryItem.__fields__)
 
     try:
-        items = chroma_db.get_all_items("inventory")
-        df = pd.DataFrame(items)
-        df.to_excel(file_path, index=False)
-        logging.info(f"Exported inventory to {file_path}")
-        return send_file(file_path, as_attachment=True, download_name="inventory.xlsx")
+        if request.args.get("cached", "false").lower() == "true":
+            # Cached files are keyed on the live collection version, so they are built from the primary
+            file_path = cached_export(
+                current_app.chroma_db, "inventory", columns, file_format, output_folder,
+                items_fn=current_app.chroma_db.inventory_view.iter_inventory
+            )
+            return send_file(file_path, as_attachment=True, download_name=download_name)
+
+        if file_format in ("csv", "jsonl"):
+            items = chroma_db.inventory_view.iter_inventory()
+            chunks = iter_csv(items, columns) if file_format == "csv" else iter_jsonl(items, columns)
+            logging.info("Streaming inventory export as %s", file_format)
+            return Response(
+                chunks,
+                mimetype=EXPORT_FORMATS[file_format],
+                headers={"Content-Disposition": f"attachment; filename={download_name}", **snapshot_headers}
+            )
+
+        file_path = temporary_export_path(output_folder, file_format)
+        try:
+            write_export(chroma_db.inventory_view.iter_inventory(), columns, file_format, file_path)
+            response = send_file(file_path, as_attachment=True, download_name=download_name)
+            response.headers.update(snapshot_headers)
+        except Exception:
+            os.remove(file_path)
+            raise
+        response.call_on_close(lambda: os.remove(file_path))
+        logging.info("Exported inventory to %s", file_path)
+        return response
     except Exception as e:
-        logging.error(f"Failed to export inventory: {str(e)}")
+        logging.error("Failed to export inventory: %s", e)
         return jsonify({"error": "Failed to export inventory"}), 500
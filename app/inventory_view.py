@@ -0,0 +1,368 @@
+import logging
+import re
+import threading
+from app.sqlite_utils import connect
+from app.pagination import decode_cursor, encode_cursor
+
+INVENTORY_FIELDS = ("cantidad", "descripcion")
+PARTES_FIELDS = ("cliente", "descripcion_ingles", "descripcion_espanol", "unidad_medida", "peso", "unidad_peso")
+LINE_COLUMNS = ("numero_parte",) + INVENTORY_FIELDS + PARTES_FIELDS + ("peso_total",)
+VIEW_COLLECTIONS = {"inventory": INVENTORY_FIELDS, "partes": PARTES_FIELDS}
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+# On-hand quantity of an inventory row: the stock ledger's when it tracks the part, else the stored one
+CANTIDAD = "COALESCE(q.cantidad, i.cantidad)"
+# Inventory rows as the API returns them, as columns and encoded by SQLite
+INVENTORY_COLUMNS = ("numero_parte", "cantidad", "descripcion")
+INVENTORY_SELECT = f"i.numero_parte, {CANTIDAD}, i.descripcion"
+INVENTORY_JSON = f"json_object('numero_parte', i.numero_parte, 'cantidad', {CANTIDAD}, 'descripcion', i.descripcion)"
+INVENTORY_FROM = "inventory_rows i LEFT JOIN stock_quantities q ON q.numero_parte = i.numero_parte"
+
+def sort_key(numero_parte):
+    """Natural sort key: digit runs compare by value, so "2" < "10" and "A9" < "A10" < "B1"."""
+    return re.sub(r"\d+", lambda match: match.group().lstrip("0").zfill(20), str(numero_parte))
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+class InventoryView:
+    """Inventory lines joined with their `partes` record, maintained on every write to either collection.
+
+    Base rows of both collections are mirrored into `inventory_rows` and
+    `partes_rows`. Each write re-joins only the part numbers it touched into
+    `inventory_lines` and applies the difference to `client_totals`, so
+    listings and per-client totals are a single scan with no join at read time.
+    Quantities from the stock ledger are kept apart in `stock_quantities` and
+    override the stored `cantidad`, so mirroring a record (bulk import,
+    reindex, rebuild) never reverts a balance to the stale value in Chroma.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = connect(db_path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS inventory_rows (
+                numero_parte TEXT PRIMARY KEY,
+                item_id TEXT NOT NULL,
+                cantidad INTEGER,
+                descripcion TEXT
+            );
+            CREATE INDEX IF NOT EXISTS inventory_rows_item ON inventory_rows (item_id);
+            CREATE TABLE IF NOT EXISTS partes_rows (
+                numero_parte TEXT PRIMARY KEY,
+                item_id TEXT NOT NULL,
+                cliente TEXT,
+                descripcion_ingles TEXT,
+                descripcion_espanol TEXT,
+                unidad_medida TEXT,
+                peso REAL,
+                unidad_peso TEXT
+            );
+            CREATE INDEX IF NOT EXISTS partes_rows_item ON partes_rows (item_id);
+            CREATE TABLE IF NOT EXISTS inventory_lines (
+                numero_parte TEXT PRIMARY KEY,
+                cantidad INTEGER,
+                descripcion TEXT,
+                cliente TEXT,
+                descripcion_ingles TEXT,
+                descripcion_espanol TEXT,
+                unidad_medida TEXT,
+                peso REAL,
+                unidad_peso TEXT,
+                peso_total REAL
+            );
+            CREATE INDEX IF NOT EXISTS inventory_lines_cliente ON inventory_lines (cliente, numero_parte);
+            CREATE TABLE IF NOT EXISTS client_totals (
+                cliente TEXT NOT NULL,
+                unidad_peso TEXT NOT NULL,
+                lineas INTEGER NOT NULL,
+                cantidad INTEGER NOT NULL,
+                peso_total REAL NOT NULL,
+                PRIMARY KEY (cliente, unidad_peso)
+            );
+            CREATE TABLE IF NOT EXISTS stock_quantities (
+                numero_parte TEXT PRIMARY KEY,
+                cantidad INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS view_sources (
+                collection TEXT PRIMARY KEY,
+                unmirrored INTEGER NOT NULL
+            );
+            """
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(inventory_rows)")]
+        if "orden" not in columns:
+            self.conn.execute("ALTER TABLE inventory_rows ADD COLUMN orden TEXT")
+            self.conn.executemany(
+                "UPDATE inventory_rows SET orden = ? WHERE numero_parte = ?",
+                [(sort_key(row[0]), row[0]) for row in self.conn.execute("SELECT numero_parte FROM inventory_rows")]
+            )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS inventory_rows_orden ON inventory_rows (orden, numero_parte)")
+
+    def _write(self, apply):
+        """Run `apply()` in one transaction; it returns the part numbers whose lines must be refreshed."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh_lines(apply())
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def put_many(self, collection_name, entries):
+        """Mirror written items from (item_id, metadata) pairs; missing fields keep their stored value."""
+        fields = VIEW_COLLECTIONS.get(collection_name)
+        if fields is None:
+            return
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" * (len(fields) + 2))
+        updates = ", ".join(f"{field} = COALESCE(excluded.{field}, {field})" for field in fields)
+        keyed = collection_name == "inventory"
+
+        def apply():
+            touched = set()
+            for item_id, metadata in entries:
+                if not metadata or not metadata.get("numero_parte"):
+                    continue
+                numero_parte = str(metadata["numero_parte"])
+                # A record whose part number changed leaves its old line behind otherwise
+                touched.update(self._numeros_parte(collection_name, "item_id", [item_id]))
+                self.conn.execute(
+                    f"DELETE FROM {collection_name}_rows WHERE item_id = ? AND numero_parte != ?",
+                    (item_id, numero_parte)
+                )
+                self.conn.execute(
+                    f"""
+                    INSERT INTO {collection_name}_rows (numero_parte, item_id, {columns}) VALUES ({placeholders})
+                    ON CONFLICT(numero_parte) DO UPDATE SET item_id = excluded.item_id, {updates}
+                    """,
+                    (numero_parte, item_id, *(metadata.get(field) for field in fields))
+                )
+                if keyed:
+                    self.conn.execute(
+                        "UPDATE inventory_rows SET orden = ? WHERE numero_parte = ?", (sort_key(numero_parte), numero_parte)
+                    )
+                touched.add(numero_parte)
+            return touched
+
+        self._write(apply)
+
+    def remove_item_id(self, collection_name, item_id):
+        """Drop the mirrored row of a deleted item."""
+        if collection_name not in VIEW_COLLECTIONS:
+            return
+
+        def apply():
+            touched = self._numeros_parte(collection_name, "item_id", [item_id])
+            self.conn.execute(f"DELETE FROM {collection_name}_rows WHERE item_id = ?", (item_id,))
+            return touched
+
+        self._write(apply)
+
+    def _put_quantities(self, quantities):
+        """Record ledger quantities from {numero_parte: cantidad}. Caller holds the lock."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO stock_quantities (numero_parte, cantidad) VALUES (?, ?)",
+            ((str(numero_parte), cantidad) for numero_parte, cantidad in quantities.items())
+        )
+
+    def set_quantities(self, quantities):
+        """Apply on-hand quantities from the stock ledger, {numero_parte: cantidad}, e.g. after stock movements."""
+        def apply():
+            self._put_quantities(quantities)
+            return {str(numero_parte) for numero_parte in quantities}
+
+        self._write(apply)
+
+    def numeros_parte(self):
+        """Return every mirrored inventory part number."""
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT numero_parte FROM inventory_rows")]
+
+    def rebuild(self, inventory_entries, partes_entries, quantities=None):
+        """Replace the whole view from the (item_id, metadata) pairs of every record of both collections in one transaction."""
+        def apply():
+            for table in ("inventory_rows", "partes_rows"):
+                self.conn.execute(f"DELETE FROM {table}")
+            for collection_name, entries in (("inventory", inventory_entries), ("partes", partes_entries)):
+                fields = VIEW_COLLECTIONS[collection_name]
+                self.conn.executemany(
+                    f"""
+                    INSERT OR REPLACE INTO {collection_name}_rows (numero_parte, item_id, {", ".join(fields)})
+                    VALUES ({", ".join("?" * (len(fields) + 2))})
+                    """,
+                    (
+                        (str(metadata["numero_parte"]), item_id, *(metadata.get(field) for field in fields))
+                        for item_id, metadata in entries
+                        if metadata and metadata.get("numero_parte")
+                    )
+                )
+                # Records without a part number or sharing one are not mirrored; remember how many
+                mirrored = self.conn.execute(f"SELECT COUNT(*) FROM {collection_name}_rows").fetchone()[0]
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO view_sources (collection, unmirrored) VALUES (?, ?)",
+                    (collection_name, len(entries) - mirrored)
+                )
+            self.conn.executemany(
+                "UPDATE inventory_rows SET orden = ? WHERE numero_parte = ?",
+                [(sort_key(row[0]), row[0]) for row in self.conn.execute("SELECT numero_parte FROM inventory_rows")]
+            )
+            if quantities:
+                self._put_quantities(quantities)
+            return None
+
+        self._write(apply)
+        logging.info("Rebuilt inventory view.")
+
+    def _numeros_parte(self, collection_name, column, values):
+        """Part numbers of mirrored rows matching `column IN values`. Caller holds the lock."""
+        found = set()
+        for chunk in _chunks(values):
+            rows = self.conn.execute(
+                f"SELECT numero_parte FROM {collection_name}_rows WHERE {column} IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+
+    def _refresh_lines(self, numeros_parte):
+        """Re-join the lines of some part numbers (all of them for None) and update client totals. Caller holds the lock."""
+        if numeros_parte is None:
+            self.conn.execute("DELETE FROM inventory_lines")
+            self.conn.execute("DELETE FROM client_totals")
+            self._insert_lines("", [])
+            self._apply_totals(self.conn.execute(
+                "SELECT cliente, unidad_peso, cantidad, peso_total FROM inventory_lines"
+            ).fetchall(), 1)
+            return
+
+        for chunk in _chunks(numeros_parte):
+            in_clause = f"numero_parte IN ({','.join('?' * len(chunk))})"
+            self._apply_totals(self.conn.execute(
+                f"SELECT cliente, unidad_peso, cantidad, peso_total FROM inventory_lines WHERE {in_clause}", chunk
+            ).fetchall(), -1)
+            self.conn.execute(f"DELETE FROM inventory_lines WHERE {in_clause}", chunk)
+            self._insert_lines(f"WHERE i.{in_clause}", chunk)
+            self._apply_totals(self.conn.execute(
+                f"SELECT cliente, unidad_peso, cantidad, peso_total FROM inventory_lines WHERE {in_clause}", chunk
+            ).fetchall(), 1)
+        self.conn.execute("DELETE FROM client_totals WHERE lineas <= 0")
+
+    def _insert_lines(self, where, params):
+        self.conn.execute(
+            f"""
+            INSERT INTO inventory_lines ({", ".join(LINE_COLUMNS)})
+            SELECT i.numero_parte, {CANTIDAD}, i.descripcion, p.cliente, p.descripcion_ingles,
+                   p.descripcion_espanol, p.unidad_medida, p.peso, p.unidad_peso, {CANTIDAD} * p.peso
+            FROM {INVENTORY_FROM} LEFT JOIN partes_rows p ON p.numero_parte = i.numero_parte
+            {where}
+            """,
+            params
+        )
+
+    def _apply_totals(self, lines, sign):
+        """Add (sign=1) or subtract (sign=-1) the contribution of some lines to `client_totals`."""
+        deltas = {}
+        for cliente, unidad_peso, cantidad, peso_total in lines:
+            totals = deltas.setdefault((cliente or "", unidad_peso or ""), [0, 0, 0.0])
+            totals[0] += sign
+            totals[1] += sign * (cantidad or 0)
+            totals[2] += sign * (peso_total or 0.0)
+        self.conn.executemany(
+            """
+            INSERT INTO client_totals (cliente, unidad_peso, lineas, cantidad, peso_total) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(cliente, unidad_peso) DO UPDATE SET
+                lineas = lineas + excluded.lineas,
+                cantidad = cantidad + excluded.cantidad,
+                peso_total = peso_total + excluded.peso_total
+            """,
+            ((cliente, unidad_peso, *totals) for (cliente, unidad_peso), totals in deltas.items())
+        )
+
+    def page(self, limit=100, cursor=None, cliente=None):
+        """Return one page of joined lines in natural part-number order, as (lines, next_cursor)."""
+        offset = decode_cursor(cursor)
+        where, params = ("WHERE l.cliente = ?", [cliente]) if cliente else ("", [])
+        with self.lock:
+            rows = self.conn.execute(
+                f"""
+                SELECT {', '.join(f'l.{column}' for column in LINE_COLUMNS)}
+                FROM inventory_lines l LEFT JOIN inventory_rows r ON r.numero_parte = l.numero_parte
+                {where} ORDER BY r.orden, l.numero_parte LIMIT ? OFFSET ?
+                """,
+                params + [limit, offset]
+            ).fetchall()
+        lines = [dict(zip(LINE_COLUMNS, row)) for row in rows]
+        next_cursor = encode_cursor(offset + len(lines)) if len(lines) == limit else None
+        return lines, next_cursor
+
+    def inventory_page_json(self, limit=100, cursor=None):
+        """Return one page of inventory rows in natural part-number order as (JSON strings, next_cursor)."""
+        offset = decode_cursor(cursor)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {INVENTORY_JSON} FROM {INVENTORY_FROM} ORDER BY i.orden, i.numero_parte LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        next_cursor = encode_cursor(offset + len(rows)) if len(rows) == limit else None
+        return [row[0] for row in rows], next_cursor
+
+    def iter_inventory(self, batch_size=1000):
+        """Yield every inventory row as a dict in natural part-number order, with ledger quantities applied."""
+        for row in self._iter_inventory(INVENTORY_SELECT, batch_size):
+            yield dict(zip(INVENTORY_COLUMNS, row))
+
+    def iter_inventory_json(self, batch_size=1000):
+        """Yield every inventory row as a JSON string in natural part-number order, one keyed batch at a time."""
+        for row in self._iter_inventory(INVENTORY_JSON, batch_size):
+            yield row[0]
+
+    def _iter_inventory(self, select, batch_size):
+        """Yield the `select` columns of every inventory row in natural part-number order, one keyed batch at a time."""
+        last = ("", "")
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    f"""
+                    SELECT i.orden, i.numero_parte, {select} FROM {INVENTORY_FROM}
+                    WHERE (i.orden, i.numero_parte) > (?, ?) ORDER BY i.orden, i.numero_parte LIMIT ?
+                    """,
+                    (*last, batch_size)
+                ).fetchall()
+            for row in rows:
+                yield row[2:]
+            if len(rows) < batch_size:
+                break
+            last = rows[-1][:2]
+
+    def client_totals(self, cliente=None):
+        """Return line count, quantity and total weight per client and weight unit."""
+        where, params = ("WHERE cliente = ?", (cliente,)) if cliente else ("", ())
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT cliente, unidad_peso, lineas, cantidad, peso_total FROM client_totals {where} ORDER BY cliente, unidad_peso",
+                params
+            ).fetchall()
+        return [
+            {"cliente": cliente or None, "unidad_peso": unidad_peso or None, "lineas": lineas, "cantidad": cantidad, "peso_total": peso_total}
+            for cliente, unidad_peso, lineas, cantidad, peso_total in rows
+        ]
+
+    def count(self, collection_name):
+        """Return the number of mirrored rows of a collection."""
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {collection_name}_rows").fetchone()[0]
+
+    def unmirrored(self, collection_name):
+        """Return how many records of a collection had no row of their own at the last rebuild."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT unmirrored FROM view_sources WHERE collection = ?", (collection_name,)
+            ).fetchone()
+        return row[0] if row else 0
@@ -0,0 +1,307 @@
+import logging
+import threading
+import time
+from app.sqlite_utils import connect
+
+MOVEMENT_TYPES = ("receipt", "issue", "adjustment", "transfer")
+DEFAULT_LOCATION = "main"
+# Keeps IN (...) lists well under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+class AmbiguousLocation(ValueError):
+    """Raised when a total quantity is set for a part whose stock is held at several locations."""
+
+    def __init__(self, message, locations):
+        super().__init__(message)
+        self.locations = locations
+
+class StockLedger:
+    """Append-only stock movement ledger with incrementally maintained on-hand balances.
+
+    Every movement is stored as one or two signed rows (a transfer writes an
+    outgoing and an incoming row). `balances` is updated in the same
+    transaction, so reading current stock is a single keyed lookup. Balances
+    are copied into `snapshots` every `snapshot_interval` rows; point-in-time
+    queries start from the closest earlier snapshot and replay what follows.
+    """
+
+    def __init__(self, db_path, snapshot_interval=10000):
+        self.db_path = db_path
+        self.snapshot_interval = snapshot_interval
+        self.lock = threading.Lock()
+        self.conn = connect(db_path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS movements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                numero_parte TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                cantidad INTEGER NOT NULL,
+                ubicacion TEXT NOT NULL,
+                referencia TEXT,
+                usuario TEXT,
+                created_at REAL NOT NULL,
+                balance_after INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS movements_part ON movements (numero_parte, id);
+            CREATE TABLE IF NOT EXISTS balances (
+                numero_parte TEXT NOT NULL,
+                ubicacion TEXT NOT NULL,
+                on_hand INTEGER NOT NULL,
+                last_movement_id INTEGER NOT NULL,
+                PRIMARY KEY (numero_parte, ubicacion)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                movement_id INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshot_balances (
+                snapshot_id INTEGER NOT NULL,
+                numero_parte TEXT NOT NULL,
+                ubicacion TEXT NOT NULL,
+                on_hand INTEGER NOT NULL,
+                PRIMARY KEY (snapshot_id, numero_parte, ubicacion)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    @staticmethod
+    def _entries(movement):
+        """Expand a movement into signed (ubicacion, delta) ledger entries."""
+        tipo = movement["tipo"]
+        cantidad = movement["cantidad"]
+        ubicacion = movement.get("ubicacion") or DEFAULT_LOCATION
+        if tipo not in MOVEMENT_TYPES:
+            raise ValueError(f"Unknown movement type '{tipo}'.")
+        if tipo == "adjustment":
+            return [(ubicacion, cantidad)]
+        if cantidad <= 0:
+            raise ValueError(f"Quantity of a {tipo} must be positive.")
+        if tipo == "receipt":
+            return [(ubicacion, cantidad)]
+        if tipo == "issue":
+            return [(ubicacion, -cantidad)]
+        destino = movement.get("ubicacion_destino")
+        if not destino or destino == ubicacion:
+            raise ValueError("A transfer needs a different 'ubicacion_destino'.")
+        return [(ubicacion, -cantidad), (destino, cantidad)]
+
+    def post(self, movements, usuario=None, opening_balances=None):
+        """Post movements atomically: either all of them are recorded or none.
+
+        `opening_balances` maps part numbers to a quantity that is recorded as
+        an opening adjustment first, but only if the ledger has never seen
+        that part. Raises ValueError if a movement is invalid or would leave a
+        location with negative stock. Returns the new balance of every touched
+        location.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                touched = {}
+                opening = []
+                for numero_parte, cantidad in (opening_balances or {}).items():
+                    seen = self.conn.execute(
+                        "SELECT 1 FROM balances WHERE numero_parte = ? LIMIT 1", (str(numero_parte),)
+                    ).fetchone()
+                    if not seen and cantidad:
+                        opening.append({
+                            "numero_parte": numero_parte,
+                            "tipo": "adjustment",
+                            "cantidad": cantidad,
+                            "referencia": "saldo inicial"
+                        })
+                for movement in opening + list(movements):
+                    self._apply(movement, usuario, now, touched)
+                self._maybe_snapshot(now)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [
+            {"numero_parte": numero_parte, "ubicacion": ubicacion, "on_hand": on_hand}
+            for (numero_parte, ubicacion), on_hand in touched.items()
+        ]
+
+    def _apply(self, movement, usuario, now, touched):
+        """Record one movement and update its balances. Caller holds the lock inside a transaction."""
+        numero_parte = str(movement["numero_parte"])
+        for ubicacion, delta in self._entries(movement):
+            row = self.conn.execute(
+                "SELECT on_hand FROM balances WHERE numero_parte = ? AND ubicacion = ?",
+                (numero_parte, ubicacion)
+            ).fetchone()
+            balance = (row[0] if row else 0) + delta
+            if balance < 0:
+                raise ValueError(
+                    f"Insufficient stock for '{numero_parte}' at '{ubicacion}': {balance - delta} on hand."
+                )
+            cursor = self.conn.execute(
+                """
+                INSERT INTO movements
+                    (numero_parte, tipo, cantidad, ubicacion, referencia, usuario, created_at, balance_after)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (numero_parte, movement["tipo"], delta, ubicacion, movement.get("referencia"), usuario, now, balance)
+            )
+            self.conn.execute(
+                """
+                INSERT INTO balances (numero_parte, ubicacion, on_hand, last_movement_id) VALUES (?, ?, ?, ?)
+                ON CONFLICT(numero_parte, ubicacion)
+                DO UPDATE SET on_hand = excluded.on_hand, last_movement_id = excluded.last_movement_id
+                """,
+                (numero_parte, ubicacion, balance, cursor.lastrowid)
+            )
+            touched[(numero_parte, ubicacion)] = balance
+
+    def set_on_hand(self, numero_parte, target, usuario=None, referencia=None):
+        """Bring the total stock of a tracked part to `target` with one adjustment, read and written in one transaction.
+
+        The adjustment goes to the only location holding stock (DEFAULT_LOCATION
+        when none does). Returns the new total, or None if the ledger has never
+        seen the part. Raises AmbiguousLocation if several locations hold stock
+        and the total differs, since the difference cannot be placed.
+        """
+        numero_parte = str(numero_parte)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                locations = dict(self.conn.execute(
+                    "SELECT ubicacion, on_hand FROM balances WHERE numero_parte = ?", (numero_parte,)
+                ).fetchall())
+                on_hand = sum(locations.values())
+                if locations and on_hand != target:
+                    held = [ubicacion for ubicacion, cantidad in locations.items() if cantidad]
+                    if len(held) > 1:
+                        raise AmbiguousLocation(
+                            f"Stock of '{numero_parte}' is held at several locations ({', '.join(sorted(held))}); "
+                            "post an adjustment per location to /inventory/movements.",
+                            locations
+                        )
+                    self._apply({
+                        "numero_parte": numero_parte,
+                        "tipo": "adjustment",
+                        "cantidad": target - on_hand,
+                        "ubicacion": held[0] if held else DEFAULT_LOCATION,
+                        "referencia": referencia
+                    }, usuario, now, {})
+                    self._maybe_snapshot(now)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return target if locations else None
+
+    def _maybe_snapshot(self, now):
+        """Snapshot balances once `snapshot_interval` rows were written since the last one. Caller holds the lock."""
+        last_movement_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM movements").fetchone()[0]
+        last_snapshot_id = self.conn.execute("SELECT COALESCE(MAX(movement_id), 0) FROM snapshots").fetchone()[0]
+        if last_movement_id - last_snapshot_id >= self.snapshot_interval:
+            self._write_snapshot(last_movement_id, now)
+
+    def _write_snapshot(self, movement_id, now):
+        """Copy current balances into a new snapshot. Caller holds the lock inside a transaction."""
+        cursor = self.conn.execute(
+            "INSERT INTO snapshots (movement_id, created_at) VALUES (?, ?)", (movement_id, now)
+        )
+        self.conn.execute(
+            """
+            INSERT INTO snapshot_balances (snapshot_id, numero_parte, ubicacion, on_hand)
+            SELECT ?, numero_parte, ubicacion, on_hand FROM balances
+            """,
+            (cursor.lastrowid,)
+        )
+        logging.info("Stock snapshot %s taken at movement %s.", cursor.lastrowid, movement_id)
+
+    def take_snapshot(self):
+        """Snapshot current balances now."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                movement_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM movements").fetchone()[0]
+                self._write_snapshot(movement_id, time.time())
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def on_hand(self, numero_parte, ubicacion=None):
+        """Return the current stock of a part, at one location or summed over all of them."""
+        with self.lock:
+            if ubicacion:
+                row = self.conn.execute(
+                    "SELECT on_hand FROM balances WHERE numero_parte = ? AND ubicacion = ?",
+                    (str(numero_parte), ubicacion)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT SUM(on_hand) FROM balances WHERE numero_parte = ?", (str(numero_parte),)
+                ).fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def locations(self, numero_parte):
+        """Return {ubicacion: on hand} of every location the ledger has seen a part at."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT ubicacion, on_hand FROM balances WHERE numero_parte = ?", (str(numero_parte),)
+            ).fetchall()
+        return dict(rows)
+
+    def on_hand_many(self, numeros_parte):
+        """Return {numero_parte: total on hand} for the parts that have ledger entries."""
+        numeros_parte = [str(numero_parte) for numero_parte in numeros_parte]
+        found = {}
+        with self.lock:
+            for start in range(0, len(numeros_parte), LOOKUP_CHUNK):
+                chunk = numeros_parte[start:start + LOOKUP_CHUNK]
+                rows = self.conn.execute(
+                    f"""
+                    SELECT numero_parte, SUM(on_hand) FROM balances
+                    WHERE numero_parte IN ({",".join("?" * len(chunk))}) GROUP BY numero_parte
+                    """,
+                    chunk
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def balance_at(self, numero_parte, timestamp, ubicacion=None):
+        """Return the stock of a part as of a Unix timestamp, replaying movements after the closest snapshot."""
+        numero_parte = str(numero_parte)
+        location_filter = " AND ubicacion = ?" if ubicacion else ""
+        location_args = (ubicacion,) if ubicacion else ()
+        with self.lock:
+            snapshot = self.conn.execute(
+                "SELECT id, movement_id FROM snapshots WHERE created_at <= ? ORDER BY id DESC LIMIT 1",
+                (timestamp,)
+            ).fetchone()
+            balance, after_movement_id = 0, 0
+            if snapshot:
+                after_movement_id = snapshot[1]
+                balance = self.conn.execute(
+                    f"SELECT COALESCE(SUM(on_hand), 0) FROM snapshot_balances WHERE snapshot_id = ? AND numero_parte = ?{location_filter}",
+                    (snapshot[0], numero_parte, *location_args)
+                ).fetchone()[0]
+            balance += self.conn.execute(
+                f"""
+                SELECT COALESCE(SUM(cantidad), 0) FROM movements
+                WHERE numero_parte = ? AND id > ? AND created_at <= ?{location_filter}
+                """,
+                (numero_parte, after_movement_id, timestamp, *location_args)
+            ).fetchone()[0]
+        return balance
+
+    def history(self, numero_parte, limit=100):
+        """Return the most recent movements of a part, newest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT id, tipo, cantidad, ubicacion, referencia, usuario, created_at, balance_after
+                FROM movements WHERE numero_parte = ? ORDER BY id DESC LIMIT ?
+                """,
+                (str(numero_parte), limit)
+            ).fetchall()
+        columns = ("id", "tipo", "cantidad", "ubicacion", "referencia", "usuario", "created_at", "balance_after")
+        return [dict(zip(columns, row)) for row in rows]
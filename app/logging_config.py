@@ -0,0 +1,94 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+
+_listener = None
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records without formatting them; the listener thread does the formatting."""
+
+    def prepare(self, record):
+        return record
+
+class SamplingFilter(logging.Filter):
+    """Let through only a fraction of records below WARNING."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+def parse_levels(spec):
+    """Parse "logger=LEVEL,other=LEVEL" into a dict."""
+    levels = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, level = entry.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging():
+    """Route all logging through a queue to a background listener writing rotated JSON lines and the console.
+
+    Configured by LOG_LEVEL, LOG_LEVELS ("logger=LEVEL,..."), LOG_FILE,
+    LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_CONSOLE_FORMAT (text|json) and
+    LOG_REQUEST_SAMPLE_RATE for the per-request "app.request" logger.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.getenv("LOG_FILE", "app.log"),
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    if os.getenv("LOG_CONSOLE_FORMAT", "text") == "json":
+        console_handler.setFormatter(JsonFormatter())
+    else:
+        console_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    for name, level in parse_levels(os.getenv("LOG_LEVELS", "werkzeug=WARNING,chromadb=WARNING")).items():
+        logging.getLogger(name).setLevel(level)
+
+    request_logger = logging.getLogger("app.request")
+    for existing in [f for f in request_logger.filters if isinstance(f, SamplingFilter)]:
+        request_logger.removeFilter(existing)
+    request_logger.addFilter(SamplingFilter(float(os.getenv("LOG_REQUEST_SAMPLE_RATE", "1.0"))))
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from app.sqlite_utils import connect
+
+class CollectionBusy(RuntimeError):
+    """Raised when a write targets a collection held by a maintenance job and should be retried later."""
+
+def require_server_or_offline(offline):
+    """Refuse to run a maintenance CLI on the embedded store while the app may be using it.
+
+    Without CHROMA_HOST the CLI would open a second embedded client on the
+    live persist directory; that is only safe with the app stopped (`--offline`).
+    """
+    if not os.getenv("CHROMA_HOST") and not offline:
+        raise SystemExit(
+            "CHROMA_HOST is not set: stop the app and pass --offline to work on the persist directory directly."
+        )
+
+class MaintenanceLeases:
+    """Cross-process leases that keep writes off a collection while a maintenance job rewrites it.
+
+    A job (reindex, HNSW rebuild, shard rebuild, language backfill) holds the
+    lease of a collection for its whole run; reads keep working. Writers call
+    `check_writable` and get CollectionBusy while another job holds it. The
+    leases are held in memory and re-read every `refresh_interval` seconds,
+    so `hold` waits that long plus `grace_seconds` after acquiring for writes
+    that already passed the check to land before the job starts.
+    """
+
+    def __init__(self, db_path, lease_seconds=60, refresh_interval=1.0, grace_seconds=5.0):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.refresh_interval = refresh_interval
+        self.grace_seconds = grace_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.lock = threading.Lock()
+        self.conn = connect(db_path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS maintenance_leases (
+                collection TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._leases = {}
+        self._loaded_at = None
+        # Collections held by jobs running on the current thread; their own writes are allowed
+        self._local = threading.local()
+
+    def _refresh(self):
+        """Reload the unexpired leases if they are older than `refresh_interval`. Caller holds the lock."""
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.refresh_interval:
+            rows = self.conn.execute(
+                "SELECT collection, owner, reason FROM maintenance_leases WHERE expires_at >= ?", (time.time(),)
+            ).fetchall()
+            self._leases = {collection: (owner, reason) for collection, owner, reason in rows}
+            self._loaded_at = now
+
+    def acquire(self, collection_name, reason):
+        """Take (or extend) the lease of a collection. Returns True if this process holds it."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO maintenance_leases (collection, owner, reason, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(collection) DO UPDATE SET
+                    owner = excluded.owner, reason = excluded.reason, expires_at = excluded.expires_at
+                WHERE maintenance_leases.owner = excluded.owner OR maintenance_leases.expires_at < ?
+                """,
+                (collection_name, self.owner, reason, now + self.lease_seconds, now)
+            )
+            row = self.conn.execute(
+                "SELECT owner, reason FROM maintenance_leases WHERE collection = ?", (collection_name,)
+            ).fetchone()
+            self._loaded_at = None
+        return row is not None and row[0] == self.owner
+
+    def release(self, collection_name):
+        """Give up the lease of a collection if this process holds it."""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM maintenance_leases WHERE collection = ? AND owner = ?", (collection_name, self.owner)
+            )
+            self._loaded_at = None
+
+    def holder(self, collection_name):
+        """Return (owner, reason) of the job holding a collection, or None."""
+        with self.lock:
+            self._refresh()
+            return self._leases.get(collection_name)
+
+    def check_writable(self, *collection_names):
+        """Raise CollectionBusy if a job other than one on this thread holds any of the collections."""
+        held_here = getattr(self._local, "held", ())
+        for collection_name in collection_names:
+            if collection_name in held_here:
+                continue
+            lease = self.holder(collection_name)
+            if lease is not None:
+                raise CollectionBusy(
+                    f"Collection '{collection_name}' is being rebuilt ({lease[1]}); try again shortly."
+                )
+
+    @contextmanager
+    def hold(self, collection_name, reason):
+        """Hold a collection's lease for the enclosed block, renewing it in the background.
+
+        Raises CollectionBusy if another job already holds it.
+        """
+        if not self.acquire(collection_name, reason):
+            lease = self.holder(collection_name)
+            raise CollectionBusy(
+                f"Collection '{collection_name}' is already held ({lease[1] if lease else 'unknown'})."
+            )
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(self.lease_seconds / 3):
+                try:
+                    if not self.acquire(collection_name, reason):
+                        logging.error("Maintenance lease on '%s' was lost.", collection_name)
+                except Exception as e:
+                    logging.error("Maintenance lease renewal on '%s' failed: %s", collection_name, e)
+
+        renewer = threading.Thread(target=renew, name=f"maintenance-{collection_name}", daemon=True)
+        renewer.start()
+        held = getattr(self._local, "held", set())
+        self._local.held = held | {collection_name}
+        try:
+            # Writes that passed the check just before the lease appeared finish first
+            time.sleep(self.refresh_interval + self.grace_seconds)
+            yield
+        finally:
+            self._local.held = held
+            done.set()
+            renewer.join()
+            self.release(collection_name)
@@ -0,0 +1,189 @@
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, in Prometheus semantics."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for labels, (bucket_counts, count, total) in self._series.items():
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    result.append((f"{self.name}_bucket", labels + (("le", repr(bound)),), bucket_count))
+                result.append((f"{self.name}_bucket", labels + (("le", "+Inf"),), count))
+                result.append((f"{self.name}_count", labels, count))
+                result.append((f"{self.name}_sum", labels, total))
+        return result
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time.
+
+    The callback returns a number, or a dict mapping label-value tuples to numbers.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.callback()
+        if not isinstance(value, dict):
+            return [(self.name, (), value)]
+        return [(self.name, tuple(zip(self.labelnames, key)), sample) for key, sample in value.items()]
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        """Add a metric, replacing any earlier one with the same name."""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "invectory_http_request_duration_seconds", "Request latency by endpoint.", ("endpoint", "method", "status")
+))
+CHROMA_OPERATION_SECONDS = REGISTRY.register(Histogram(
+    "invectory_chroma_operation_duration_seconds", "Chroma collection call latency.", ("collection", "operation")
+))
+CHROMA_UTILITY_SECONDS = REGISTRY.register(Histogram(
+    "invectory_chroma_utility_duration_seconds", "ChromaDBUtility method latency.", ("method",)
+))
+EMBEDDING_INFERENCE_SECONDS = REGISTRY.register(Histogram(
+    "invectory_embedding_inference_duration_seconds", "Embedding model inference latency per batch.", ("provider",)
+))
+EMBEDDING_TEXTS = REGISTRY.register(Counter(
+    "invectory_embedding_texts_total", "Texts sent to the embedding model.", ("provider",)
+))
+BCRYPT_SECONDS = REGISTRY.register(Histogram(
+    "invectory_bcrypt_duration_seconds", "bcrypt hashing and verification time.", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+))
+
+class InstrumentedCollection:
+    """Proxy around a Chroma collection that times every call to it.
+
+    With `reopen`, a call that fails because the collection no longer exists
+    (it was replaced under the same name) is retried once on the handle
+    `reopen()` returns.
+    """
+
+    OPERATIONS = ("add", "upsert", "update", "delete", "get", "query", "count", "peek", "modify")
+
+    def __init__(self, collection, reopen=None):
+        self._collection = collection
+        self._reopen = reopen
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name not in self.OPERATIONS:
+            return attribute
+
+        @functools.wraps(attribute)
+        def timed(*args, **kwargs):
+            with CHROMA_OPERATION_SECONDS.time(collection=self._collection.name, operation=name):
+                try:
+                    return getattr(self._collection, name)(*args, **kwargs)
+                except Exception as e:
+                    if self._reopen is None or "does not exist" not in str(e):
+                        raise
+                    self._collection = self._reopen()
+                    return getattr(self._collection, name)(*args, **kwargs)
+        return timed
+
+def instrument_methods(cls):
+    """Class decorator timing every public, non-generator method under CHROMA_UTILITY_SECONDS."""
+    for name, member in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(member) or inspect.isgeneratorfunction(member):
+            continue
+
+        def wrap(func, method_name):
+            @functools.wraps(func)
+            def timed(*args, **kwargs):
+                with CHROMA_UTILITY_SECONDS.time(method=method_name):
+                    return func(*args, **kwargs)
+            return timed
+        setattr(cls, name, wrap(member, name))
+    return cls
@@ -1,27 +1,17 @@
-import chromadb
-import uuid
-from chromadb_utility import ChromaDBUtility
 import logging
-from chromadb.utils import embedding_functions
-import logging
-import bcrypt
-
-def hash_password(password):
-    """Hash a password using bcrypt."""
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+from app.chromadb_utility import ChromaDBUtility
 
 def reset_users_collection():
     """Reset the `users` collection and ensure users have an `id`."""
     chroma_db = ChromaDBUtility()
-    default_ef = embedding_functions.DefaultEmbeddingFunction()
 
     try:
         # Delete the existing `users` collection
         try:
-            chroma_db.client.delete_collection(name="users")
+            chroma_db.delete_collection("users")
             logging.info("Deleted existing 'users' collection.")
         except Exception as e:
-            logging.warning(f"Error deleting 'users' collection (if it existed): {str(e)}")
+            logging.warning("Error deleting 'users' collection (if it existed): %s", e)
 
         # Recreate the `users` collection
         users_collection = chroma_db.get_or_create_collection("users")
@@ -29,7 +19,7 @@ def reset_users_collection():
 
         # Add the default admin user with explicit `id`
         admin_password = "admin"
-        hashed_password = hash_password(admin_password).decode("utf-8")
+        hashed_password = chroma_db.password_hasher.hash(admin_password)
         admin_metadata = {
             "id": "admin",  # Explicitly include the `id` in the metadata
             "username": "admin",
@@ -39,9 +29,9 @@ def reset_users_collection():
 
         # Generate embedding for the admin user
         try:
-            admin_embedding = default_ef(["admin"])[0]
+            admin_embedding = chroma_db.embedding_function(["admin"])[0]
         except Exception as e:
-            logging.error(f"Failed to generate embedding for admin: {str(e)}")
+            logging.error("Failed to generate embedding for admin: %s", e)
             raise
 
         # Add admin user to the collection
@@ -54,7 +44,7 @@ def reset_users_collection():
         logging.info("Default admin user created successfully (username: 'admin', password: 'admin').")
 
     except Exception as e:
-        logging.error(f"Failed to reset 'users' collection: {str(e)}")
+        logging.error("Failed to reset 'users' collection: %s", e)
         raise
 
 if __name__ == "__main__":
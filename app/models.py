@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List, Literal, Optional, Union
 
 class UserModel(BaseModel):
     username: str = Field(..., title="Username", min_length=3, max_length=50)
@@ -10,5 +10,28 @@ class InventoryItem(BaseModel):
     cantidad: int = Field(..., title="Quantity", ge=0)
     descripcion: str = Field(None, title="Description", min_length=1)
 
+class ParteItem(BaseModel):
+    cliente: str = Field(..., title="Client", min_length=1)
+    numero_parte: str = Field(..., title="Part Number", min_length=1)
+    descripcion_ingles: str = Field(None, title="English Description")
+    descripcion_espanol: str = Field(None, title="Spanish Description")
+    unidad_medida: str = Field(None, title="Unit of Measure")
+    peso: float = Field(None, title="Weight", ge=0)
+    unidad_peso: str = Field(None, title="Weight Unit")
+
+    def document(self):
+        """Build the embedding document for this part."""
+        return f"{self.numero_parte}: {self.descripcion_ingles} / {self.descripcion_espanol}"
+
+class StockMovement(BaseModel):
+    numero_parte: str = Field(..., title="Part Number", min_length=1)
+    tipo: Literal["receipt", "issue", "adjustment", "transfer"] = Field(..., title="Movement Type")
+    cantidad: int = Field(..., title="Quantity")
+    ubicacion: Optional[str] = Field(None, title="Location")
+    ubicacion_destino: Optional[str] = Field(None, title="Destination Location")
+    referencia: Optional[str] = Field(None, title="Reference")
+
 class InventoryResponse(BaseModel):
     items: List[InventoryItem]
+    next_cursor: Optional[str] = None
+    snapshot: Optional[Dict[str, Union[str, float]]] = None
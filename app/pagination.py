@@ -0,0 +1,30 @@
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(offset):
+    """Encode a collection offset as an opaque cursor string."""
+    return str(offset)
+
+def decode_cursor(cursor):
+    """Decode a cursor string back into a collection offset."""
+    if not cursor:
+        return 0
+    try:
+        offset = int(cursor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: '{cursor}'")
+    if offset < 0:
+        raise ValueError(f"Invalid cursor: '{cursor}'")
+    return offset
+
+def parse_page_args(args):
+    """Read `cursor` and `limit` from request args, returning (limit, cursor)."""
+    cursor = args.get("cursor") or None
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError("Limit must be an integer.")
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"Limit must be between 1 and {MAX_PAGE_SIZE}.")
+    decode_cursor(cursor)
+    return limit, cursor
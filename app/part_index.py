@@ -0,0 +1,115 @@
+import logging
+import threading
+from app.sqlite_utils import connect
+
+INDEXED_COLLECTIONS = ("inventory", "partes")
+
+class PartIndex:
+    """Exact-match index from `numero_parte` to record id, stored next to `chroma.sqlite3`."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = connect(db_path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS part_index (
+                collection TEXT NOT NULL,
+                numero_parte TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                PRIMARY KEY (collection, numero_parte)
+            );
+            CREATE TABLE IF NOT EXISTS part_index_sources (
+                collection TEXT PRIMARY KEY,
+                unindexed INTEGER NOT NULL
+            );
+            """
+        )
+
+    def lookup(self, collection_name, numero_parte):
+        """Return the record id for a `numero_parte`, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT item_id FROM part_index WHERE collection = ? AND numero_parte = ?",
+                (collection_name, str(numero_parte))
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, collection_name, numero_parte, item_id):
+        """Point a `numero_parte` at a record id."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO part_index (collection, numero_parte, item_id) VALUES (?, ?, ?)",
+                (collection_name, str(numero_parte), item_id)
+            )
+
+    def put_many(self, collection_name, entries):
+        """Point many part numbers at record ids from (numero_parte, item_id) pairs."""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO part_index (collection, numero_parte, item_id) VALUES (?, ?, ?)",
+                ((collection_name, str(numero_parte), item_id) for numero_parte, item_id in entries)
+            )
+
+    def remove(self, collection_name, numero_parte):
+        """Drop the entry for a `numero_parte`."""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM part_index WHERE collection = ? AND numero_parte = ?",
+                (collection_name, str(numero_parte))
+            )
+
+    def remove_item_id(self, collection_name, item_id):
+        """Drop every entry that points at a record id."""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM part_index WHERE collection = ? AND item_id = ?",
+                (collection_name, item_id)
+            )
+
+    def count(self, collection_name):
+        """Return the number of indexed part numbers in a collection."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM part_index WHERE collection = ?", (collection_name,)
+            ).fetchone()[0]
+
+    def unindexed(self, collection_name):
+        """Return how many records of a collection had no entry of their own at the last rebuild.
+
+        Records without a `numero_parte`, and duplicates of one, collapse into
+        no entry or a shared one, so the index is expected to hold this many
+        fewer rows than the collection has records.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT unindexed FROM part_index_sources WHERE collection = ?", (collection_name,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def rebuild(self, collection_name, entries, source_count=None):
+        """Replace the index of a collection with (numero_parte, item_id) pairs in one transaction.
+
+        `source_count` is the number of records the entries were read from.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute("DELETE FROM part_index WHERE collection = ?", (collection_name,))
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO part_index (collection, numero_parte, item_id) VALUES (?, ?, ?)",
+                    ((collection_name, str(numero_parte), item_id) for numero_parte, item_id in entries)
+                )
+                if source_count is not None:
+                    indexed = self.conn.execute(
+                        "SELECT COUNT(*) FROM part_index WHERE collection = ?", (collection_name,)
+                    ).fetchone()[0]
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO part_index_sources (collection, unindexed) VALUES (?, ?)",
+                        (collection_name, source_count - indexed)
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        logging.info("Rebuilt part index for collection '%s'.", collection_name)
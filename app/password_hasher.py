@@ -0,0 +1,46 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from app.metrics import BCRYPT_SECONDS
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when the bcrypt pool is saturated and a request should be retried later."""
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool so hashing never takes more than `max_workers` cores.
+
+    At most `max_workers + max_pending` operations are admitted at a time;
+    callers that cannot get a slot within `queue_timeout` seconds get
+    PasswordHasherBusy instead of piling up behind the pool.
+    """
+
+    def __init__(self, rounds=12, max_workers=2, max_pending=32, queue_timeout=2.0):
+        self.rounds = rounds
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self.slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def _run(self, operation, func, *args):
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            raise PasswordHasherBusy("Too many concurrent password operations, try again shortly.")
+
+        def timed():
+            with BCRYPT_SECONDS.time(operation=operation):
+                return func(*args)
+
+        try:
+            future = self.executor.submit(timed)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future.result()
+
+    def hash(self, password):
+        """Hash a plain-text password, returning the bcrypt hash as a string."""
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run("hash", bcrypt.hashpw, password.encode("utf-8"), salt).decode("utf-8")
+
+    def verify(self, password, hashed_password):
+        """Check a plain-text password against a bcrypt hash."""
+        return self._run("verify", bcrypt.checkpw, password.encode("utf-8"), hashed_password.encode("utf-8"))
@@ -0,0 +1,235 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from app.sqlite_utils import connect
+from app.maintenance import require_server_or_offline
+from app.part_index import INDEXED_COLLECTIONS
+from app.bilingual import TRANSLATIONS_COLLECTION, language_record_ids, language_records
+
+class ReindexState:
+    """Records which items of a collection still have to move to their deterministic id, so a run can resume."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = connect(db_path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reindex_pending (
+                collection TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (collection, item_id)
+            )
+            """
+        )
+
+    def planned(self, collection_name):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM reindex_pending WHERE collection = ?", (collection_name,)
+            ).fetchone()[0] > 0
+
+    def plan(self, collection_name, item_ids):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO reindex_pending (collection, item_id) VALUES (?, ?)",
+                ((collection_name, item_id) for item_id in item_ids)
+            )
+
+    def next_batch(self, collection_name, batch_size):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_id FROM reindex_pending WHERE collection = ? AND done = 0 ORDER BY item_id LIMIT ?",
+                (collection_name, batch_size)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_done(self, collection_name, item_ids):
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE reindex_pending SET done = 1 WHERE collection = ? AND item_id = ?",
+                ((collection_name, item_id) for item_id in item_ids)
+            )
+
+    def progress(self, collection_name):
+        """Return (done, total) for a collection."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COALESCE(SUM(done), 0), COUNT(*) FROM reindex_pending WHERE collection = ?", (collection_name,)
+            ).fetchone()
+
+    def clear(self, collection_name):
+        with self.lock:
+            self.conn.execute("DELETE FROM reindex_pending WHERE collection = ?", (collection_name,))
+
+def plan_reindex(chroma_db, collection_name, state, page_size=500):
+    """Record every item whose id differs from the one `new_item_id` gives its `numero_parte`."""
+    collection = chroma_db.get_or_create_collection(collection_name)
+    offset = 0
+    while True:
+        results = collection.get(limit=page_size, offset=offset, include=["metadatas"])
+        ids = results.get("ids") or []
+        state.plan(collection_name, [
+            item_id for item_id, metadata in zip(ids, results.get("metadatas") or [])
+            if metadata and metadata.get("numero_parte")
+            and item_id != chroma_db.new_item_id(collection_name, metadata["numero_parte"])
+        ])
+        if len(ids) < page_size:
+            break
+        offset += page_size
+
+def _move_batch(chroma_db, collection_name, item_ids):
+    """Move a batch of items to their deterministic ids, reusing stored embeddings. Returns (moved, reembedded)."""
+    collection = chroma_db.get_or_create_collection(collection_name)
+    source = collection.get(ids=item_ids, include=["embeddings", "documents", "metadatas"])
+    if not source["ids"]:
+        return 0, 0
+
+    # Several records of one part number collapse into one; the first of the batch is kept
+    rows = {}
+    for old_id, document, metadata, embedding in zip(
+        source["ids"], source["documents"], source["metadatas"], source["embeddings"]
+    ):
+        rows.setdefault(chroma_db.new_item_id(collection_name, metadata["numero_parte"]), (old_id, document, metadata, embedding))
+    new_ids = list(rows)
+    # Records already stored under the target id (e.g. written by the old update path) win on
+    # metadata and document; their vector is only recomputed if the document differs.
+    existing = collection.get(ids=new_ids, include=["documents", "metadatas"])
+    targets = {item_id: (document, metadata) for item_id, document, metadata in zip(
+        existing["ids"], existing["documents"], existing["metadatas"]
+    )}
+
+    documents, metadatas, embeddings, reembed = [], [], [], []
+    for index, (new_id, (_, document, metadata, embedding)) in enumerate(rows.items()):
+        if new_id in targets:
+            target_document, target_metadata = targets[new_id]
+            metadata = {**metadata, **(target_metadata or {})}
+            if target_document and target_document != document:
+                document = target_document
+                reembed.append(index)
+        documents.append(document)
+        metadatas.append(metadata)
+        embeddings.append(embedding)
+    if reembed:
+        for index, embedding in zip(reembed, chroma_db.embedding_function([documents[index] for index in reembed])):
+            embeddings[index] = embedding
+
+    collection.upsert(ids=new_ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+    # Lookups resolve to the new records before the old ones disappear
+    chroma_db.part_index.put_many(
+        collection_name, [(metadata["numero_parte"], new_id) for new_id, metadata in zip(new_ids, metadatas)]
+    )
+    chroma_db.inventory_view.put_many(collection_name, list(zip(new_ids, metadatas)))
+
+    if collection_name == "partes":
+        _move_language_records(chroma_db, [row[0] for row in rows.values()], new_ids, metadatas, reembed)
+        dropped = [item_id for item_id in source["ids"] if item_id not in {row[0] for row in rows.values()}]
+        if dropped:
+            chroma_db.get_or_create_collection(TRANSLATIONS_COLLECTION).delete(
+                ids=[record_id for item_id in dropped for record_id in language_record_ids(item_id)]
+            )
+
+    stale = [item_id for item_id in source["ids"] if item_id not in rows]
+    if stale:
+        collection.delete(ids=stale)
+    if collection_name == "partes" and chroma_db.part_shards:
+        chroma_db.part_shards.write(new_ids, documents, metadatas, embeddings)
+        for item_id, metadata in zip(source["ids"], source["metadatas"]):
+            if item_id in stale:
+                chroma_db.part_shards.delete(item_id, metadata.get("cliente"))
+    return len(new_ids), len(reembed)
+
+def _move_language_records(chroma_db, old_ids, new_ids, metadatas, reembed):
+    """Carry the per-language records of moved parts over to the new part ids."""
+    translations = chroma_db.get_or_create_collection(TRANSLATIONS_COLLECTION)
+    old_record_ids = [record_id for old_id in old_ids for record_id in language_record_ids(old_id)]
+    stored = translations.get(ids=old_record_ids, include=["embeddings"])
+    stored_embeddings = dict(zip(stored["ids"], stored["embeddings"]))
+
+    record_ids, documents, record_metadatas = language_records(new_ids, metadatas)
+    old_by_new = {
+        new_record_id: old_record_id
+        for old_id, new_id in zip(old_ids, new_ids)
+        for old_record_id, new_record_id in zip(language_record_ids(old_id), language_record_ids(new_id))
+    }
+    changed = {new_ids[index] for index in reembed}
+    embeddings = [
+        None if part_id in changed else stored_embeddings.get(old_by_new[record_id])
+        for record_id, part_id in zip(record_ids, (metadata["part_id"] for metadata in record_metadatas))
+    ]
+    missing = [index for index, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        for index, embedding in zip(missing, chroma_db.embedding_function([documents[index] for index in missing])):
+            embeddings[index] = embedding
+    stale = [record_id for record_id in old_record_ids if record_id not in old_by_new]
+    if stale:
+        translations.delete(ids=stale)
+    if record_ids:
+        translations.upsert(ids=record_ids, documents=documents, metadatas=record_metadatas, embeddings=embeddings)
+
+def reindex_collection(chroma_db, collection_name, state, batch_size=256):
+    """Move every item of a collection to its deterministic id in batches, resuming an interrupted run.
+
+    The collection's maintenance lease is held for the whole run: reads keep
+    working, while writes get CollectionBusy (HTTP 503) and queued writes
+    wait, so no update can land on a record between its copy and its delete.
+    Within a batch the indexes are repointed at the new ids before the old
+    records are deleted. Ledger quantities are kept in the view's overlay,
+    so the stored `cantidad` copied here never replaces them.
+    """
+    with chroma_db.maintenance.hold(collection_name, "reindex"):
+        return _reindex_collection(chroma_db, collection_name, state, batch_size)
+
+def _reindex_collection(chroma_db, collection_name, state, batch_size):
+    if not state.planned(collection_name):
+        plan_reindex(chroma_db, collection_name, state)
+    done, total = state.progress(collection_name)
+    logging.info("Reindexing '%s': %s of %s items left.", collection_name, total - done, total)
+
+    start = time.perf_counter()
+    moved = reembedded = 0
+    while True:
+        batch = state.next_batch(collection_name, batch_size)
+        if not batch:
+            break
+        batch_moved, batch_reembedded = _move_batch(chroma_db, collection_name, batch)
+        state.mark_done(collection_name, batch)
+        moved += batch_moved
+        reembedded += batch_reembedded
+        done, total = state.progress(collection_name)
+        logging.info(
+            "Reindexing '%s': %s/%s (%.0f items/s, %s re-embedded)",
+            collection_name, done, total, moved / (time.perf_counter() - start), reembedded
+        )
+
+    chroma_db.collection_versions.bump(collection_name)
+    state.clear(collection_name)
+    seconds = time.perf_counter() - start
+    report = {
+        "collection": collection_name,
+        "moved": moved,
+        "reembedded": reembedded,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(moved / seconds, 1) if seconds else None
+    }
+    logging.info("Reindexed '%s': %s", collection_name, report)
+    return report
+
+if __name__ == "__main__":
+    from app.chromadb_utility import ChromaDBUtility
+    parser = argparse.ArgumentParser(description="Move records to deterministic ids, reusing their embeddings.")
+    parser.add_argument("--collection", action="append", choices=INDEXED_COLLECTIONS)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--persist-directory", default=os.getenv("CHROMA_PERSIST_DIRECTORY", "./data"))
+    parser.add_argument("--offline", action="store_true", help="The app is stopped; open the persist directory directly")
+    args = parser.parse_args()
+    require_server_or_offline(args.offline)
+
+    logging.basicConfig(level=logging.INFO)
+    chroma_db = ChromaDBUtility(persist_directory=args.persist_directory, chroma_host=os.getenv("CHROMA_HOST"))
+    state = ReindexState(os.path.join(chroma_db.persist_directory, "reindex_state.sqlite3"))
+    for collection_name in args.collection or INDEXED_COLLECTIONS:
+        reindex_collection(chroma_db, collection_name, state, batch_size=args.batch_size)
@@ -27,7 +27,7 @@ def main_menu():
                 user_identity = json.loads(user_identity)
 
             # Render the main menu template
-            logging.info(f"Authenticated user: {user_identity}. Rendering main_menu.html.")
+            logging.info("Authenticated user: %s. Rendering main_menu.html.", user_identity)
             return render_template("main_menu.html", user=user_identity)
 
         # Redirect unauthenticated users to manage page
@@ -35,7 +35,7 @@ def main_menu():
         return redirect(url_for("user.manage_user"))
 
     except Exception as e:
-        logging.error(f"Error in main_menu: {str(e)}")
+        logging.error("Error in main_menu: %s", e)
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 # Inventory Route
@@ -0,0 +1,27 @@
+DEFAULT_TOP_K = 10
+MAX_TOP_K = 100
+
+# Metadata fields each collection may be filtered on
+SEARCH_FILTERS = {
+    "inventory": ("numero_parte",),
+    "partes": ("cliente", "unidad_medida", "unidad_peso"),
+}
+
+def parse_search_args(args, collection_name):
+    """Read `q`, `k` and metadata filters from request args, returning (query, k, filters)."""
+    query = (args.get("q") or "").strip()
+    if not query:
+        raise ValueError("Query parameter 'q' is required.")
+    try:
+        k = int(args.get("k", DEFAULT_TOP_K))
+    except (TypeError, ValueError):
+        raise ValueError("k must be an integer.")
+    if k < 1 or k > MAX_TOP_K:
+        raise ValueError(f"k must be between 1 and {MAX_TOP_K}.")
+    filters = {}
+    for key in SEARCH_FILTERS[collection_name]:
+        # Repeating a filter (?cliente=a&cliente=b) matches any of its values
+        values = [value for value in (args.getlist(key) if hasattr(args, "getlist") else [args.get(key)]) if value]
+        if values:
+            filters[key] = values[0] if len(values) == 1 else values
+    return query, k, filters
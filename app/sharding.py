@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SHARD_PREFIX = "partes__"
+# How long a shard found missing is taken as missing before asking the store again
+MISSING_TTL = 5.0
+
+def shard_name(cliente):
+    """Collection name of a client's shard; the hash keeps clients that slug alike apart."""
+    slug = re.sub(r"[^a-z0-9_-]+", "_", str(cliente).lower()).strip("_-")[:40]
+    digest = hashlib.sha1(str(cliente).encode("utf-8")).hexdigest()[:8]
+    return f"{SHARD_PREFIX}{slug}_{digest}" if slug else f"{SHARD_PREFIX}{digest}"
+
+class PartShards:
+    """Per-client copies of the `partes` records, so one client's searches and listings only touch its vectors.
+
+    `partes` stays the source of truth; shards are written next to it with
+    the same embeddings (no extra inference) the way `partes_lang` is.
+    Queries over several clients run on a thread pool, one per shard, and
+    the per-shard top-k lists are merged by distance. Shards created by
+    other processes are found on a cache miss, so every worker sees them.
+    """
+
+    def __init__(self, chroma_db, max_workers=8):
+        self.chroma_db = chroma_db
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="partes-shard")
+        self._known = set()
+        self._missing = {}
+        self._known_lock = threading.Lock()
+
+    def collection(self, cliente):
+        """Return the shard collection of a client."""
+        return self.chroma_db.get_or_create_collection(shard_name(cliente))
+
+    def names(self):
+        """Return the names of every existing shard collection, as listed by the store."""
+        names = {
+            name for name in (getattr(c, "name", c) for c in self.chroma_db.client.list_collections())
+            if name.startswith(SHARD_PREFIX)
+        }
+        with self._known_lock:
+            self._known |= names
+        return names
+
+    def exists(self, name):
+        """Whether a shard collection exists, asking the store when this process has not seen it yet."""
+        with self._known_lock:
+            if name in self._known:
+                return True
+            checked_at = self._missing.get(name)
+            if checked_at is not None and time.monotonic() - checked_at < MISSING_TTL:
+                return False
+        try:
+            self.chroma_db.client.get_collection(name=name, embedding_function=self.chroma_db.embedding_function)
+        except Exception:
+            with self._known_lock:
+                self._missing[name] = time.monotonic()
+            return False
+        with self._known_lock:
+            self._known.add(name)
+            self._missing.pop(name, None)
+        return True
+
+    def write(self, ids, documents, metadatas, embeddings):
+        """Upsert records into the shards of their clients."""
+        groups = {}
+        for item_id, document, metadata, embedding in zip(ids, documents, metadatas, embeddings):
+            cliente = (metadata or {}).get("cliente")
+            if cliente:
+                group = groups.setdefault(cliente, ([], [], [], []))
+                for values, value in zip(group, (item_id, document, metadata, embedding)):
+                    values.append(value)
+        for cliente, (group_ids, group_documents, group_metadatas, group_embeddings) in groups.items():
+            self.collection(cliente).upsert(
+                ids=group_ids, documents=group_documents, metadatas=group_metadatas, embeddings=group_embeddings
+            )
+            with self._known_lock:
+                self._known.add(shard_name(cliente))
+                self._missing.pop(shard_name(cliente), None)
+
+    def copy_from_partes(self, item_ids, previous_clientes=None):
+        """Copy stored `partes` records into their shards, dropping them from the shards they moved out of."""
+        results = self.chroma_db.get_or_create_collection("partes").get(
+            ids=item_ids, include=["embeddings", "documents", "metadatas"]
+        )
+        self.write(results["ids"], results["documents"], results["metadatas"], results["embeddings"])
+        current = {item_id: (metadata or {}).get("cliente") for item_id, metadata in zip(results["ids"], results["metadatas"])}
+        for item_id, cliente in (previous_clientes or {}).items():
+            if cliente and cliente != current.get(item_id):
+                self.delete(item_id, cliente)
+
+    def delete(self, item_id, cliente):
+        """Remove a record from a client's shard."""
+        if cliente and self.exists(shard_name(cliente)):
+            self.collection(cliente).delete(ids=[item_id])
+
+    def query(self, embedding, clientes, n_results=10, where=None):
+        """Top-k over the shards of `clientes`, queried in parallel. Returns (ids, distances, metadatas) best first."""
+        shards = [shard_name(cliente) for cliente in clientes if self.exists(shard_name(cliente))]
+
+        def query_shard(name):
+            return self.chroma_db.get_or_create_collection(name).query(
+                query_embeddings=[embedding],
+                n_results=n_results,
+                where=where,
+                include=["metadatas", "distances"]
+            )
+
+        merged = []
+        for results in self.executor.map(query_shard, shards):
+            merged.extend(zip(results["distances"][0], results["ids"][0], results["metadatas"][0]))
+        merged.sort(key=lambda match: match[0])
+        merged = merged[:n_results]
+        return [item_id for _, item_id, _ in merged], [distance for distance, _, _ in merged], [metadata for _, _, metadata in merged]
+
+    def count(self):
+        """Return the number of records over all shards."""
+        return sum(self.chroma_db.get_or_create_collection(name).count() for name in self.names())
+
+    def expected_count(self, page_size=5000):
+        """Return the number of `partes` records that belong in a shard, i.e. that have a client."""
+        partes = self.chroma_db.get_or_create_collection("partes")
+        total = offset = 0
+        while True:
+            ids = partes.get(where={"cliente": {"$ne": ""}}, limit=page_size, offset=offset, include=[])["ids"]
+            total += len(ids)
+            if len(ids) < page_size:
+                return total
+            offset += page_size
+
+    def rebuild(self, batch_size=500):
+        """Refill the shards from `partes`, reusing its stored embeddings, then drop records no longer in `partes`.
+
+        Existing shards are kept and overwritten in place, so readers in other
+        processes never hit a deleted collection. Run it while holding the
+        `partes` maintenance lease (see `ensure_part_shards` and `python -m app.sharding`).
+        """
+        partes = self.chroma_db.get_or_create_collection("partes")
+        expected = {}
+        offset = 0
+        while True:
+            results = partes.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+            ids = results.get("ids") or []
+            self.write(ids, results["documents"], results["metadatas"], results["embeddings"])
+            for item_id, metadata in zip(ids, results["metadatas"]):
+                if (metadata or {}).get("cliente"):
+                    expected.setdefault(shard_name(metadata["cliente"]), set()).add(item_id)
+            offset += len(ids)
+            if len(ids) < batch_size:
+                break
+
+        removed = 0
+        for name in self.names():
+            shard = self.chroma_db.get_or_create_collection(name)
+            stale = [item_id for item_id in shard.get(include=[])["ids"] if item_id not in expected.get(name, ())]
+            for start in range(0, len(stale), batch_size):
+                shard.delete(ids=stale[start:start + batch_size])
+            removed += len(stale)
+        logging.info("Rebuilt %s client shards from %s parts; removed %s stale records.", len(expected), offset, removed)
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from app.chromadb_utility import ChromaDBUtility
+    from app.maintenance import require_server_or_offline
+    parser = argparse.ArgumentParser(description="Refill the per-client part shards from `partes`.")
+    parser.add_argument("--persist-directory", default=os.getenv("CHROMA_PERSIST_DIRECTORY", "./data"))
+    parser.add_argument("--offline", action="store_true", help="The app is stopped; open the persist directory directly")
+    args = parser.parse_args()
+    require_server_or_offline(args.offline)
+
+    logging.basicConfig(level=logging.INFO)
+    chroma_db = ChromaDBUtility(
+        persist_directory=args.persist_directory,
+        embedding_provider="none",
+        chroma_host=os.getenv("CHROMA_HOST"),
+        chroma_port=int(os.getenv("CHROMA_PORT", "8000"))
+    )
+    with chroma_db.maintenance.hold("partes", "shard rebuild"):
+        PartShards(chroma_db).rebuild()
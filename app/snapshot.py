@@ -0,0 +1,110 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from app.chromadb_utility import ChromaDBUtility
+
+CHROMA_DATABASE = "chroma.sqlite3"
+# SQLite stores copied with the backup API; the joined inventory view is served from the snapshot too
+SNAPSHOT_DATABASES = (CHROMA_DATABASE, "inventory_view.sqlite3")
+SNAPSHOT_COLLECTIONS = ("inventory", "partes")
+# The snapshot alternates between two directories, so the one being served is never overwritten
+SNAPSHOT_SLOTS = ("a", "b")
+
+class SnapshotManager:
+    """Periodically refreshed, read-only copy of the Chroma store for reporting queries.
+
+    Only the SQLite databases (Chroma's and the inventory view) are copied,
+    through the online backup API in small steps so writers are never
+    blocked for long; each copy is transactionally consistent. HNSW segment
+    files are not copied, since they cannot be copied consistently while
+    being written, so snapshot readers serve metadata reads only (listings,
+    pages, exports) and never vector queries. Copies alternate between two
+    slot directories, each with one reader opened once and reused.
+    """
+
+    def __init__(self, chroma_db, snapshot_root, interval=300):
+        self.chroma_db = chroma_db
+        self.source_directory = chroma_db.persist_directory
+        self.snapshot_root = os.path.abspath(snapshot_root)
+        self.interval = interval
+        self.reader = None
+        self.taken_at = None
+        self.versions = None
+        self._readers = {}
+        self._slot = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        os.makedirs(self.snapshot_root, exist_ok=True)
+
+    def _current_versions(self):
+        return {name: self.chroma_db.collection_versions.get(name) for name in SNAPSHOT_COLLECTIONS}
+
+    def refresh(self, force=False):
+        """Take a new snapshot unless nothing changed since the last one. Returns True if one was taken."""
+        versions = self._current_versions()
+        if not force and self.reader is not None and versions == self.versions:
+            return False
+
+        start = time.perf_counter()
+        taken_at = datetime.now(timezone.utc)
+        slot = SNAPSHOT_SLOTS[1] if self._slot == SNAPSHOT_SLOTS[0] else SNAPSHOT_SLOTS[0]
+        target = os.path.join(self.snapshot_root, slot)
+        os.makedirs(target, exist_ok=True)
+
+        for database in SNAPSHOT_DATABASES:
+            source = sqlite3.connect(os.path.join(self.source_directory, database))
+            destination = sqlite3.connect(os.path.join(target, database))
+            try:
+                source.backup(destination, pages=256, sleep=0.005)
+            finally:
+                destination.close()
+                source.close()
+
+        reader = self._readers.get(slot)
+        if reader is None:
+            reader = self._readers[slot] = ChromaDBUtility(
+                persist_directory=target, embedding_provider="none", embedding_cache=False
+            )
+        else:
+            # A collection may have been replaced since this slot was last filled
+            reader.invalidate_collection()
+
+        with self._lock:
+            self.reader, self.taken_at, self.versions, self._slot = reader, taken_at, versions, slot
+        logging.info("Reporting snapshot refreshed in %.2fs: %s", time.perf_counter() - start, target)
+        return True
+
+    def current(self):
+        """Return (reader, freshness metadata) of the latest snapshot."""
+        with self._lock:
+            reader, taken_at = self.reader, self.taken_at
+        return reader, {
+            "taken_at": taken_at.isoformat(),
+            "age_seconds": round((datetime.now(timezone.utc) - taken_at).total_seconds(), 1)
+        }
+
+    def start(self):
+        """Take the first snapshot now and refresh it every `interval` seconds in a daemon thread."""
+        self.refresh(force=True)
+
+        def loop():
+            while not self._stop_event.wait(self.interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logging.error("Failed to refresh reporting snapshot: %s", e)
+
+        threading.Thread(target=loop, name="reporting-snapshot", daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+
+def reporting_source(app, args):
+    """Pick the reader for a read-only endpoint: the snapshot unless `?fresh=true` or snapshots are off."""
+    manager = getattr(app, "snapshot_manager", None)
+    if manager is None or args.get("fresh", "false").lower() == "true":
+        return app.chroma_db, None
+    return manager.current()
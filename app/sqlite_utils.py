@@ -0,0 +1,8 @@
+import sqlite3
+
+def connect(db_path):
+    """Open a SQLite connection tuned for small, frequent writes from several threads."""
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
@@ -0,0 +1,31 @@
+import logging
+import time
+from contextlib import contextmanager
+
+class PhaseTimer:
+    """Record how long each named phase of a process takes."""
+
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def total(self):
+        """Return the summed duration of all phases in seconds."""
+        return sum(seconds for _, seconds in self.phases)
+
+    def summary(self):
+        """Return a one-line report of every phase in milliseconds."""
+        parts = [f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.phases]
+        return f"{', '.join(parts)} (total {self.total() * 1000:.1f}ms)"
+
+    def log(self, label):
+        """Log the summary at INFO level."""
+        logging.info("%s: %s", label, self.summary())
@@ -0,0 +1,63 @@
+import threading
+import time
+from app.sqlite_utils import connect
+
+class TokenVersions:
+    """Per-user token versions; tokens issued with an older version than the current one are revoked.
+
+    Only users whose tokens were ever revoked have a row, so the whole table
+    is held in memory and checked on every request without a query. It is
+    re-read every `refresh_interval` seconds to pick up revocations made by
+    other worker processes.
+    """
+
+    def __init__(self, db_path, refresh_interval=5.0):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.conn = connect(db_path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS token_versions (
+                username TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+            """
+        )
+        self._versions = {}
+        self._loaded_at = None
+
+    def _refresh(self):
+        """Reload the versions if they are older than `refresh_interval`. Caller holds the lock."""
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.refresh_interval:
+            self._versions = dict(self.conn.execute("SELECT username, version FROM token_versions").fetchall())
+            self._loaded_at = now
+
+    def current(self, username):
+        """Return the version to put in new tokens of a user."""
+        with self.lock:
+            self._refresh()
+            return self._versions.get(username, 0)
+
+    def bump(self, username):
+        """Revoke every token issued to a user so far. Returns the new version."""
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO token_versions (username, version) VALUES (?, 1)
+                ON CONFLICT(username) DO UPDATE SET version = version + 1
+                """,
+                (username,)
+            )
+            version = self.conn.execute(
+                "SELECT version FROM token_versions WHERE username = ?", (username,)
+            ).fetchone()[0]
+            self._versions[username] = version
+            return version
+
+    def is_revoked(self, username, version):
+        """Whether a token carrying `version` for `username` has been revoked."""
+        with self.lock:
+            self._refresh()
+            return (version or 0) < self._versions.get(username, 0)
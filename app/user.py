@@ -5,8 +5,11 @@ from datetime import datetime
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for, current_app
 from flask_login import login_user, logout_user, current_user, UserMixin, LoginManager
 from flask_jwt_extended import (
-    create_access_token, set_access_cookies, unset_jwt_cookies, jwt_required, get_jwt_identity
+    create_access_token, set_access_cookies, unset_jwt_cookies, jwt_required, get_jwt_identity,
+    get_jwt, verify_jwt_in_request
 )
+from app.password_hasher import PasswordHasherBusy
+from app.maintenance import CollectionBusy
 
 # Initialize Blueprint and utilities
 user_bp = Blueprint("user", __name__)
@@ -26,22 +29,72 @@ class User(UserMixin):
         self.username = username
         self.role = role
 
+def jwt_identity():
+    """Return the verified JWT identity as a dict ({id, username, role}), or None."""
+    identity = get_jwt_identity()
+    return json.loads(identity) if isinstance(identity, str) else identity
+
+def user_from_claims(user_id=None):
+    """Build the current user from the verified JWT, decoding it only if no decorator did yet."""
+    try:
+        try:
+            claims = get_jwt()
+        except RuntimeError:
+            verify_jwt_in_request(optional=True)
+            claims = get_jwt()
+    except Exception as e:
+        logging.warning("JWT verification failed: %s", e)
+        return None
+    if not claims:
+        return None
+    identity = jwt_identity()
+    if user_id is not None and str(identity["id"]) != str(user_id):
+        return None
+    return User(id=identity["id"], username=identity["username"], role=identity["role"])
+
 # Register the user loader function
 @login_manager.user_loader
 def load_user(user_id):
-    """Load user from ChromaDB by user ID."""
+    """Load user by ID, serving repeat lookups from the in-process user cache."""
+    # Stateless mode: the signed token is the source of truth, no lookup
+    if current_app.config["AUTH_MODE"] == "jwt":
+        return user_from_claims(user_id)
+
+    chroma_db = get_chroma_db()
+    token_versions = chroma_db.token_versions
+    cached = chroma_db.user_cache.get(user_id)
+    if cached is not None:
+        user, version = cached
+        # Password and role changes bump the version in every process, not only this one
+        if version == token_versions.current(user.username):
+            return user
+
     try:
-        user_data = get_chroma_db().get_user_by_id(user_id)
+        # Read the version before the user: a change made after this read shows up as a newer version
+        username = cached[0].username if cached else user_id
+        version = token_versions.current(username)
+        user_data = chroma_db.get_user_by_id(user_id)
         if user_data:
-            logging.info(f"Loaded user: {user_data['username']} with ID: {user_data['id']}")
-            return User(id=user_data["id"], username=user_data["username"], role=user_data["role"])
+            logging.debug("Loaded user: %s with ID: %s", user_data["username"], user_data["id"])
+            user = User(id=user_data["id"], username=user_data["username"], role=user_data["role"])
+            if user.username != username:
+                version = token_versions.current(user.username)
+            chroma_db.user_cache.set(user_id, (user, version))
+            return user
         else:
-            logging.warning(f"User with ID '{user_id}' not found.")
+            logging.warning("User with ID '%s' not found.", user_id)
             return None
     except Exception as e:
-        logging.error(f"Failed to load user by ID '{user_id}': {str(e)}")
+        logging.error("Failed to load user by ID '%s': %s", user_id, e)
         return None
 
+@login_manager.request_loader
+def load_user_from_request(request):
+    """Authenticate API clients that send only the JWT cookie, in stateless mode."""
+    if current_app.config["AUTH_MODE"] == "jwt":
+        return user_from_claims()
+    return None
+
 # Route to render the user management HTML page
 @user_bp.route("/manage", methods=["GET"])
 @jwt_required(optional=True)
@@ -56,7 +109,7 @@ def manage_user():
                 user_identity = json.loads(user_identity)
 
             # Redirect authenticated users to main menu
-            logging.info(f"Authenticated user detected: {user_identity}. Redirecting to main menu.")
+            logging.info("Authenticated user detected: %s. Redirecting to main menu.", user_identity)
             return redirect(url_for("main.main_menu"))
 
         # Render login page for unauthenticated users
@@ -64,7 +117,7 @@ def manage_user():
         return render_template("user.html")  # Ensure this is your login template
 
     except Exception as e:
-        logging.error(f"Error in manage_user: {str(e)}")
+        logging.error("Error in manage_user: %s", e)
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 # Admin-only route example
@@ -72,7 +125,7 @@ def manage_user():
 @jwt_required()
 def admin_only():
     """Admin-only route."""
-    identity = get_jwt_identity()
+    identity = jwt_identity()
     if identity["role"] != "admin":
         return jsonify({"error": "Admin access required"}), 403
     return jsonify({"message": "Welcome, Admin!"}), 200
@@ -82,7 +135,7 @@ def admin_only():
 @jwt_required()
 def register():
     """Register a new user (admin-only)."""
-    identity = get_jwt_identity()
+    identity = jwt_identity()
     if identity["role"] != "admin":
         return jsonify({"error": "Admin access required to register new users"}), 403
 
@@ -99,12 +152,16 @@ def register():
         return jsonify({"message": "User registered successfully"}), 201
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
+    except PasswordHasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except CollectionBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
 
 # Handle GET requests for login
 @user_bp.route("/login", methods=["GET"])
 def login_get():
     """Handle GET requests to /login."""
-    logging.info(f"[{datetime.utcnow()}] GET /login accessed.")
+    logging.info("[%s] GET /login accessed.", datetime.utcnow())
     return jsonify({"message": "Please log in using POST /user/login"}), 200
 
 # Login route
@@ -116,22 +173,29 @@ def login():
     password = data.get("password")
 
     if not username or not password:
-        logging.warning(f"[{datetime.utcnow()}] Login attempt with missing credentials.")
+        logging.warning("[%s] Login attempt with missing credentials.", datetime.utcnow())
         return jsonify({"error": "Username and password are required"}), 400
 
     try:
         # Authenticate user
         user_data = get_chroma_db().authenticate_user(username, password)
         logging.info(
-            f"[{datetime.utcnow()}] User login successful: "
-            f"Username: {user_data['username']}, Role: {user_data['role']}, ID: {user_data['id']}"
+            "[%s] User login successful: Username: %s, Role: %s, ID: %s",
+            datetime.utcnow(), user_data['username'], user_data['role'], user_data['id']
         )
 
+        # Start the Flask-Login session used by @login_required routes; stateless mode needs only the token
+        if current_app.config["AUTH_MODE"] != "jwt":
+            login_user(User(id=user_data["id"], username=user_data["username"], role=user_data["role"]))
+
         # Serialize user_data to a JSON string
         user_identity = json.dumps(user_data)
 
-        # Create access token
-        access_token = create_access_token(identity=user_identity)
+        # Create access token; "tv" lets every token of a user be revoked at once
+        access_token = create_access_token(
+            identity=user_identity,
+            additional_claims={"tv": current_app.token_versions.current(user_data["username"])}
+        )
 
         # Set access token in cookies
         response = jsonify({"message": "Login successful"})
@@ -139,23 +203,28 @@ def login():
         return response, 200
 
     except ValueError as e:
-        logging.warning(f"[{datetime.utcnow()}] Failed login for username: {username}. Error: {str(e)}")
+        logging.warning("[%s] Failed login for username: %s. Error: %s", datetime.utcnow(), username, e)
         return jsonify({"error": str(e)}), 401
 
+    except PasswordHasherBusy as e:
+        logging.warning("[%s] Login shed under load for username: %s.", datetime.utcnow(), username)
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
     except ExpiredSignatureError:
-        logging.warning(f"[{datetime.utcnow()}] Expired token used for login.")
+        logging.warning("[%s] Expired token used for login.", datetime.utcnow())
         response = jsonify({"error": "Session expired. Please log in again."})
         unset_jwt_cookies(response)
         return response, 401
 
     except Exception as e:
-        logging.error(f"[{datetime.utcnow()}] Unexpected error during login: {str(e)}")
+        logging.error("[%s] Unexpected error during login: %s", datetime.utcnow(), e)
         return jsonify({"error": "An unexpected error occurred"}), 500
 
 # Logout route
 @user_bp.route("/logout", methods=["POST"])
 def logout():
     """Clear the user's session."""
+    logout_user()
     response = jsonify({"message": "Logged out successfully"})
     unset_jwt_cookies(response)  # Clear JWT cookies
     return response, 200
@@ -164,7 +233,7 @@ def logout():
 @jwt_required()
 def reset_password():
     """Reset the password for a user."""
-    identity = get_jwt_identity()
+    identity = jwt_identity()
     data = request.json
     username = data.get("username")
     new_password = data.get("new_password")
@@ -181,10 +250,68 @@ def reset_password():
         return jsonify({"message": "Password reset successfully!"}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 404
+    except PasswordHasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except CollectionBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
-        logging.error(f"An error occurred while resetting password: {str(e)}")
+        logging.error("An error occurred while resetting password: %s", e)
         return jsonify({"error": "An unexpected error occurred"}), 500
 
+@user_bp.route("/update_role", methods=["POST"])
+@jwt_required()
+def update_role():
+    """Change a user's role (admin-only)."""
+    identity = jwt_identity()
+    if identity["role"] != "admin":
+        return jsonify({"error": "Admin access required"}), 403
+
+    data = request.json
+    username = data.get("username")
+    role = data.get("role")
+
+    if not username or not role:
+        return jsonify({"error": "Username and role are required"}), 400
+
+    try:
+        # Also bumps the user's token version: tokens carry the role, so the old ones stop working
+        get_chroma_db().update_user_role(username, role)
+        return jsonify({"message": "Role updated successfully!"}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    except CollectionBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        logging.error("An error occurred while updating role: %s", e)
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+@user_bp.route("/revoke_tokens", methods=["POST"])
+@jwt_required()
+def revoke_tokens():
+    """Revoke every token issued to a user (admin-only, or a user for themselves)."""
+    identity = jwt_identity()
+    username = (request.json or {}).get("username") or identity["username"]
+    if identity["role"] != "admin" and identity["username"] != username:
+        return jsonify({"error": "Unauthorized to revoke these tokens"}), 403
+    version = current_app.token_versions.bump(username)
+    logging.info("Tokens of user '%s' revoked by %s (version %s).", username, identity['username'], version)
+    return jsonify({"message": "Tokens revoked.", "version": version}), 200
+
+@user_bp.route("/cache_stats", methods=["GET"])
+@jwt_required()
+def cache_stats():
+    """Return hit/miss counters of the in-process caches (admin-only)."""
+    identity = jwt_identity()
+    if identity["role"] != "admin":
+        return jsonify({"error": "Admin access required"}), 403
+    chroma_db = get_chroma_db()
+    return jsonify({
+        "users": chroma_db.user_cache.stats(),
+        "credentials": chroma_db.credential_cache.stats(),
+        "query_embeddings": chroma_db.query_embedding_cache.stats(),
+        "embeddings": chroma_db.embedding_cache.stats() if chroma_db.embedding_cache else None
+    }), 200
+
 @user_bp.route("/me", methods=["GET"])
 @jwt_required()
 def get_current_user():
@@ -199,5 +326,5 @@ def get_current_user():
 
         return jsonify(user_identity), 200
     except Exception as e:
-        logging.error(f"Error fetching user information: {str(e)}")
+        logging.error("Error fetching user information: %s", e)
         return jsonify({"error": "An unexpected error occurred"}), 500
@@ -0,0 +1,302 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from app.sqlite_utils import connect
+from app.maintenance import CollectionBusy
+
+class WriteQueue:
+    """Durable queue of pending collection writes, stored in SQLite (WAL)."""
+
+    def __init__(self, db_path, lease_seconds=30):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.lock = threading.Lock()
+        self.conn = connect(db_path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS operations (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                collection TEXT NOT NULL,
+                op TEXT NOT NULL,
+                numero_parte TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS operations_status ON operations (status, seq);
+            CREATE INDEX IF NOT EXISTS operations_part ON operations (collection, numero_parte, seq);
+            CREATE TABLE IF NOT EXISTS consumer_lease (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """
+        )
+        # Claimed rows record their consumer, so only work from a consumer whose lease lapsed is taken over
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(operations)")}
+        if "owner" not in columns:
+            self.conn.execute("ALTER TABLE operations ADD COLUMN owner TEXT")
+        if "claimed_at" not in columns:
+            self.conn.execute("ALTER TABLE operations ADD COLUMN claimed_at REAL")
+
+    def enqueue(self, collection_name, op, numero_parte, payload):
+        """Queue a write and return its operation id."""
+        op_id = str(uuid.uuid4())
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO operations (id, collection, op, numero_parte, payload, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)
+                """,
+                (op_id, collection_name, op, str(numero_parte), json.dumps(payload), now, now)
+            )
+        return op_id
+
+    def pending_op(self, collection_name, numero_parte):
+        """Return the latest queued or in-flight operation type for a part, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                """
+                SELECT op FROM operations
+                WHERE collection = ? AND numero_parte = ? AND status IN ('queued', 'processing')
+                ORDER BY seq DESC LIMIT 1
+                """,
+                (collection_name, str(numero_parte))
+            ).fetchone()
+        return row[0] if row else None
+
+    def status(self, op_id):
+        """Return the state of an operation, or None if it is unknown."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, collection, op, numero_parte, status, error, created_at, updated_at FROM operations WHERE id = ?",
+                (op_id,)
+            ).fetchone()
+        if not row:
+            return None
+        columns = ("id", "collection", "op", "numero_parte", "status", "error", "created_at", "updated_at")
+        return dict(zip(columns, row))
+
+    def depth(self):
+        """Return the number of operations not yet applied."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM operations WHERE status IN ('queued', 'processing')"
+            ).fetchone()[0]
+
+    def acquire_lease(self):
+        """Become (or stay) the only consumer across processes. Returns True if this process holds the lease."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO consumer_lease (name, owner, expires_at) VALUES ('consumer', ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE consumer_lease.owner = excluded.owner OR consumer_lease.expires_at < ?
+                """,
+                (self.owner, now + self.lease_seconds, now)
+            )
+            row = self.conn.execute("SELECT owner FROM consumer_lease WHERE name = 'consumer'").fetchone()
+        return row is not None and row[0] == self.owner
+
+    def claim(self, limit):
+        """Mark up to `limit` queued operations as processing by this consumer and return them in order.
+
+        Returns nothing unless this process holds the consumer lease. Rows left
+        processing by another consumer are queued again first: holding the lease
+        means that consumer's lease has expired.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                lease = self.conn.execute("SELECT owner, expires_at FROM consumer_lease WHERE name = 'consumer'").fetchone()
+                if not lease or lease[0] != self.owner or lease[1] < now:
+                    self.conn.execute("COMMIT")
+                    return []
+                self.conn.execute(
+                    "UPDATE operations SET status = 'queued', owner = NULL, claimed_at = NULL "
+                    "WHERE status = 'processing' AND (owner IS NULL OR owner != ?)",
+                    (self.owner,)
+                )
+                rows = self.conn.execute(
+                    "SELECT seq, id, collection, op, numero_parte, payload FROM operations WHERE status = 'queued' ORDER BY seq LIMIT ?",
+                    (limit,)
+                ).fetchall()
+                if rows:
+                    self.conn.execute(
+                        f"UPDATE operations SET status = 'processing', owner = ?, claimed_at = ? WHERE seq IN ({','.join('?' * len(rows))})",
+                        [self.owner, now, *(row[0] for row in rows)]
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [
+            {"id": row[1], "collection": row[2], "op": row[3], "numero_parte": row[4], "payload": json.loads(row[5])}
+            for row in rows
+        ]
+
+    def finish(self, op_ids, error=None):
+        """Mark operations this consumer claimed as done, or as failed with an error message."""
+        if not op_ids:
+            return
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE operations SET status = ?, error = ?, updated_at = ? WHERE owner = ? AND id IN ({','.join('?' * len(op_ids))})",
+                ["failed" if error else "done", error, time.time(), self.owner, *op_ids]
+            )
+
+    def release(self, op_ids):
+        """Queue operations this consumer claimed again, to be retried by a later batch."""
+        if not op_ids:
+            return
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE operations SET status = 'queued', owner = NULL, claimed_at = NULL, updated_at = ? "
+                f"WHERE owner = ? AND id IN ({','.join('?' * len(op_ids))})",
+                [time.time(), self.owner, *op_ids]
+            )
+
+def coalesce(operations):
+    """Collapse the queued operations of each part into one final action.
+
+    Returns a list of (collection, numero_parte, action, payload, op_ids) where
+    action is "upsert", "update", "delete" or "noop", in first-seen order.
+    """
+    merged = {}
+    for operation in operations:
+        key = (operation["collection"], operation["numero_parte"])
+        action, payload, op_ids = merged.get(key, (None, None, []))
+        op, new_payload = operation["op"], operation["payload"]
+        if op == "add":
+            action, payload = "upsert", new_payload
+        elif op == "update":
+            if action == "upsert":
+                payload = {**payload, "metadata": new_payload["metadata"]}
+            else:
+                action, payload = "update", new_payload
+        elif op == "delete":
+            # Deleting something added in the same batch means it never has to be written
+            action, payload = ("noop" if action == "upsert" and payload.get("new") else "delete"), new_payload
+        merged[key] = (action, payload, op_ids + [operation["id"]])
+    return [(collection, numero_parte, *value) for (collection, numero_parte), value in merged.items()]
+
+class WriteBehindWorker(threading.Thread):
+    """Background thread that drains the write queue in coalesced, batch-embedded groups."""
+
+    def __init__(self, write_queue, chroma_db, batch_size=256, interval=0.5):
+        super().__init__(name="write-behind", daemon=True)
+        self.write_queue = write_queue
+        self.chroma_db = chroma_db
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                if self.write_queue.acquire_lease() and self._drain_with_renewal():
+                    continue
+            except Exception as e:
+                logging.error("Write-behind worker error: %s", e)
+            self._stop_event.wait(self.interval)
+
+    def _drain_with_renewal(self):
+        """Run drain_once while a helper thread keeps the consumer lease alive, however long the batch takes."""
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(self.write_queue.lease_seconds / 3):
+                try:
+                    if not self.write_queue.acquire_lease():
+                        logging.warning("Write-behind consumer lease was lost during a batch.")
+                except Exception as e:
+                    logging.error("Write-behind lease renewal failed: %s", e)
+
+        renewer = threading.Thread(target=renew, name="write-behind-lease", daemon=True)
+        renewer.start()
+        try:
+            return self.drain_once()
+        finally:
+            done.set()
+            renewer.join()
+
+    def drain_once(self):
+        """Apply one group of queued operations. Returns the number of operations handled.
+
+        Operations on a collection held by a maintenance job go back to the
+        queue and are not counted, so the worker backs off until it is released.
+        """
+        operations = self.write_queue.claim(self.batch_size)
+        if not operations:
+            return 0
+
+        deferred = 0
+        upserts = {}
+        for collection_name, numero_parte, action, payload, op_ids in coalesce(operations):
+            try:
+                if action == "upsert":
+                    item_id = self.chroma_db.find_item_id(collection_name, numero_parte) or self.chroma_db.new_item_id(
+                        collection_name, numero_parte
+                    )
+                    upserts.setdefault(collection_name, []).append((item_id, payload, op_ids))
+                    continue
+                if action == "update":
+                    item_id = self.chroma_db.find_item_id(collection_name, numero_parte)
+                    if item_id is None:
+                        raise ValueError(f"Numero Parte '{numero_parte}' not found.")
+                    self.chroma_db.update_item(collection_name, item_id, payload["metadata"])
+                elif action == "delete":
+                    self.chroma_db.delete_by_numero_parte(collection_name, numero_parte)
+                self.write_queue.finish(op_ids)
+            except CollectionBusy:
+                self.write_queue.release(op_ids)
+                deferred += len(op_ids)
+            except Exception as e:
+                logging.error("Write-behind %s of '%s' in '%s' failed: %s", action, numero_parte, collection_name, e)
+                self.write_queue.finish(op_ids, error=str(e))
+
+        # Adds are embedded and committed together, one group per collection
+        for collection_name, entries in upserts.items():
+            op_ids = [op_id for _, _, ids in entries for op_id in ids]
+            try:
+                self.chroma_db.add_items(
+                    collection_name,
+                    ids=[item_id for item_id, _, _ in entries],
+                    documents=[payload["descripcion"] for _, payload, _ in entries],
+                    metadatas=[payload["metadata"] for _, payload, _ in entries],
+                    batch_size=self.batch_size
+                )
+                self.write_queue.finish(op_ids)
+            except CollectionBusy:
+                self.write_queue.release(op_ids)
+                deferred += len(op_ids)
+            except Exception as e:
+                logging.error("Write-behind batch for '%s' failed: %s", collection_name, e)
+                self.write_queue.finish(op_ids, error=str(e))
+
+        if deferred:
+            logging.info("Write-behind deferred %s operations on collections under maintenance.", deferred)
+        logging.info("Write-behind applied %s queued operations.", len(operations) - deferred)
+        return len(operations) - deferred
+
+def part_exists(chroma_db, write_queue, collection_name, numero_parte):
+    """Whether a part exists once the writes already queued for it are applied."""
+    pending = write_queue.pending_op(collection_name, numero_parte) if write_queue else None
+    if pending == "delete":
+        return False
+    if pending in ("add", "update"):
+        return True
+    return chroma_db.find_item_id(collection_name, numero_parte) is not None
@@ -0,0 +1,53 @@
+"""Requests per second of protected routes with AUTH_MODE=session vs. AUTH_MODE=jwt.
+
+Usage: python -m benchmarks.auth_throughput [--requests 2000] [--no-user-cache]
+
+Builds the app twice on a throwaway persist directory, logs in as the
+default admin and replays authenticated GETs through the Flask test client:
+/admin (@login_required + @role_required) and /engineering/numero_parte/list
+(@jwt_required + @login_required + @role_required). --no-user-cache sets
+USER_CACHE_SIZE=0 so session mode pays the user lookup on every request.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from app import create_app
+
+ROUTES = ("/admin", "/engineering/numero_parte/list?limit=1")
+
+def measure(client, path, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, f"{path}: {response.status_code}"
+    samples.sort()
+    return count / (sum(samples) / 1000), statistics.mean(samples), samples[int(len(samples) * 0.95) - 1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--no-user-cache", action="store_true")
+    args = parser.parse_args()
+
+    if args.no_user_cache:
+        os.environ["USER_CACHE_SIZE"] = "0"
+    with tempfile.TemporaryDirectory() as persist_directory:
+        os.environ["CHROMA_PERSIST_DIRECTORY"] = persist_directory
+        for mode in ("session", "jwt"):
+            os.environ["AUTH_MODE"] = mode
+            app = create_app()
+            client = app.test_client()
+            response = client.post("/user/login", json={"username": "admin", "password": "admin"})
+            assert response.status_code == 200, response.get_json()
+            print(f"AUTH_MODE={mode}:")
+            for path in ROUTES:
+                client.get(path)
+                rps, mean_ms, p95_ms = measure(client, path, args.requests)
+                print(f"  {path:<40} {rps:8.0f} req/s  mean={mean_ms:6.2f} ms  p95={p95_ms:6.2f} ms")
+
+if __name__ == "__main__":
+    main()
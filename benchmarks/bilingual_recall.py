@@ -0,0 +1,88 @@
+"""Recall and latency of combined vs. per-language (RRF-fused) part search.
+
+Usage: python -m benchmarks.bilingual_recall
+
+Loads a small bilingual catalog into a throwaway persist directory and runs
+English and Spanish queries whose expected part is known.
+"""
+import statistics
+import tempfile
+import time
+from app.chromadb_utility import ChromaDBUtility
+from app.models import ParteItem
+
+CATALOG = [
+    ("1001", "Hex bolt M8 x 30 zinc plated", "Tornillo hexagonal M8 x 30 galvanizado"),
+    ("1002", "Flat washer 8 mm stainless steel", "Rondana plana 8 mm acero inoxidable"),
+    ("1003", "Lock nut M8 nylon insert", "Tuerca de seguridad M8 con inserto de nylon"),
+    ("1004", "Ball bearing 6204 sealed", "Rodamiento de bolas 6204 sellado"),
+    ("1005", "Rubber O-ring 25 mm", "Empaque tipo O de hule 25 mm"),
+    ("1006", "Steel bracket L shape 90 degrees", "Ménsula de acero en forma de L 90 grados"),
+    ("1007", "Copper wire 12 AWG spool", "Carrete de alambre de cobre calibre 12"),
+    ("1008", "Hydraulic hose 1/2 inch", "Manguera hidráulica de media pulgada"),
+    ("1009", "Aluminum sheet 2 mm", "Lámina de aluminio de 2 mm"),
+    ("1010", "Plastic cable tie 200 mm black", "Cincho de plástico negro de 200 mm"),
+    ("1011", "Spring compression 20 mm", "Resorte de compresión de 20 mm"),
+    ("1012", "Drive belt V type", "Banda de transmisión tipo V"),
+    ("1013", "Brass fitting elbow 1/4", "Codo de latón de un cuarto"),
+    ("1014", "Corrugated cardboard box large", "Caja de cartón corrugado grande"),
+    ("1015", "Safety gloves nitrile", "Guantes de seguridad de nitrilo"),
+    ("1016", "Welding rod 1/8 E6013", "Electrodo para soldar 1/8 E6013"),
+]
+
+QUERIES = [
+    ("bearing", "1004"),
+    ("rodamiento", "1004"),
+    ("tornillo hexagonal", "1001"),
+    ("washer", "1002"),
+    ("rondana", "1002"),
+    ("tuerca", "1003"),
+    ("empaque de hule", "1005"),
+    ("alambre de cobre", "1007"),
+    ("manguera", "1008"),
+    ("lámina de aluminio", "1009"),
+    ("cincho", "1010"),
+    ("resorte", "1011"),
+    ("banda", "1012"),
+    ("codo de latón", "1013"),
+    ("caja de cartón", "1014"),
+    ("guantes", "1015"),
+    ("electrodo para soldar", "1016"),
+    ("spring", "1011"),
+]
+
+def evaluate(label, search, k):
+    """Report recall@k and latency of a search function over QUERIES."""
+    hits = 0
+    latencies = []
+    for query, expected in QUERIES:
+        start = time.perf_counter()
+        results, _ = search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if any(result["metadata"]["numero_parte"] == expected for result in results):
+            hits += 1
+    print(f"{label:<10} recall@{k}={hits / len(QUERIES):.2f}  mean={statistics.mean(latencies):7.2f} ms")
+
+def main():
+    with tempfile.TemporaryDirectory() as persist_directory:
+        chroma_db = ChromaDBUtility(persist_directory=persist_directory)
+        parts = [
+            ParteItem(cliente="demo", numero_parte=numero_parte, descripcion_ingles=en, descripcion_espanol=es)
+            for numero_parte, en, es in CATALOG
+        ]
+        chroma_db.add_items(
+            "partes",
+            ids=[chroma_db.new_item_id("partes", part.numero_parte) for part in parts],
+            documents=[part.document() for part in parts],
+            metadatas=[{key: value for key, value in part.dict().items() if value is not None} for part in parts]
+        )
+
+        for k in (1, 3):
+            # Clear cached query embeddings so both modes pay for inference
+            chroma_db.query_embedding_cache.clear()
+            evaluate("combined", lambda q, n: chroma_db.search("partes", q, n_results=n), k)
+            chroma_db.query_embedding_cache.clear()
+            evaluate("bilingual", lambda q, n: chroma_db.search_bilingual(q, n_results=n), k)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Per-request overhead of resolving collection handles, before and after caching.
+
+Usage: python -m benchmarks.collection_handles [--iterations 2000] [--lookups 5]
+
+A request typically resolves `--lookups` collections. "uncached" calls
+`client.get_collection` each time, as every call did before handles were
+cached; "cached" goes through ChromaDBUtility.get_or_create_collection.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from app.chromadb_utility import ChromaDBUtility
+
+NAMES = ("users", "inventory", "partes", "partes_lang")
+
+def measure(label, resolve, iterations, lookups):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        for i in range(lookups):
+            resolve(NAMES[i % len(NAMES)])
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    print(f"{label:<9} per request: mean={statistics.mean(samples):9.1f} us  p95={samples[int(len(samples) * 0.95) - 1]:9.1f} us")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        chroma_db = ChromaDBUtility(persist_directory=persist_directory, embedding_provider="none")
+        for name in NAMES:
+            chroma_db.get_or_create_collection(name)
+
+        uncached = lambda name: chroma_db.client.get_collection(name=name, embedding_function=chroma_db.embedding_function)
+        measure("uncached", uncached, args.iterations, args.lookups)
+        measure("cached", chroma_db.get_or_create_collection, args.iterations, args.lookups)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Recall vs. latency of HNSW parameters, to pick values for `HNSW_CONFIG`.
+
+Usage: python -m benchmarks.hnsw_recall [--vectors 20000] [--M 8 16 32] [--construction-ef 100 200]
+                                        [--search-ef 10 50 100 200] [--space l2] [--source partes]
+
+With --source the stored embeddings of that collection (in
+CHROMA_PERSIST_DIRECTORY) are used, otherwise clustered random vectors.
+Recall@k is measured against exact brute-force neighbours of held-out
+queries; every parameter combination gets its own throwaway collection.
+"""
+import argparse
+import itertools
+import os
+import statistics
+import tempfile
+import time
+import chromadb
+import numpy as np
+from app.chromadb_utility import ChromaDBUtility
+from app.hnsw import HNSW_PARAMETERS, SPACES
+
+def synthetic_vectors(count, dimensions=384, clusters=200, seed=7):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.3 * rng.normal(size=(count, dimensions))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def stored_vectors(collection_name, limit):
+    chroma_db = ChromaDBUtility(persist_directory=os.getenv("CHROMA_PERSIST_DIRECTORY", "./data"), embedding_provider="none")
+    results = chroma_db.get_or_create_collection(collection_name).get(limit=limit, include=["embeddings"])
+    return np.asarray(results["embeddings"], dtype=np.float32)
+
+def exact_neighbours(vectors, queries, k, space):
+    if space == "l2":
+        distances = (queries ** 2).sum(1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(1)[None, :]
+    else:
+        distances = -(queries @ vectors.T)
+    return np.argsort(distances, axis=1)[:, :k]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--space", choices=SPACES, default="l2")
+    parser.add_argument("--M", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--source", help="Use the stored embeddings of this collection")
+    args = parser.parse_args()
+
+    data = stored_vectors(args.source, args.vectors + args.queries) if args.source else synthetic_vectors(args.vectors + args.queries)
+    vectors, queries = data[:-args.queries], data[-args.queries:]
+    truth = exact_neighbours(vectors, queries, args.k, args.space)
+    ids = [str(i) for i in range(len(vectors))]
+    print(f"{len(vectors)} vectors, {len(queries)} queries, k={args.k}, space={args.space}")
+    print(f"{'M':>4} {'constr_ef':>9} {'search_ef':>9} {'build_s':>8} {'recall':>7} {'mean_ms':>8} {'p95_ms':>8}")
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        client = chromadb.PersistentClient(path=persist_directory)
+        for m, construction_ef, search_ef in itertools.product(args.M, args.construction_ef, args.search_ef):
+            name = f"bench-{m}-{construction_ef}-{search_ef}"
+            collection = client.create_collection(name=name, metadata={
+                HNSW_PARAMETERS["space"]: args.space,
+                HNSW_PARAMETERS["M"]: m,
+                HNSW_PARAMETERS["construction_ef"]: construction_ef,
+                HNSW_PARAMETERS["search_ef"]: search_ef,
+            })
+            start = time.perf_counter()
+            for offset in range(0, len(ids), 5000):
+                collection.add(ids=ids[offset:offset + 5000], embeddings=vectors[offset:offset + 5000].tolist())
+            build_seconds = time.perf_counter() - start
+
+            hits, latencies = 0, []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found = collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=[])["ids"][0]
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len(set(found) & {ids[index] for index in expected})
+            latencies.sort()
+            print(
+                f"{m:>4} {construction_ef:>9} {search_ef:>9} {build_seconds:>8.1f} "
+                f"{hits / (len(queries) * args.k):>7.3f} {statistics.mean(latencies):>8.2f} "
+                f"{latencies[int(len(latencies) * 0.95) - 1]:>8.2f}"
+            )
+            client.delete_collection(name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Time to build a get_inventory response body: per-row models vs. rows encoded by the inventory view.
+
+Usage: python -m benchmarks.inventory_serialization [--rows 10000 100000] [--page-size 1000] [--repeat 5]
+
+Both paths get the same alphanumeric part numbers, and the same share of
+them (--ledger-share) has ledger balances that override the stored quantity.
+"models" is the previous path: ledger overlay through on_hand_many, one
+InventoryItem per row, sorted (by the natural key here, since the old int()
+key fails on these part numbers), wrapped in InventoryResponse, .dict() and
+json.dumps (what jsonify does). "view page" and "view stream" build the same
+body from the inventory view, one page and the whole inventory respectively.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from app.models import InventoryItem, InventoryResponse
+from app.inventory_view import InventoryView, sort_key
+from app.ledger import StockLedger
+from app.export import iter_json_page
+
+PREFIXES = ("A", "B", "CX-", "HB-", "M")
+
+def models_body(metadatas, ledger):
+    balances = ledger.on_hand_many([metadata["numero_parte"] for metadata in metadatas])
+    items = sorted(
+        (
+            InventoryItem(**{**metadata, "cantidad": balances.get(metadata["numero_parte"], metadata["cantidad"])})
+            for metadata in metadatas
+        ),
+        key=lambda x: sort_key(x.numero_parte)
+    )
+    return json.dumps(InventoryResponse(items=items, next_cursor=None).dict())
+
+def measure(label, build, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = build()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"  {label:<12} median={statistics.median(samples):9.1f} ms  body={len(body) / 1e6:6.2f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ledger-share", type=float, default=0.5)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        metadatas = [
+            {
+                "numero_parte": f"{random.choice(PREFIXES)}{number}",
+                "cantidad": random.randint(0, 500),
+                "descripcion": f"Part {number} description"
+            }
+            for number in random.sample(range(1, rows * 10), rows)
+        ]
+        tracked = random.sample(metadatas, int(rows * args.ledger_share))
+        with tempfile.TemporaryDirectory() as directory:
+            ledger = StockLedger(os.path.join(directory, "stock_ledger.sqlite3"))
+            ledger.post([
+                {"numero_parte": metadata["numero_parte"], "tipo": "receipt", "cantidad": random.randint(1, 500)}
+                for metadata in tracked
+            ])
+            view = InventoryView(os.path.join(directory, "inventory_view.sqlite3"))
+            view.rebuild(
+                [(f"item-{i}", metadata) for i, metadata in enumerate(metadatas)], [],
+                ledger.on_hand_many([metadata["numero_parte"] for metadata in metadatas])
+            )
+
+            print(f"{rows} rows ({len(tracked)} with ledger balances), page of {args.page_size}:")
+            measure("models page", lambda: models_body(metadatas[:args.page_size], ledger), args.repeat)
+            measure("view page", lambda: "".join(iter_json_page(view.inventory_page_json(args.page_size)[0], next_cursor=None)), args.repeat)
+            print(f"{rows} rows, whole inventory:")
+            measure("models all", lambda: models_body(metadatas, ledger), args.repeat)
+            measure("view stream", lambda: "".join(iter_json_page(view.iter_inventory_json(), next_cursor=None)), args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Multi-worker load test: throughput by worker count, then a consistency check.
+
+Usage: python -m benchmarks.load_test [--workers 1 2 4 8] [--seconds 20] [--threads 32]
+
+For every worker count this starts a Chroma server, the embedding service and
+gunicorn against a fresh data directory, then hammers the write and read paths
+from a thread pool. Afterwards it checks that every acknowledged write is
+present exactly once: the item count matches the successful adds and each
+part's stock equals the receipts that were acknowledged for it.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARTS = 200
+# Numeric part numbers, as in production data, well away from anything a fresh store holds
+FIRST_PART = 900000
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=2)
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up")
+
+class Client:
+    """Cookie-carrying JSON client shared by all load threads."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def call(self, method, path, payload=None):
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+def start_stack(workers, data_directory):
+    """Start Chroma server, embedding service and gunicorn. Returns (processes, base_url)."""
+    chroma_port, embed_port, web_port = free_port(), free_port(), free_port()
+    env = dict(
+        os.environ,
+        CHROMA_HOST="127.0.0.1",
+        CHROMA_PORT=str(chroma_port),
+        CHROMA_PERSIST_DIRECTORY=data_directory,
+        EMBEDDING_PROVIDER="remote",
+        EMBEDDING_SERVICE_URL=f"http://127.0.0.1:{embed_port}",
+        EMBEDDING_CACHE="false",
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_BIND=f"127.0.0.1:{web_port}",
+    )
+    processes = [
+        subprocess.Popen(["chroma", "run", "--path", os.path.join(data_directory, "chroma"), "--port", str(chroma_port)],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+        subprocess.Popen([sys.executable, "-m", "app.embedding_service", "--port", str(embed_port)],
+                         cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+    ]
+    wait_for(f"http://127.0.0.1:{chroma_port}/api/v1/heartbeat")
+    wait_for(f"http://127.0.0.1:{embed_port}/health")
+    processes.append(subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "run:app"],
+                                      cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    base_url = f"http://127.0.0.1:{web_port}"
+    wait_for(base_url + "/user/login")
+    return processes, base_url
+
+def run(workers, seconds, threads):
+    data_directory = tempfile.mkdtemp(prefix="invectory-load-")
+    processes, base_url = start_stack(workers, data_directory)
+    try:
+        client = Client(base_url)
+        status, _ = client.call("POST", "/user/login", {"username": "admin", "password": "admin"})
+        assert status == 200, f"login failed with {status}"
+
+        added = set()
+        lock = threading.Lock()
+        receipts = {}
+        counts = {"add": 0, "receipt": 0, "list": 0, "errors": 0}
+        list_statuses = {}
+
+        def add(numero_parte):
+            status, _ = client.call("POST", "/inventory/add_item", {
+                "numero_parte": numero_parte, "cantidad": 0, "descripcion": f"Load test part {numero_parte}"
+            })
+            with lock:
+                if status == 201:
+                    added.add(numero_parte)
+                    counts["add"] += 1
+                else:
+                    counts["errors"] += 1
+
+        with ThreadPoolExecutor(threads) as pool:
+            start = time.perf_counter()
+            list(pool.map(add, [str(FIRST_PART + i) for i in range(PARTS)]))
+            add_seconds = time.perf_counter() - start
+
+        deadline = time.perf_counter() + seconds
+
+        def worker_loop():
+            while time.perf_counter() < deadline:
+                if random.random() < 0.8:
+                    numero_parte = random.choice(sorted(added))
+                    status, _ = client.call("POST", "/inventory/movements", {
+                        "numero_parte": numero_parte, "tipo": "receipt", "cantidad": 1
+                    })
+                    with lock:
+                        if status == 201:
+                            receipts[numero_parte] = receipts.get(numero_parte, 0) + 1
+                            counts["receipt"] += 1
+                        else:
+                            counts["errors"] += 1
+                else:
+                    status, _ = client.call("GET", "/inventory/get_inventory?limit=100")
+                    with lock:
+                        counts["list" if status == 200 else "errors"] += 1
+                        list_statuses[status] = list_statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            for _ in range(threads):
+                pool.submit(worker_loop)
+        mixed_seconds = time.perf_counter() - start
+
+        # Consistency: every acknowledged write is visible exactly once
+        listed = []
+        cursor = ""
+        listing_status = 200
+        while True:
+            listing_status, page = client.call("GET", f"/inventory/get_inventory?limit=1000&cursor={cursor}")
+            if listing_status != 200:
+                break
+            listed.extend(item["numero_parte"] for item in page["items"])
+            cursor = page.get("next_cursor")
+            if not cursor:
+                break
+        mismatches = []
+        for numero_parte in added:
+            status, stock = client.call("GET", f"/inventory/stock?numero_parte={numero_parte}")
+            if status != 200 or stock["on_hand"] != receipts.get(numero_parte, 0):
+                mismatches.append(numero_parte)
+        consistent = listing_status == 200 and sorted(listed) == sorted(added) and not mismatches
+
+        print(
+            f"workers={workers:<2} adds/s={counts['add'] / add_seconds:8.1f}  "
+            f"mixed req/s={(counts['receipt'] + counts['list']) / mixed_seconds:8.1f}  "
+            f"errors={counts['errors']:<4} consistent={consistent}"
+        )
+        print(
+            f"  list statuses: {', '.join(f'{status}={count}' for status, count in sorted(list_statuses.items()))}  "
+            f"final listing: {listing_status}"
+        )
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(data_directory, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seconds", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=32)
+    args = parser.parse_args()
+    for workers in args.workers:
+        run(workers, args.seconds, args.threads)
+
+if __name__ == "__main__":
+    main()
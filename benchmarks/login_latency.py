@@ -0,0 +1,57 @@
+"""Login latency with and without the embedding model on the lookup path.
+
+Usage: python -m benchmarks.login_latency [--iterations N]
+
+Runs against a throwaway persist directory. The "semantic" path reproduces the
+old `query(query_texts=[username])` lookup, which loads the ONNX model on first
+use; the "keyed" path is the current `get_user`, which never touches it.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from app.chromadb_utility import ChromaDBUtility
+
+def semantic_lookup(chroma_db, username):
+    """The previous nearest-neighbour user lookup."""
+    users_collection = chroma_db.get_or_create_collection("users")
+    results = users_collection.query(query_texts=[username], n_results=1, include=["metadatas"])
+    return results["metadatas"][0][0]
+
+def keyed_lookup(chroma_db, username):
+    """The current exact-key user lookup."""
+    return chroma_db.get_user(username)
+
+def measure(label, func, iterations):
+    """Time one cold call and `iterations` warm calls of `func`."""
+    start = time.perf_counter()
+    func()
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<28} cold={cold_ms:8.2f} ms  mean={statistics.mean(samples):7.3f} ms  p95={p95:7.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        seed_db = ChromaDBUtility(persist_directory=persist_directory)
+        for i in range(50):
+            seed_db.add_user(f"operator{i:02d}", "password123", role="inventory")
+
+        # A fresh utility whose embedding function has not loaded the model yet
+        chroma_db = ChromaDBUtility(persist_directory=persist_directory)
+        measure("get_user (keyed)", lambda: keyed_lookup(chroma_db, "operator07"), args.iterations)
+        measure("authenticate_user (keyed)", lambda: chroma_db.authenticate_user("operator07", "password123"), 10)
+        measure("query (semantic, loads model)", lambda: semantic_lookup(chroma_db, "operator07"), args.iterations)
+
+if __name__ == "__main__":
+    main()
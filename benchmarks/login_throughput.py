@@ -0,0 +1,80 @@
+"""Login throughput: inline bcrypt vs. the bounded PasswordHasher pool.
+
+Usage: python -m benchmarks.login_throughput [--logins 200] [--rounds 12] [--workers 2]
+
+Simulates a shift-start login storm: `--logins` concurrent clients verify a
+password while a probe thread measures how long a small unrelated request
+(a short pure-Python task) takes in the meantime.
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from app.password_hasher import PasswordHasher, PasswordHasherBusy
+
+def probe_task():
+    """Stand-in for a cheap request handler."""
+    return sum(i * i for i in range(20000))
+
+def storm(label, verify, logins):
+    """Run `logins` concurrent verifications while probing the latency of other work."""
+    probe_latencies = []
+    done = threading.Event()
+
+    def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            probe_task()
+            probe_latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+
+    probe_thread = threading.Thread(target=probe)
+    baseline_start = time.perf_counter()
+    probe_task()
+    baseline_ms = (time.perf_counter() - baseline_start) * 1000
+
+    shed = 0
+    start = time.perf_counter()
+    probe_thread.start()
+    with ThreadPoolExecutor(max_workers=logins) as pool:
+        for result in pool.map(lambda _: verify(), range(logins)):
+            shed += result is None
+    elapsed = time.perf_counter() - start
+    done.set()
+    probe_thread.join()
+
+    probe_latencies.sort()
+    print(
+        f"{label:<8} logins/s={(logins - shed) / elapsed:7.1f}  shed={shed:<4} "
+        f"probe baseline={baseline_ms:6.2f} ms  mean={statistics.mean(probe_latencies):7.2f} ms  "
+        f"p95={probe_latencies[int(len(probe_latencies) * 0.95) - 1]:7.2f} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    password = "shift-start-password"
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=args.rounds)).decode("utf-8")
+
+    def inline():
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+    hasher = PasswordHasher(rounds=args.rounds, max_workers=args.workers, max_pending=args.logins, queue_timeout=60)
+
+    def pooled():
+        try:
+            return hasher.verify(password, hashed)
+        except PasswordHasherBusy:
+            return None
+
+    storm("inline", inline, args.logins)
+    storm("pooled", pooled, args.logins)
+
+if __name__ == "__main__":
+    main()
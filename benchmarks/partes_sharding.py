@@ -0,0 +1,77 @@
+"""Search latency of one `partes` collection filtered by client vs. per-client shards.
+
+Usage: python -m benchmarks.partes_sharding [--clients 10 100 1000] [--parts 20000] [--fan-out 5] [--queries 200]
+
+Random unit vectors stand in for embeddings, so no model is loaded.
+"single" queries the whole collection with a `cliente` filter (`$in` for
+several clients); "sharded" queries the client shards, several of them in
+parallel and merged.
+"""
+import argparse
+import math
+import random
+import statistics
+import tempfile
+import time
+from app.chromadb_utility import ChromaDBUtility
+
+DIMENSIONS = 384
+
+def unit_vector():
+    vector = [random.gauss(0, 1) for _ in range(DIMENSIONS)]
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector]
+
+def measure(label, search, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    print(f"  {label:<22} mean={statistics.mean(samples):8.2f} ms  p95={samples[int(len(samples) * 0.95) - 1]:8.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--parts", type=int, default=20000)
+    parser.add_argument("--fan-out", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    queries = [unit_vector() for _ in range(args.queries)]
+    for clients in args.clients:
+        with tempfile.TemporaryDirectory() as persist_directory:
+            chroma_db = ChromaDBUtility(persist_directory=persist_directory, embedding_provider="none", shard_partes=True)
+            partes = chroma_db.get_or_create_collection("partes")
+            for start in range(0, args.parts, 1000):
+                ids = [f"item_{number}" for number in range(start, min(start + 1000, args.parts))]
+                metadatas = [{"numero_parte": item_id[5:], "cliente": f"client-{random.randrange(clients)}"} for item_id in ids]
+                embeddings = [unit_vector() for _ in ids]
+                documents = [metadata["numero_parte"] for metadata in metadatas]
+                partes.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+                chroma_db.part_shards.write(ids, documents, metadatas, embeddings)
+
+            one = lambda: [f"client-{random.randrange(clients)}"]
+            several = lambda: [f"client-{random.randrange(clients)}" for _ in range(args.fan_out)]
+
+            def single(clientes):
+                return lambda query: partes.query(
+                    query_embeddings=[query],
+                    n_results=args.k,
+                    where=chroma_db.build_where({"cliente": clientes()}),
+                    include=["distances"]
+                )
+
+            def sharded(clientes):
+                return lambda query: chroma_db.part_shards.query(query, clientes(), n_results=args.k)
+
+            print(f"{clients} clients, {args.parts} parts:")
+            measure("single, 1 client", single(one), queries)
+            measure("sharded, 1 client", sharded(one), queries)
+            measure(f"single, {args.fan_out} clients", single(several), queries)
+            measure(f"sharded, {args.fan_out} clients", sharded(several), queries)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Gunicorn settings for running InVectory with several workers.
+
+Start the data owners first, then the web workers:
+
+    chroma run --path ./data/chroma --port 8000
+    python -m app.embedding_service --port 8100
+    CHROMA_HOST=127.0.0.1 EMBEDDING_PROVIDER=remote EMBEDDING_SERVICE_URL=http://127.0.0.1:8100 \\
+        gunicorn -c gunicorn.conf.py run:app
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+# Each worker opens its own Chroma client and SQLite connections after the fork
+preload_app = False
+
+def on_starting(server):
+    """Refuse to start several workers that would each write the same Chroma directory."""
+    if server.cfg.workers > 1 and not os.getenv("CHROMA_HOST"):
+        raise RuntimeError(
+            "Running more than one worker requires CHROMA_HOST, so a single Chroma server owns the data."
+        )
+
+def pre_fork(server, worker):
+    """Give each worker the lowest free log slot, so a restarted worker reuses its predecessor's file."""
+    used = {getattr(existing, "log_slot", None) for existing in server.WORKERS.values()}
+    worker.log_slot = next(slot for slot in range(len(used) + 1) if slot not in used)
+
+def post_fork(server, worker):
+    """Point the worker's rotating log at its own file (app.log -> app.<slot>.log); rotation is not safe across processes."""
+    root, extension = os.path.splitext(os.getenv("LOG_FILE", "app.log"))
+    os.environ["LOG_FILE"] = f"{root}.{worker.log_slot}{extension}"